@@ -8,6 +8,7 @@ from PyQt5.QtCore import Qt
 import numpy as np
 from client.video.video_camera import VideoCamera
 from client.video.basic_udp_video_client import BasicUdpVideoClient
+from client.video.video_encoder import VideoEncoder
 from GUI.video_grid.client_video_widget import ClientVideoWidget
 from network.custom_messages.client_info import ClientInfo
 
@@ -127,6 +128,11 @@ class VideoGrid(QtWidgets.QFrame):
         for w in widgets:
             w.setMaximumSize(empty_pixmap.size())
 
+        # receive only the simulcast layer that fits the widgets
+        self.video_client.request_layer(VideoEncoder.get_layer_for_width(
+            empty_pixmap.width(), VideoCamera.DEFAULT_VIDEO_WIDTH,
+            self.video_client.NUM_LAYERS))
+
     def resizeEvent(self, event: QtGui.QResizeEvent):
         """
         This function is called when the grid is resized.
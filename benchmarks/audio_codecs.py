@@ -0,0 +1,108 @@
+"""
+    Hadar Shahar
+    Measures the audio codecs (see audio_codecs): the bitrate, the encode
+    and decode time of each chunk, and the quality (the SNR of the decoded
+    audio, and the SNR in the speech band, below 9.9 kHz).
+
+    The audio is a synthetic voice (harmonics of a changing pitch with
+    syllables and some noise), or a 16 bit mono wav file at 44100 Hz.
+
+    Run: python -m benchmarks.audio_codecs [--wav speech.wav]
+"""
+import argparse
+import time
+import wave
+import numpy as np
+from network.audio.audio_codecs import CODECS
+
+# like AudioStream (which needs pyaudio)
+CHUNK = 1024
+RATE = 44100
+
+# the speech band that the downsampled codecs keep (in Hz)
+SPEECH_BAND = 9900
+
+
+def create_voice(duration: float, seed: int) -> np.ndarray:
+    """ Returns a synthetic voice (int16). """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * RATE)) / RATE
+    # the pitch glides between 100 and 220 Hz
+    pitch = 160 + 60 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 30))
+    # syllables, 4 per second
+    voice *= np.clip(np.sin(2 * np.pi * 2 * t), 0, None) ** 2
+    voice += rng.normal(0, 0.05, len(t))
+    return (voice / np.abs(voice).max() * 20000).astype(np.int16)
+
+
+def read_wav(path: str) -> np.ndarray:
+    """ Returns the samples of a 16 bit mono wav file. """
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2 or wf.getnchannels() != 1 or \
+                wf.getframerate() != RATE:
+            raise ValueError('the wav must be 16 bit mono at 44100 Hz')
+        return np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+
+
+def get_snr(reference: np.ndarray, decoded: np.ndarray) -> float:
+    """ Returns the SNR in dB, after aligning the codec's delay. """
+    reference = reference.astype(np.float64)
+    decoded = decoded.astype(np.float64)
+    delays = range(0, 64)
+    errors = [np.sum((reference[:len(reference) - d] - decoded[d:]) ** 2)
+              for d in delays]
+    delay = int(np.argmin(errors))
+    noise = errors[delay]
+    signal = np.sum(reference[:len(reference) - delay] ** 2)
+    return 10 * np.log10(signal / max(noise, 1e-9))
+
+
+def low_pass(samples: np.ndarray, cutoff: float) -> np.ndarray:
+    """ Removes the frequencies above a given cutoff (in Hz). """
+    spectrum = np.fft.rfft(samples)
+    spectrum[np.fft.rfftfreq(len(samples), 1 / RATE) > cutoff] = 0
+    return np.fft.irfft(spectrum, len(samples))
+
+
+def main():
+    """ Measures each codec and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--wav', help='a 16 bit mono wav file at 44100 Hz')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='the duration of the synthetic voice')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    samples = read_wav(args.wav) if args.wav else \
+        create_voice(args.duration, args.seed)
+    samples = samples[:len(samples) // CHUNK * CHUNK]
+    chunks = [samples[i: i + CHUNK].tobytes()
+              for i in range(0, len(samples), CHUNK)]
+    duration = len(samples) / RATE
+    print(f'{len(chunks)} chunks of {CHUNK} samples ({duration:.1f}s)')
+
+    for codec_id, codec in CODECS.items():
+        encoder, decoder = codec(), codec()
+        start = time.perf_counter()
+        encoded = [encoder.encode(chunk) for chunk in chunks]
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = [decoder.decode(data) for data in encoded]
+        decode_time = time.perf_counter() - start
+
+        decoded = np.frombuffer(b''.join(decoded), dtype=np.int16)
+        bitrate = sum(map(len, encoded)) * 8 / duration
+        band_snr = get_snr(low_pass(samples, SPEECH_BAND),
+                           low_pass(decoded, SPEECH_BAND))
+        print(f'{codec.__name__} (id {codec_id}): '
+              f'{bitrate / 1000:.0f} kbit/s, '
+              f'encode={encode_time / len(chunks) * 1e6:.0f}us, '
+              f'decode={decode_time / len(chunks) * 1e6:.0f}us, '
+              f'snr={get_snr(samples, decoded):.1f}dB, '
+              f'speech band snr={band_snr:.1f}dB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+    Hadar Shahar
+    Simulates losing audio packets and compares filling the lost
+    packets with silence (like before the LossConcealer) to concealing
+    them (the way the JitterBuffer does for the missing sequence
+    numbers):
+    - the SNR of the whole stream and of the lost packets alone.
+    - the clicks: the edges of the lost packets where the audio jumps
+      more than it does anywhere near them in the original audio.
+    - the time it takes to process a received chunk and to conceal
+      a lost one.
+    The losses are random, or in bursts (a Gilbert-Elliott model).
+    The audio is a synthetic voice, or a 16 bit mono wav file at
+    44100 Hz, and the results can be written to wav files to listen to.
+
+    Run: python -m benchmarks.audio_concealment [--wav speech.wav]
+                                                [--out results_dir]
+"""
+import argparse
+import os
+import time
+import wave
+import numpy as np
+from benchmarks.audio_codecs import create_voice, read_wav, get_snr
+from network.audio.audio_codecs import CODECS
+from network.audio.loss_concealer import LossConcealer
+from network.audio.mulaw_codec import MuLawCodec
+from network.audio.pcm_codec import PcmCodec
+
+# like AudioStream (which needs pyaudio)
+CHUNK = 1024
+RATE = 44100
+
+# the mean length of a burst of losses (in packets, for the bursty model)
+BURST_LENGTH = 3
+
+# the neighborhood of an edge that's compared to the original audio
+CLICK_WINDOW = 64
+
+
+class SilenceConcealer(object):
+    """
+    Definition of the class SilenceConcealer.
+    Fills the lost packets with silence (like a LossConcealer).
+    """
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """ Returns the samples as they are. """
+        return samples
+
+    def conceal(self, count: int) -> np.ndarray:
+        """ Returns silence. """
+        return np.zeros(count, dtype=np.int16)
+
+
+def create_losses(num_packets: int, loss: float, pattern: str,
+                  seed: int) -> np.ndarray:
+    """ Returns whether each packet is lost. """
+    rng = np.random.default_rng(seed)
+    if pattern == 'random':
+        lost = rng.random(num_packets) < loss
+    else:
+        # stays in the bad state (losing) for BURST_LENGTH packets on
+        # average, and enters it often enough for the given loss rate
+        leave_bad = 1 / BURST_LENGTH
+        enter_bad = loss * leave_bad / (1 - loss)
+        lost = np.zeros(num_packets, dtype=bool)
+        is_bad = False
+        for i, r in enumerate(rng.random(num_packets)):
+            is_bad = r >= leave_bad if is_bad else r < enter_bad
+            lost[i] = is_bad
+    # the stream must start with a received packet, to be aligned
+    lost[0] = False
+    return lost
+
+
+def play(encoded: list, lost: np.ndarray, concealer, codec_id: int) \
+        -> (np.ndarray, float, float):
+    """
+    Decodes the received packets and conceals the lost ones with a given
+    concealer. Returns the played samples, and the time it took to
+    process each received packet and to conceal each lost one.
+    """
+    decoder = CODECS[codec_id]()
+    played = []
+    process_time = conceal_time = 0
+    for i, data in enumerate(encoded):
+        if lost[i]:
+            start = time.perf_counter()
+            played.append(concealer.conceal(CHUNK))
+            conceal_time += time.perf_counter() - start
+        else:
+            samples = np.frombuffer(decoder.decode(data), dtype=np.int16)
+            start = time.perf_counter()
+            played.append(concealer.process(samples))
+            process_time += time.perf_counter() - start
+    num_lost = max(np.count_nonzero(lost), 1)
+    return np.concatenate(played), \
+        process_time / (len(encoded) - num_lost), conceal_time / num_lost
+
+
+def count_clicks(reference: np.ndarray, played: np.ndarray,
+                 lost: np.ndarray) -> int:
+    """
+    Returns the number of edges of the lost packets where the played
+    audio jumps more than the reference does near them.
+    """
+    clicks = 0
+    edges = np.flatnonzero(np.diff(lost.astype(int))) + 1
+    for edge in edges * CHUNK:
+        if CLICK_WINDOW <= edge < len(played) - CLICK_WINDOW:
+            near = np.abs(np.diff(reference[edge - CLICK_WINDOW:
+                                            edge + CLICK_WINDOW]))
+            clicks += abs(played[edge] - played[edge - 1]) > 2 * near.max()
+    return clicks
+
+
+def write_wav(path: str, samples: np.ndarray):
+    """ Writes 16 bit mono samples to a wav file. """
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(samples.astype(np.int16).tobytes())
+
+
+def main():
+    """ Runs both ways with each loss and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--wav', help='a 16 bit mono wav file at 44100 Hz')
+    parser.add_argument('--out', help='a directory for the played audio')
+    parser.add_argument('--codec', type=int, default=PcmCodec.CODEC_ID,
+                        choices=list(CODECS),
+                        help=f'the codec id ({MuLawCodec.CODEC_ID}: mu-law)')
+    parser.add_argument('--loss', type=float, nargs='+',
+                        default=[0.02, 0.05, 0.1])
+    parser.add_argument('--pattern', choices=('random', 'bursty'),
+                        nargs='+', default=['random', 'bursty'])
+    parser.add_argument('--duration', type=float, default=20,
+                        help='the duration of the synthetic voice')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    samples = read_wav(args.wav) if args.wav else \
+        create_voice(args.duration, args.seed)
+    samples = samples[:len(samples) // CHUNK * CHUNK]
+    encoder = CODECS[args.codec]()
+    encoded = [encoder.encode(samples[i: i + CHUNK].tobytes())
+               for i in range(0, len(samples), CHUNK)]
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        write_wav(os.path.join(args.out, 'original.wav'), samples)
+
+    for pattern in args.pattern:
+        for loss in args.loss:
+            lost = create_losses(len(encoded), loss, pattern, args.seed)
+            lost_samples = np.repeat(lost, CHUNK)
+            print(f'{pattern} {lost.mean():.1%} loss:')
+            for name, concealer in (('silence', SilenceConcealer()),
+                                    ('concealed', LossConcealer())):
+                played, process_time, conceal_time = play(
+                    encoded, lost, concealer, args.codec)
+                reference = samples[:len(played)].astype(np.float64)
+                mask = lost_samples[:len(played)]
+                lost_error = np.sum((reference - played)[mask] ** 2)
+                lost_snr = 10 * np.log10(
+                    np.sum(reference[mask] ** 2) / max(lost_error, 1e-9))
+                print(f'  {name}: snr={get_snr(reference, played):.1f}dB, '
+                      f'lost snr={lost_snr:.1f}dB, '
+                      f'clicks={count_clicks(reference, played, lost)}'
+                      f'/{np.count_nonzero(np.diff(lost.astype(int)))}, '
+                      f'process={process_time * 1e6:.0f}us, '
+                      f'conceal={conceal_time * 1e6:.0f}us')
+                if args.out:
+                    write_wav(os.path.join(
+                        args.out, f'{pattern}_{loss:g}_{name}.wav'), played)
+
+
+if __name__ == '__main__':
+    main()
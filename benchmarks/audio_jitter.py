@@ -0,0 +1,177 @@
+"""
+    Hadar Shahar
+    Simulates receiving the audio of a speaker over a network with
+    jitter (random delays, so the packets are also reordered), loss and
+    duplicates, and compares the ways to play it:
+    - naive: writing each chunk as it arrives (like AudioClient did
+      before the JitterBuffer), so the late chunks leave gaps, the delay
+      grows, and the reordered chunks are played out of order.
+    - fixed: a JitterBuffer with a fixed delay.
+    - adaptive: a JitterBuffer (the delay adapts to the jitter).
+    The speaker talks in spurts, and doesn't send its silent chunks.
+    The time is simulated, so it runs much faster than real time.
+
+    Run: python -m benchmarks.audio_jitter [--jitter 0.005 0.02 0.05]
+"""
+import argparse
+import heapq
+import time
+import numpy as np
+from benchmarks.audio_codecs import create_voice
+from network.audio.audio_packet import AudioPacket
+from network.audio.jitter_buffer import JitterBuffer
+from network.audio.mulaw_codec import MuLawCodec
+
+# like AudioStream (which needs pyaudio)
+CHUNK = 1024
+RATE = 44100
+CHUNK_DURATION = CHUNK / RATE
+
+# the talk spurts and the silences between them (in seconds)
+SPURT = 2
+SILENCE = 0.7
+
+# the network delay without the jitter (in seconds)
+BASE_DELAY = 0.02
+
+
+class FixedJitterBuffer(JitterBuffer):
+    """
+    Definition of the class FixedJitterBuffer.
+    A JitterBuffer whose delay doesn't adapt.
+    """
+
+    def __init__(self, delay: float):
+        """ Constructor. """
+        super(FixedJitterBuffer, self).__init__()
+        self.delay = delay
+
+    def get_target_delay(self) -> float:
+        """ Returns the fixed delay. """
+        return self.delay
+
+
+def create_arrivals(args, jitter: float) -> (list, int):
+    """
+    Returns the (arrival time, packet) of the sent packets,
+    and the number of talk spurts.
+    """
+    rng = np.random.default_rng(args.seed)
+    samples = create_voice(args.duration, args.seed)
+    encoder = MuLawCodec()
+    arrivals = []
+    sequence = 0
+    spurts = 0
+    for i in range(len(samples) // CHUNK):
+        send_time = i * CHUNK_DURATION
+        # the silent chunks aren't sent
+        if send_time % (SPURT + SILENCE) >= SPURT:
+            continue
+        if send_time % (SPURT + SILENCE) < CHUNK_DURATION:
+            spurts += 1
+        packet = AudioPacket(sequence, i * CHUNK, encoder.encode(
+            samples[i * CHUNK: (i + 1) * CHUNK].tobytes()))
+        sequence += 1
+        if rng.random() < args.loss:
+            continue
+        copies = 2 if rng.random() < args.duplicates else 1
+        for _ in range(copies):
+            # exponential delays, like the queues in the routers
+            delay = BASE_DELAY + rng.exponential(jitter)
+            arrivals.append((send_time + delay, packet))
+    arrivals.sort(key=lambda arrival: arrival[0])
+    return arrivals, spurts
+
+
+def play_naive(arrivals: list, args) -> dict:
+    """ Plays each chunk when it arrives, if the output is free. """
+    # the time that the output finishes playing the written chunks
+    output_end = 0
+    gaps = 0
+    out_of_order = 0
+    delays = []
+    last_sequence = -1
+    for arrival_time, packet in arrivals:
+        if arrival_time > output_end:
+            if arrival_time - output_end < SILENCE:
+                gaps += 1  # the output ran out in the middle of a spurt
+            output_end = arrival_time
+        if packet.sequence < last_sequence:
+            out_of_order += 1
+        last_sequence = packet.sequence
+        # it's played after the chunks that are already written
+        delays.append(output_end - arrival_time)
+        output_end += CHUNK_DURATION
+    return {'delay': np.mean(delays) + BASE_DELAY, 'gaps': gaps,
+            'out_of_order': out_of_order}
+
+
+def play(arrivals: list, spurts: int, jitter_buffer: JitterBuffer) -> dict:
+    """ Plays the packets from a given jitter buffer, on a fixed clock. """
+    end_time = arrivals[-1][0] + 1
+    # the playout clock (a random phase, like a sound card)
+    events = [(arrival_time, 1, i) for i, (arrival_time, _)
+              in enumerate(arrivals)]
+    events += [(0.003 + i * CHUNK_DURATION, 0, None)
+               for i in range(int(end_time / CHUNK_DURATION))]
+    heapq.heapify(events)
+    delays = []
+    read_time = 0
+    reads = 0
+    while events:
+        event_time, is_arrival, index = heapq.heappop(events)
+        if is_arrival:
+            jitter_buffer.put(arrivals[index][1], event_time)
+            continue
+        start = time.perf_counter()
+        samples = jitter_buffer.read(CHUNK, event_time)
+        read_time += time.perf_counter() - start
+        reads += 1
+        if samples is not None:
+            delays.append(jitter_buffer.stats()['delay'])
+    stats = jitter_buffer.stats()
+    return {'delay': np.mean(delays) + BASE_DELAY,
+            # the buffer runs out at the end of every spurt
+            'gaps': stats['underruns'] - spurts,
+            'out_of_order': 0,
+            'late': stats['late_packets'],
+            'concealed': stats['concealed_packets'],
+            'skipped': stats['skipped_packets'],
+            'duplicates': stats['duplicate_packets'],
+            'read us': read_time / reads * 1e6}
+
+
+def main():
+    """ Runs all the ways with each jitter and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--jitter', type=float, nargs='+',
+                        default=[0.005, 0.02, 0.05],
+                        help='the mean jitter (in seconds)')
+    parser.add_argument('--fixed-delay', type=float, default=0.06)
+    parser.add_argument('--loss', type=float, default=0.02)
+    parser.add_argument('--duplicates', type=float, default=0.01)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for jitter in args.jitter:
+        arrivals, spurts = create_arrivals(args, jitter)
+        print(f'jitter {jitter * 1000:.0f}ms, {args.loss:.0%} loss, '
+              f'{spurts} spurts:')
+        ways = (('naive', None),
+                (f'fixed {args.fixed_delay * 1000:.0f}ms',
+                 FixedJitterBuffer(args.fixed_delay)),
+                ('adaptive', JitterBuffer()))
+        for name, jitter_buffer in ways:
+            if jitter_buffer is None:
+                stats = play_naive(arrivals, args)
+            else:
+                stats = play(arrivals, spurts, jitter_buffer)
+            print(f'  {name}: ' + ', '.join(
+                f'{key}={value * 1000:.0f}ms' if key == 'delay' else
+                f'{key}={value:.1f}' if isinstance(value, float)
+                else f'{key}={value}' for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+    Hadar Shahar
+    Compares relaying the audio chunks of every speaker to every other
+    participant (BroadcastUdpServer) to mixing them on the server
+    (AudioMixingServer), in a meeting where some of the participants
+    speak at once (each one sends a different tone, in real time).
+
+    For each listener it measures the received bitrate and packets, and
+    the seconds of audio it would play every second: the relayed chunks
+    are played one after the other, so with several speakers the audio
+    falls behind, while the mixed stream plays them together. It also
+    checks that every listener hears all the other speakers (and not
+    itself): the tones of the relayed chunks that are played in turn are
+    broken into pieces, so some of them might not be heard. It also
+    measures the mixing time (the part of a cpu it takes).
+
+    Run: python -m benchmarks.audio_mixing [--clients 3 6 10]
+"""
+import argparse
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+import numpy as np
+from benchmarks.udp_relay_scaling import IP, find_free_port, pack_data
+from network.audio.audio_codec import AudioCodec
+from network.audio.audio_codecs import create_codec
+from network.audio.audio_packet import AudioPacket
+from network.audio.mulaw_codec import MuLawCodec
+from network.constants import NETWORK_BYTES_PER_NUM, UDP_NEW_CLIENT_MSG
+from server.audio_mixing_server import AudioMixingServer
+from server.broadcast_udp_server import BroadcastUdpServer
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+
+# like AudioStream (which needs pyaudio)
+CHUNK = 1024
+RATE = 44100
+
+# the tone of the first speaker (in Hz), the others are higher
+FIRST_TONE = 300
+TONE_STEP = 200
+MIN_TONE_RATIO = 0.01
+
+
+def send_speech(ids: list, num_speakers: int, server_address: (str, int),
+                end_time: float):
+    """ Sends the chunks of the speakers (a tone each) in real time. """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    encoders = [MuLawCodec() for _ in range(num_speakers)]
+    chunk_index = 0
+    start = time.monotonic()
+    while time.monotonic() < end_time:
+        t = (np.arange(CHUNK) + chunk_index * CHUNK) / RATE
+        for i, encoder in enumerate(encoders):
+            tone = FIRST_TONE + i * TONE_STEP
+            chunk = (8000 * np.sin(2 * np.pi * tone * t)).astype(np.int16)
+            packet = AudioPacket(chunk_index, chunk_index * CHUNK,
+                                 encoder.encode(chunk.tobytes()))
+            sock.sendto(pack_data(ids[i], packet.encode()), server_address)
+        chunk_index += 1
+        time.sleep(max(start + chunk_index * CHUNK / RATE -
+                       time.monotonic(), 0))
+
+
+def receive(sockets: list, stats: list, end_time: float):
+    """ Receives and decodes the audio of all the listeners. """
+    selector = selectors.DefaultSelector()
+    for i, sock in enumerate(sockets):
+        selector.register(sock, selectors.EVENT_READ, i)
+    decoders = [{} for _ in sockets]
+    while time.monotonic() < end_time:
+        for key, _ in selector.select(0.05):
+            i = key.data
+            data = key.fileobj.recv(65536)
+            n = NETWORK_BYTES_PER_NUM
+            id_len = BroadcastUdpServer.ID_LEN_STRUCT.unpack_from(data)[0]
+            sender_id = data[n: n + id_len]
+            # decoded in the order of arrival (there's no loss on loopback)
+            content = AudioPacket.decode(data, n + id_len).data
+            decoder = decoders[i].setdefault(
+                sender_id, create_codec(AudioCodec.get_codec_id(content)))
+            samples = np.frombuffer(decoder.decode(content), dtype=np.int16)
+            stats[i]['packets'] += 1
+            stats[i]['bytes'] += len(data)
+            stats[i]['samples'].append(samples)
+
+
+def get_tones(samples: np.ndarray, num_speakers: int) -> list:
+    """
+    Returns the tones (by speaker index) that are heard: the peaks that
+    are at least a MIN_TONE_RATIO of the strongest one (the gaps between
+    the chunks smear every tone a little).
+    """
+    spectrum = np.abs(np.fft.rfft(samples))
+    frequencies = np.fft.rfftfreq(len(samples), 1 / RATE)
+    peaks = np.array([
+        spectrum[np.abs(frequencies - (FIRST_TONE + i * TONE_STEP)) < 5].max()
+        for i in range(num_speakers)])
+    return [i for i in range(num_speakers)
+            if peaks[i] > peaks.max() * MIN_TONE_RATIO]
+
+
+def run(args, num_clients: int, mixing: bool) -> dict:
+    """ Runs a meeting for args.duration seconds and returns the stats. """
+    ports = (find_free_port(), find_free_port())
+    server_class = AudioMixingServer if mixing else BroadcastUdpServer
+    server = server_class(IP, *ports, f'audio{num_clients}{mixing}',
+                          lambda client_id: True)
+    server.daemon = True
+    server.start()
+
+    meeting_id = bytes(MEETING_ID_LEN)
+    ids = [meeting_id + i.to_bytes(CLIENT_ID_LEN, 'big')
+           for i in range(num_clients)]
+    sockets = []
+    for full_id in ids:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto(pack_data(full_id, UDP_NEW_CLIENT_MSG), (IP, ports[1]))
+        sockets.append(sock)
+    time.sleep(0.5)  # let the server add the clients
+
+    num_speakers = min(args.speakers, num_clients)
+    stats = [{'packets': 0, 'bytes': 0, 'samples': []} for _ in ids]
+    end_time = time.monotonic() + args.duration
+    receiver = threading.Thread(target=receive,
+                                args=(sockets, stats, end_time + 0.5))
+    receiver.start()
+    send_speech(ids, num_speakers, (IP, ports[1]), end_time)
+    receiver.join()
+
+    heard_right = 0
+    for i, listener in enumerate(stats):
+        expected = [j for j in range(num_speakers) if j != i]
+        samples = np.concatenate(listener['samples'] or [np.zeros(1)])
+        heard_right += get_tones(samples, num_speakers) == expected
+    return {
+        'kbit/s': np.mean([s['bytes'] for s in stats]) * 8 /
+        args.duration / 1000,
+        'packets/s': np.mean([s['packets'] for s in stats]) / args.duration,
+        'played s/s': np.mean([sum(map(len, s['samples'])) for s in stats])
+        / RATE / args.duration,
+        'heard right': f'{heard_right}/{num_clients}',
+        'mix cpu': server.mix_seconds_counter.value / args.duration
+        if mixing else 0}
+
+
+def main():
+    """ Runs both servers and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, nargs='+', default=[3, 6, 10])
+    parser.add_argument('--speakers', type=int, default=2,
+                        help='the clients that speak at once')
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f'{args.speakers} speakers, {args.duration:.0f}s')
+    stdout = sys.stdout
+    for num_clients in args.clients:
+        for mixing in (False, True):
+            # the server prints on every join
+            sys.stdout = open(os.devnull, 'w')
+            stats = run(args, num_clients, mixing)
+            sys.stdout = stdout
+            print(f'{num_clients} clients, '
+                  f'{"mixing" if mixing else "relay"}: ' + ', '.join(
+                      f'{key}={value:.2f}' if isinstance(value, float)
+                      else f'{key}={value}' for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+    Hadar Shahar
+    Compares decoding the received frames on the thread that reads the
+    socket (like the clients did before the DecodePool) to decoding them
+    in a DecodePool, while other processes load the CPU.
+
+    Several senders send large frames to a single receiver socket.
+    The frames are JPEG (like the screen share), or zlib where cv2 isn't
+    available (zlib releases the GIL too). The packet loss is the packets
+    that the receiver socket dropped.
+
+    Run: python -m benchmarks.decode_pool [--codec zlib]
+"""
+import argparse
+import multiprocessing
+import socket
+import threading
+import time
+import zlib
+import numpy as np
+from benchmarks.udp_relay_scaling import IP, pack_data
+from client.video.decode_pool import DecodePool
+from client.video.packet_pacer import PacketPacer
+from client.video.udp_packet import UdpPacket
+from client.video.udp_packets_handler import UdpPacketsHandler
+from network.constants import NETWORK_BYTES_PER_NUM
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+
+
+def burn_cpu(end_time: float):
+    """ Keeps a cpu busy until a given time (of time.time). """
+    while time.time() < end_time:
+        pass
+
+
+def create_codec(args) -> (bytes, callable):
+    """ Returns an encoded synthetic screen and the decoding function. """
+    x = np.linspace(0, 255, args.width, dtype=np.float32)
+    y = np.linspace(0, 255, args.height, dtype=np.float32)[:, np.newaxis]
+    rng = np.random.default_rng(1)
+    screen = np.clip((x + y) / 2 + rng.normal(0, 2, (args.height, args.width)),
+                     0, 255).astype(np.uint8)[..., np.newaxis]
+    screen = np.repeat(screen, 3, axis=2)
+    if args.codec == 'jpeg':
+        from client.video.video_encoder import VideoEncoder
+        return VideoEncoder.encode_frame(screen), \
+            VideoEncoder.decode_frame_buffer
+    return zlib.compress(screen, 1), zlib.decompress
+
+
+def send_frames(ids: list, data: bytes, address: (str, int), args):
+    """ Sends the frames of all the senders, paced over each interval. """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    interval = 1 / args.fps
+    end_time = time.monotonic() + args.duration
+    frame_index = 0
+    sent = 0
+    while time.monotonic() < end_time:
+        start = time.monotonic()
+        packets = [pack_data(full_id, p.encode()) for full_id in ids
+                   for p in UdpPacketsHandler.create_packets(frame_index,
+                                                             data)]
+        PacketPacer.send(packets, lambda packet: sock.sendto(packet, address),
+                         interval * 0.8)
+        sent += len(packets)
+        frame_index += 1
+        time.sleep(max(start + interval - time.monotonic(), 0))
+    # the receiver stops when it receives an empty packet
+    sock.sendto(b'', address)
+    return sent
+
+
+def run(args, use_pool: bool) -> dict:
+    """ Runs the senders and the receiver, and returns the stats. """
+    data, decode = create_codec(args)
+    in_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    in_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, args.rcvbuf)
+    in_socket.bind((IP, 0))
+    ids = [bytes(MEETING_ID_LEN) + i.to_bytes(CLIENT_ID_LEN, 'big')
+           for i in range(args.senders)]
+
+    stats = {'received': 0, 'shown': 0}
+
+    def on_frame(frame, sender_id: bytes):
+        stats['shown'] += 1
+
+    pool = DecodePool(lambda sender_id, buffer: decode(buffer),
+                      lambda buffer: True, on_frame)
+    if use_pool:
+        pool.start()
+
+    burners = [multiprocessing.Process(target=burn_cpu, args=(
+        time.time() + args.duration + 1,)) for _ in range(args.burners)]
+    for burner in burners:
+        burner.start()
+    result = {}
+    sender = threading.Thread(target=lambda: result.update(
+        sent=send_frames(ids, data, in_socket.getsockname(), args)))
+    sender.start()
+
+    handlers = {}
+    offset = NETWORK_BYTES_PER_NUM + len(ids[0])
+    while True:
+        packet = in_socket.recv(65536)
+        if not packet:
+            break
+        stats['received'] += 1
+        sender_id = packet[NETWORK_BYTES_PER_NUM: offset]
+        p = UdpPacket.decode(packet, offset)
+        handler = handlers.setdefault(sender_id, UdpPacketsHandler())
+        for buffer in handler.process_packet(p):
+            if use_pool:
+                pool.put(sender_id, buffer)
+            else:
+                on_frame(decode(buffer), sender_id)
+    sender.join()
+    pool.stop()
+    for burner in burners:
+        burner.join()
+    stats['loss'] = 1 - stats['received'] / result['sent']
+    stats['shown_fps'] = stats['shown'] / args.duration / args.senders
+    if use_pool:
+        stats['skipped'] = pool.stats()['skipped_frames']
+    return stats
+
+
+def main():
+    """ Runs both and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--codec', choices=('jpeg', 'zlib'), default='jpeg')
+    parser.add_argument('--senders', type=int, default=3)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--fps', type=float, default=10)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--burners', type=int, default=1,
+                        help='the number of processes that load the cpu')
+    parser.add_argument('--rcvbuf', type=int, default=256 * 1024,
+                        help='the receive buffer size of the socket')
+    args = parser.parse_args()
+
+    print(f'{args.senders} senders of {args.width}x{args.height} at '
+          f'{args.fps:.0f} fps, {args.codec}, {args.burners} cpu burners')
+    for name, use_pool in (('inline', False), ('pool', True)):
+        stats = run(args, use_pool)
+        print(f'{name}: ' + ', '.join(
+            f'{key}={value:.3f}' if isinstance(value, float)
+            else f'{key}={value}' for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+    Hadar Shahar
+    Measures the ratio of video frames that are delivered over a lossy
+    channel, with a different parity group size of the forward error
+    correction (0 = no parity packets), and the overhead of the parity.
+    The packets are lost at random (independently, or in bursts),
+    some of them can be delayed by a few frames (reordered),
+    and the frames are reassembled by UdpPacketsHandler.
+    The frames are processed faster than real time, so the handler
+    drops frames only when it has too many frames in flight
+    (and not by their deadlines).
+
+    Run: python -m benchmarks.fec_loss_sweep
+"""
+import argparse
+import os
+import random
+import time
+from client.video.udp_packet import UdpPacket
+from client.video.udp_packets_handler import UdpPacketsHandler
+
+
+def lose_packets(packets: list, loss: float, burst: float,
+                 rng: random.Random) -> list:
+    """
+    Returns the packets that weren't lost.
+    After a lost packet, the next one is lost with the burst probability
+    (if it's more than the loss probability).
+    """
+    received = []
+    lost = False
+    for packet in packets:
+        lost = rng.random() < (max(loss, burst) if lost else loss)
+        if not lost:
+            received.append(packet)
+    return received
+
+
+def reorder_packets(packets: list, delayed: list, frame_index: int,
+                    args, rng: random.Random) -> list:
+    """
+    Delays some of the packets of a frame by args.reorder_depth frames.
+    The delayed packets (of the previous frames) are in the delayed list
+    of (frame index to arrive at, packet), they arrive in the middle
+    of the packets of that frame.
+    Returns the packets that arrive now, in their order.
+    """
+    arrived = []
+    for packet in packets:
+        if rng.random() < args.reorder:
+            delayed.append((frame_index + args.reorder_depth, packet))
+        else:
+            arrived.append(packet)
+    for release_index, packet in list(delayed):
+        if release_index <= frame_index:
+            delayed.remove((release_index, packet))
+            arrived.insert(rng.randrange(len(arrived) + 1), packet)
+    return arrived
+
+
+def run_sweep(loss: float, group_size: int, frames: list, args) -> dict:
+    """
+    Sends the frames over the lossy channel with a given group size.
+    :returns: the delivered frames ratio, the parity overhead,
+              the encoding and decoding time per frame
+              and the handler's stats.
+    """
+    rng = random.Random(args.seed)
+    handler = UdpPacketsHandler()
+    delayed = []
+    frames_set = set(frames)
+    delivered = data_bytes = parity_bytes = 0
+    encode_time = decode_time = 0
+    for frame_index, frame in enumerate(frames):
+        start = time.perf_counter()
+        udp_packets = UdpPacketsHandler.create_packets(
+            frame_index, frame, fec_group_size=group_size)
+        packets = [p.encode() for p in udp_packets]
+        encode_time += time.perf_counter() - start
+
+        for udp_packet, packet in zip(udp_packets, packets):
+            if udp_packet.packet_index >= udp_packet.num_packets:
+                parity_bytes += len(packet)
+            else:
+                data_bytes += len(packet)
+
+        start = time.perf_counter()
+        received = lose_packets(packets, loss, args.burst, rng)
+        for p in reorder_packets(received, delayed, frame_index, args, rng):
+            for buffer in handler.process_packet(UdpPacket.decode(p)):
+                delivered += buffer in frames_set
+        decode_time += time.perf_counter() - start
+
+    return {'delivered': delivered / len(frames),
+            'overhead': parity_bytes / data_bytes,
+            'encode_us': encode_time / len(frames) * 1e6,
+            'decode_us': decode_time / len(frames) * 1e6,
+            **handler.stats()}
+
+
+def main():
+    """ Runs the benchmark with each loss rate and group size. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--loss', type=float, nargs='+',
+                        default=[0, 0.01, 0.02, 0.05, 0.1, 0.2],
+                        help='packet loss probabilities')
+    parser.add_argument('--group-sizes', type=int, nargs='+',
+                        default=[0, 20, 10, 5, 3])
+    parser.add_argument('--burst', type=float, default=0,
+                        help='the loss probability after a lost packet')
+    parser.add_argument('--reorder', type=float, default=0,
+                        help='the probability to delay a packet')
+    parser.add_argument('--reorder-depth', type=int, default=1,
+                        help='the number of frames a packet is delayed by')
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--frame-size', type=int, default=40000,
+                        help='the size of each (random) frame in bytes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    frames = [os.urandom(args.frame_size) for _ in range(args.frames)]
+    for loss in args.loss:
+        for group_size in args.group_sizes:
+            result = run_sweep(loss, group_size, frames, args)
+            print(f'loss={loss:.2f}, group={group_size}, '
+                  f'delivered={result["delivered"]:.3f}, '
+                  f'overhead={result["overhead"]:.3f}, '
+                  f'restored={result["restored_packets"]}, '
+                  f'late={result["late_packets"]}, '
+                  f'reorder_depth={result["max_reorder_depth"]}, '
+                  f'encode={result["encode_us"]:.0f}us, '
+                  f'decode={result["decode_us"]:.0f}us')
+
+
+if __name__ == '__main__':
+    main()
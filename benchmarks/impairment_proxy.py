@@ -0,0 +1,205 @@
+"""
+    Hadar Shahar
+    A udp proxy that impairs the traffic between the clients and a udp
+    channel of the server: it drops, delays, jitters and limits the
+    bandwidth of the packets, separately in each direction.
+
+    The clients send to the proxy instead of the server, and the proxy
+    sends their packets to the server from a separate socket for each
+    client address (so the server sees each client socket as a different
+    client, like it does without the proxy).
+
+    Run: python -m benchmarks.impairment_proxy --ports 5010 5011
+             --server-ports 4010 4011 --down-loss 0.05
+"""
+import argparse
+import heapq
+import random
+import selectors
+import socket
+import threading
+import time
+from typing import Dict, Tuple
+
+
+class Link(object):
+    """
+    Definition of the class Link.
+    The impairments of one direction of the proxy. The packets are sent
+    one after the other at the bandwidth (bits per second, 0 for
+    unlimited), and dropped when they'd wait in the queue more than
+    max_queue_delay (like a router's tail drop).
+    """
+
+    MAX_QUEUE_DELAY = 0.2  # in seconds
+
+    def __init__(self, loss: float = 0, delay: float = 0, jitter: float = 0,
+                 bandwidth: float = 0, seed: int = None,
+                 max_queue_delay: float = MAX_QUEUE_DELAY):
+        """ Constructor. """
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.max_queue_delay = max_queue_delay
+        self.rng = random.Random(seed)
+        # the time the link finishes sending the queued packets
+        self.busy_until = 0
+        self.sent_packets = self.dropped_packets = 0
+
+    def schedule(self, now: float, size: int) -> float:
+        """
+        Returns the time a packet of a given size arrives,
+        or None if it's dropped.
+        """
+        if self.rng.random() < self.loss:
+            self.dropped_packets += 1
+            return None
+        departure = now
+        if self.bandwidth:
+            start = max(now, self.busy_until)
+            if start - now > self.max_queue_delay:
+                self.dropped_packets += 1
+                return None
+            departure = self.busy_until = start + size * 8 / self.bandwidth
+        self.sent_packets += 1
+        return departure + self.delay + self.rng.uniform(0, self.jitter)
+
+
+class ImpairmentProxy(threading.Thread):
+    """ Definition of the class ImpairmentProxy. """
+
+    # the maximum time to wait for packets (in seconds),
+    # so the queued packets are sent on time
+    MAX_WAIT = 0.05
+
+    def __init__(self, ip: str, client_in_port: int, client_out_port: int,
+                 server_address: Tuple[str, int, int], uplink: Link,
+                 downlink: Link):
+        """
+        Binds the proxy ports (which replace the server ports of the
+        channel for the clients).
+        server_address is (server ip, client in port, client out port).
+        """
+        super(ImpairmentProxy, self).__init__(daemon=True)
+        self.server_in_address = (server_address[0], server_address[2])
+        self.uplink = uplink
+        self.downlink = downlink
+
+        # the clients send to this socket
+        self.out_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.out_socket.bind((ip, client_out_port))
+        # the clients receive from this socket
+        self.in_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.in_socket.bind((ip, client_in_port))
+
+        # { client address: the socket that sends its packets to the server }
+        self.server_sockets: Dict[Tuple[str, int], socket.socket] = {}
+        # { the socket that sends to the server: client address }
+        self.clients_addresses: Dict[socket.socket, Tuple[str, int]] = {}
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.out_socket, selectors.EVENT_READ)
+
+        # (arrival time, sequence number, socket, packet, address)
+        self.queue = []
+        self.sequence = 0
+
+    def run(self):
+        """ Forwards the packets until the process exits. """
+        while True:
+            timeout = ImpairmentProxy.MAX_WAIT
+            if self.queue:
+                timeout = min(timeout,
+                              max(0, self.queue[0][0] - time.monotonic()))
+            for key, events in self.selector.select(timeout):
+                sock = key.fileobj
+                packet, address = sock.recvfrom(65536)
+                now = time.monotonic()
+                if sock is self.out_socket:
+                    self.forward(self.uplink, now,
+                                 self.get_server_socket(address), packet,
+                                 self.server_in_address)
+                else:
+                    self.forward(self.downlink, now, self.in_socket, packet,
+                                 self.clients_addresses[sock])
+
+            now = time.monotonic()
+            while self.queue and self.queue[0][0] <= now:
+                arrival, sequence, sock, packet, address = \
+                    heapq.heappop(self.queue)
+                sock.sendto(packet, address)
+
+    def get_server_socket(self, client_address: Tuple[str, int]) \
+            -> socket.socket:
+        """ Returns the socket that sends a client's packets. """
+        sock = self.server_sockets.get(client_address)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.server_sockets[client_address] = sock
+            self.clients_addresses[sock] = client_address
+            self.selector.register(sock, selectors.EVENT_READ)
+        return sock
+
+    def forward(self, link: Link, now: float, sock: socket.socket,
+                packet: bytes, address: Tuple[str, int]):
+        """ Queues a packet, unless the link drops it. """
+        arrival = link.schedule(now, len(packet))
+        if arrival is not None:
+            heapq.heappush(self.queue,
+                           (arrival, self.sequence, sock, packet, address))
+            self.sequence += 1
+
+
+def add_link_arguments(parser: argparse.ArgumentParser, direction: str):
+    """ Adds the impairments arguments of a direction (up / down). """
+    parser.add_argument(f'--{direction}-loss', type=float, default=0,
+                        help='packet loss probability')
+    parser.add_argument(f'--{direction}-delay', type=float, default=0,
+                        help='delay in seconds')
+    parser.add_argument(f'--{direction}-jitter', type=float, default=0,
+                        help='maximum extra random delay in seconds')
+    parser.add_argument(f'--{direction}-bandwidth', type=float, default=0,
+                        help='bits per second (0 for unlimited)')
+    parser.add_argument(f'--{direction}-queue', type=float,
+                        default=Link.MAX_QUEUE_DELAY,
+                        help='the maximum queueing delay in seconds')
+
+
+def create_link(args, direction: str) -> Link:
+    """ Creates the link of a direction from the arguments. """
+    return Link(getattr(args, f'{direction}_loss'),
+                getattr(args, f'{direction}_delay'),
+                getattr(args, f'{direction}_jitter'),
+                getattr(args, f'{direction}_bandwidth'), args.seed,
+                getattr(args, f'{direction}_queue'))
+
+
+def main():
+    """ Runs the proxy in front of a udp channel of a running server. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ip', default='0.0.0.0')
+    parser.add_argument('--ports', type=int, nargs=2, required=True,
+                        help='the proxy client in and client out ports')
+    parser.add_argument('--server-ip', default='127.0.0.1')
+    parser.add_argument('--server-ports', type=int, nargs=2, required=True,
+                        help='the server client in and client out ports')
+    parser.add_argument('--seed', type=int)
+    add_link_arguments(parser, 'up')
+    add_link_arguments(parser, 'down')
+    args = parser.parse_args()
+
+    proxy = ImpairmentProxy(args.ip, *args.ports,
+                            (args.server_ip, *args.server_ports),
+                            create_link(args, 'up'),
+                            create_link(args, 'down'))
+    proxy.start()
+    while True:
+        time.sleep(5)
+        print(f'up: sent={proxy.uplink.sent_packets}, '
+              f'dropped={proxy.uplink.dropped_packets}, '
+              f'down: sent={proxy.downlink.sent_packets}, '
+              f'dropped={proxy.downlink.dropped_packets}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,527 @@
+"""
+    Hadar Shahar
+    A headless load test of the MainServer.
+
+    Starts a MainServer on loopback (in a separate process), with an
+    AuthServer whose google api calls are answered locally. Then synthetic
+    participants sign in (/auth/name or /auth/google), create and join
+    meetings (/new-meeting, /join-meeting), connect the info, chat, video
+    and audio channels and send synthetic video, audio and chat at the
+    configured rates.
+
+    The results are printed as json: the relay throughput, the latency
+    percentiles and the drop rate of every channel, and the server CPU
+    usage and RSS (read from /proc, so they're null if it isn't available).
+    The CPU usage doesn't include udp worker processes
+    (see main_server.UDP_WORKER_PROCESSES).
+
+    Run: python -m benchmarks.main_server_load --meetings 50
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import selectors
+import socket
+import struct
+import sys
+import time
+import requests
+from benchmarks.tcp_server_engines import get_process_stats, host_address
+from benchmarks.udp_relay_scaling import pack_data
+from client.video.udp_packet import UdpPacket
+from network.constants import EXIT_SIGN, NETWORK_BYTES_FORMAT, \
+    NETWORK_BYTES_PER_NUM, UDP_NEW_CLIENT_MSG
+from network.custom_messages.chat_msg import ChatMsg
+from network.custom_messages.client_info import ClientInfo
+from network.packet_reader import PacketReader
+from network.tcp_network_utils import create_packet
+from server.auth_server import AuthServer
+from server.main_server import MainServer
+from server.network_constants import *
+
+IP = '127.0.0.1'
+SERVER_URL = f'http://{IP}:{AUTH_SERVER_PORT}'
+
+# the time to wait for the server to start
+SERVER_STARTUP_TIMEOUT = 30
+# the time to wait for the server to add the participants to the udp
+# servers (they are added when their first udp packet is received)
+UDP_JOIN_DELAY = 1
+# the time to keep receiving after the participants stop sending
+DRAIN_TIME = 1
+# the maximum time to wait for the sockets in each iteration of the
+# traffic loop (the packets are sent in the first iteration after
+# their time)
+TICK = 0.002
+
+# the channels whose packets are sent and received
+VIDEO = 'video'
+AUDIO = 'audio'
+CHAT = 'chat'
+CHANNELS = (VIDEO, AUDIO, CHAT)
+
+# the ports of the udp channels: (client in port, client out port)
+UDP_CHANNELS_PORTS = {
+    VIDEO: (CLIENT_IN_VIDEO_PORT, CLIENT_OUT_VIDEO_PORT),
+    AUDIO: (CLIENT_IN_AUDIO_PORT, CLIENT_OUT_AUDIO_PORT),
+}
+
+# the beginning of the payload of every synthetic udp packet:
+# the time it was sent (time.perf_counter) and its sequence number
+PAYLOAD_HEADER = struct.Struct('>dI')
+ID_LEN_STRUCT = struct.Struct(NETWORK_BYTES_FORMAT)
+
+
+class LocalAuthServer(AuthServer):
+    """
+    Definition of the class LocalAuthServer.
+
+    An AuthServer whose google api calls are answered locally,
+    so the /auth/google endpoint can be used without google.
+    The auth code is used as the user name.
+    """
+
+    ACCESS_TOKEN_PREFIX = 'local-token-'
+
+    def __init__(self, port: int):
+        """ Constructor. """
+        super(LocalAuthServer, self).__init__(port)
+        self.google_client_id = 'local-client-id'
+        self.google_client_secret = 'local-client-secret'
+
+    def run(self):
+        """ Runs the server (without flask's debug mode). """
+        self.app.run(host=IP, port=self.port, threaded=True)
+
+    def get_access_token(self, redirect_uri: str, auth_code: str) -> str:
+        """ Returns an access token for a given auth code. """
+        return LocalAuthServer.ACCESS_TOKEN_PREFIX + auth_code
+
+    @staticmethod
+    def get_user_info(access_token: str) -> dict:
+        """ Returns the user info like google does. """
+        name = access_token[len(LocalAuthServer.ACCESS_TOKEN_PREFIX):]
+        return {'name': name, 'picture': ''}
+
+
+class SyntheticParticipant(object):
+    """
+    Definition of the class SyntheticParticipant.
+
+    A participant that connects to all the channels of the main server
+    like a real client, and sends and receives synthetic packets.
+    The tcp sockets are bound to a different loopback address for each
+    participant, because the server pairs them by their host address.
+    """
+
+    def __init__(self, client_info: ClientInfo, source_ip: str,
+                 meeting_size: int):
+        """ Connects to the info, chat, video and audio channels. """
+        self.client_info = client_info
+        self.id = client_info.id
+        # the number of participants that receive every sent packet
+        self.num_recipients = meeting_size - 1
+        # the number of packets sent on each channel
+        self.seq = {channel: 0 for channel in CHANNELS}
+
+        # { channel: (in_socket, out_socket) }
+        self.tcp_sockets = {}
+        self.readers = {}
+        for channel, ports in (('info', (CLIENT_IN_INFO_PORT,
+                                         CLIENT_OUT_INFO_PORT)),
+                               (CHAT, (CLIENT_IN_CHAT_PORT,
+                                       CLIENT_OUT_CHAT_PORT))):
+            in_socket = socket.create_connection(
+                (IP, ports[0]), source_address=(source_ip, 0))
+            out_socket = socket.create_connection(
+                (IP, ports[1]), source_address=(source_ip, 0))
+            out_socket.sendall(create_packet(self.id))
+            in_socket.setblocking(False)
+            self.tcp_sockets[channel] = (in_socket, out_socket)
+            self.readers[channel] = PacketReader(in_socket)
+        # the first info packet is the client info
+        self.tcp_sockets['info'][1].sendall(
+            create_packet(pickle.dumps(client_info)))
+
+        # { channel: (in_socket, out_socket) }
+        self.udp_sockets = {}
+        for channel, (in_port, out_port) in UDP_CHANNELS_PORTS.items():
+            in_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            out_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # the new client message must be sent from the input socket,
+            # so the server knows where to send the data to
+            in_socket.sendto(pack_data(self.id, UDP_NEW_CLIENT_MSG),
+                             (IP, out_port))
+            in_socket.setblocking(False)
+            self.udp_sockets[channel] = (in_socket, out_socket)
+
+    def send_udp(self, channel: str, size: int):
+        """ Sends a synthetic udp packet of a given payload size. """
+        payload = PAYLOAD_HEADER.pack(time.perf_counter(), self.seq[channel])
+        payload += bytes(max(0, size - len(payload)))
+        if channel == VIDEO:
+            # a single packet frame of the first simulcast layer,
+            # the video server reads its header
+            payload = UdpPacket(self.seq[channel], 0, 1, payload).encode()
+        self.udp_sockets[channel][1].sendto(
+            pack_data(self.id, payload),
+            (IP, UDP_CHANNELS_PORTS[channel][1]))
+        self.seq[channel] += 1
+
+    def send_chat(self):
+        """
+        Sends a chat message to everyone,
+        its text is the time it was sent (time.perf_counter).
+        """
+        msg = ChatMsg(self.id, ChatMsg.BROADCAST_ID,
+                      repr(time.perf_counter()))
+        self.tcp_sockets[CHAT][1].sendall(create_packet(pickle.dumps(msg)))
+        self.seq[CHAT] += 1
+
+    def register(self, selector: selectors.BaseSelector):
+        """ Registers the input sockets in a given selector. """
+        for channel, (in_socket, out_socket) in self.tcp_sockets.items():
+            selector.register(in_socket, selectors.EVENT_READ,
+                              (channel, self))
+        for channel, (in_socket, out_socket) in self.udp_sockets.items():
+            selector.register(in_socket, selectors.EVENT_READ,
+                              (channel, self))
+
+    def close(self):
+        """ Leaves the meeting like a real client, and closes the sockets. """
+        for in_socket, out_socket in self.tcp_sockets.values():
+            try:
+                out_socket.sendall(create_packet(EXIT_SIGN))
+            except socket.error:
+                pass
+            in_socket.close()
+            out_socket.close()
+        for in_socket, out_socket in self.udp_sockets.values():
+            in_socket.close()
+            out_socket.close()
+
+
+def run_server():
+    """ Runs the MainServer (in a separate process). """
+    sys.stdout = open(os.devnull, 'w')  # the servers print on every join
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = MainServer(IP, LocalAuthServer(AUTH_SERVER_PORT))
+    server.start()
+
+
+def wait_for_server(server: multiprocessing.Process):
+    """ Waits until the auth server answers (and the others are bound). """
+    end_time = time.perf_counter() + SERVER_STARTUP_TIMEOUT
+    while time.perf_counter() < end_time:
+        if not server.is_alive():
+            raise RuntimeError('The server has exited.')
+        try:
+            requests.post(SERVER_URL + '/logout', json={'id': ''}, timeout=1)
+            return
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.2)
+    raise TimeoutError('The server has not started.')
+
+
+def sign_in(session: requests.Session, name: str,
+            google_auth: bool) -> str:
+    """
+    Signs in using the name (or using the local google stand-in).
+    :returns: the client id as a hex string.
+    """
+    if google_auth:
+        response = session.post(SERVER_URL + '/auth/google', json={
+            'redirect_uri': f'http://{IP}/', 'auth_code': name})
+    else:
+        response = session.post(SERVER_URL + '/auth/name',
+                                json={'name': name})
+    response.raise_for_status()
+    return response.json()['id']
+
+
+def join_meeting(session: requests.Session, meeting_index: int,
+                 meeting_size: int, google_auth: bool) -> [ClientInfo]:
+    """
+    Signs in the participants of a meeting, the first one creates it
+    and the others join it.
+    :returns: the client info of each participant
+              (the id contains the meeting id).
+    """
+    infos = []
+    for i in range(meeting_size):
+        payload = {'id': sign_in(session, f'm{meeting_index}-p{i}',
+                                 google_auth)}
+        if infos:
+            payload['meeting_id'] = infos[0].meeting_id.hex()
+            response = session.post(SERVER_URL + '/join-meeting',
+                                    json=payload)
+        else:
+            response = session.post(SERVER_URL + '/new-meeting',
+                                    json=payload)
+        response.raise_for_status()
+        infos.append(ClientInfo.from_json(response.json()))
+    return infos
+
+
+def percentiles(values: list) -> dict:
+    """ Returns the percentiles (in ms) of a given list of seconds. """
+    if not values:
+        return None
+    values = sorted(values)
+    result = {f'p{p}': values[len(values) * p // 100] * 1000
+              for p in (50, 90, 99)}
+    result['max'] = values[-1] * 1000
+    return result
+
+
+def receive(channel: str, par: SyntheticParticipant, stats: dict):
+    """
+    Receives the available packets of a given channel of a participant,
+    and adds their latencies to the stats.
+    """
+    if channel in UDP_CHANNELS_PORTS:
+        in_socket = par.udp_sockets[channel][0]
+        try:
+            while True:
+                data = in_socket.recv(65536)
+                offset = NETWORK_BYTES_PER_NUM + \
+                    ID_LEN_STRUCT.unpack_from(data)[0]
+                if channel == VIDEO:
+                    offset += UdpPacket.HEADER_SIZE
+                sent_time = PAYLOAD_HEADER.unpack_from(data, offset)[0]
+                stats[channel]['latencies'].append(
+                    time.perf_counter() - sent_time)
+        except BlockingIOError:
+            return
+
+    reader = par.readers[channel]
+    while reader.fill():
+        packet = reader.next_packet()
+        while packet is not None:
+            if channel == CHAT:
+                msg = pickle.loads(packet)
+                stats[CHAT]['latencies'].append(
+                    time.perf_counter() - float(msg.text))
+            else:
+                stats['info_msgs'] += 1
+            packet = reader.next_packet()
+
+
+def run_traffic(pars: [SyntheticParticipant], args) -> dict:
+    """
+    Sends the synthetic packets at the configured rates for the duration,
+    and receives the packets until DRAIN_TIME after it.
+    :returns: the stats of this process.
+    """
+    rates = {VIDEO: args.video_rate, AUDIO: args.audio_rate,
+             CHAT: args.chat_rate}
+    sizes = {VIDEO: args.video_size, AUDIO: args.audio_size}
+    stats = {channel: {'sent': 0, 'expected': 0, 'latencies': []}
+             for channel in CHANNELS}
+    stats['info_msgs'] = 0
+
+    selector = selectors.DefaultSelector()
+    for par in pars:
+        par.register(selector)
+
+    start_time = time.perf_counter()
+    end_time = start_time + args.duration
+    rounds = {channel: 0 for channel in CHANNELS}
+    now = start_time
+    while now < end_time + DRAIN_TIME:
+        if now < end_time:
+            for channel, rate in rates.items():
+                # every participant sends on every round
+                while rounds[channel] < int((now - start_time) * rate):
+                    for par in pars:
+                        if channel == CHAT:
+                            par.send_chat()
+                        else:
+                            par.send_udp(channel, sizes[channel])
+                        stats[channel]['sent'] += 1
+                        stats[channel]['expected'] += par.num_recipients
+                    rounds[channel] += 1
+
+        for key, mask in selector.select(timeout=TICK):
+            channel, par = key.data
+            try:
+                receive(channel, par, stats)
+            except ConnectionError:
+                selector.unregister(key.fileobj)
+                stats['disconnected'] = stats.get('disconnected', 0) + 1
+        now = time.perf_counter()
+
+    selector.close()
+    return stats
+
+
+def run_load_generator(first_meeting: int, num_meetings: int, args,
+                       ready_queue: multiprocessing.Queue,
+                       start_event: multiprocessing.Event,
+                       results_queue: multiprocessing.Queue):
+    """
+    Runs the participants of some of the meetings (in a separate process).
+    Puts (the number of participants, the number of failed joins)
+    in the ready queue when they are connected, waits for the start event,
+    and then puts the traffic stats in the results queue.
+    """
+    session = requests.Session()
+    pars = []
+    failed = 0
+    for meeting_index in range(first_meeting, first_meeting + num_meetings):
+        try:
+            infos = join_meeting(session, meeting_index, args.participants,
+                                 args.google_auth)
+            for i, info in enumerate(infos):
+                source_ip = host_address(
+                    meeting_index * args.participants + i)
+                pars.append(SyntheticParticipant(info, source_ip,
+                                                 len(infos)))
+        except (requests.exceptions.RequestException, socket.error) as e:
+            print(f'meeting {meeting_index} failed to join: {e}')
+            failed += 1
+    ready_queue.put((len(pars), failed))
+
+    start_event.wait()
+    stats = run_traffic(pars, args)
+    for par in pars:
+        par.close()
+    results_queue.put(stats)
+
+
+def get_cpu_time(pid: int) -> float:
+    """
+    Returns the CPU time (in seconds) of a given process.
+    It's read from /proc, so it's None if it's not available.
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # the fields after the process name, utime and stime are
+            # the 14th and 15th fields of the whole line
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def summarize(results: [dict], args) -> dict:
+    """ Merges the stats of all the load generators. """
+    channels = {}
+    for channel in CHANNELS:
+        sent = sum(r[channel]['sent'] for r in results)
+        expected = sum(r[channel]['expected'] for r in results)
+        latencies = [latency for r in results
+                     for latency in r[channel]['latencies']]
+        size = args.video_size if channel == VIDEO else \
+            args.audio_size if channel == AUDIO else None
+        channels[channel] = {
+            'sent_per_sec': sent / args.duration,
+            'relayed_per_sec': len(latencies) / args.duration,
+            'relayed_mbps': None if size is None else
+            len(latencies) * size * 8 / args.duration / 1e6,
+            'drop_rate': 1 - len(latencies) / expected if expected else None,
+            'latency_ms': percentiles(latencies),
+        }
+    return {
+        'channels': channels,
+        'info_msgs_received': sum(r['info_msgs'] for r in results),
+        'disconnected_sockets': sum(r.get('disconnected', 0)
+                                    for r in results),
+    }
+
+
+def main():
+    """ Runs the load test and prints the results as json. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--meetings', type=int, default=10)
+    parser.add_argument('--participants', type=int,
+                        default=AuthServer.MAX_CLIENTS_PER_MEETING,
+                        help='participants per meeting (at most '
+                             f'{AuthServer.MAX_CLIENTS_PER_MEETING})')
+    parser.add_argument('--processes', type=int, default=2,
+                        help='the number of load generator processes')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds of traffic')
+    parser.add_argument('--video-rate', type=float, default=75,
+                        help='video packets per second per participant')
+    parser.add_argument('--video-size', type=int, default=2048,
+                        help='video packet payload size in bytes')
+    parser.add_argument('--audio-rate', type=float, default=43,
+                        help='audio packets per second per participant')
+    parser.add_argument('--audio-size', type=int, default=2048,
+                        help='audio packet payload size in bytes')
+    parser.add_argument('--chat-rate', type=float, default=1,
+                        help='chat messages per second per participant')
+    parser.add_argument('--google-auth', action='store_true',
+                        help='sign in using /auth/google (answered locally) '
+                             'instead of /auth/name')
+    parser.add_argument('--output', help='a file to write the json to')
+    args = parser.parse_args()
+
+    # not a daemon, because the server might start udp worker processes
+    server = multiprocessing.Process(target=run_server)
+    server.start()
+    try:
+        wait_for_server(server)
+        ready_queue = multiprocessing.Queue()
+        results_queue = multiprocessing.Queue()
+        start_event = multiprocessing.Event()
+        generators = []
+        meetings_per_process = -(-args.meetings // args.processes)
+        for first_meeting in range(0, args.meetings, meetings_per_process):
+            generators.append(multiprocessing.Process(
+                target=run_load_generator, args=(
+                    first_meeting,
+                    min(meetings_per_process, args.meetings - first_meeting),
+                    args, ready_queue, start_event, results_queue)))
+
+        join_start = time.perf_counter()
+        for generator in generators:
+            generator.start()
+        joined = [ready_queue.get() for _ in generators]
+        join_duration = time.perf_counter() - join_start
+        time.sleep(UDP_JOIN_DELAY)
+
+        idle_stats = get_process_stats(server.pid)
+        start_cpu_time = get_cpu_time(server.pid)
+        start_event.set()
+        results = [results_queue.get() for _ in generators]
+        end_cpu_time = get_cpu_time(server.pid)
+        load_stats = get_process_stats(server.pid)
+        for generator in generators:
+            generator.join()
+    finally:
+        server.terminate()
+        server.join()
+
+    cpu_percent = None
+    if start_cpu_time is not None and end_cpu_time is not None:
+        cpu_percent = (end_cpu_time - start_cpu_time) / \
+            (args.duration + DRAIN_TIME) * 100
+    report = {
+        'config': vars(args),
+        'join': {
+            'participants': sum(n for n, failed in joined),
+            'failed_meetings': sum(failed for n, failed in joined),
+            'seconds': join_duration,
+        },
+        'server': {
+            'cpu_percent': cpu_percent,
+            'idle_rss_kb': idle_stats['rss_kb'],
+            'rss_kb': load_stats['rss_kb'],
+            'threads': load_stats['threads'],
+        },
+        **summarize(results, args),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+    Hadar Shahar
+    Compares sending the packets of each frame in a burst to spreading
+    them over the frame interval (see PacketPacer), through the
+    impairment proxy with a limited bandwidth and a short router queue.
+    A burst fills the queue even when the average bitrate fits the link,
+    so its tail is dropped.
+
+    Run: python -m benchmarks.packet_pacing
+"""
+import argparse
+import os
+import selectors
+import sys
+import threading
+import time
+from benchmarks.impairment_proxy import ImpairmentProxy, Link
+from benchmarks.rate_adaptation import create_client
+from benchmarks.udp_relay_scaling import IP, find_free_port, pack_data
+from client.video.frame_scheduler import FrameScheduler
+from client.video.packet_pacer import PacketPacer
+from client.video.udp_packet import UdpPacket
+from client.video.udp_packets_handler import UdpPacketsHandler
+from network.constants import NETWORK_BYTES_PER_NUM
+from server.feedback_udp_server import FeedbackUdpServer
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+
+# like BasicUdpVideoClient.PACING_FRACTION
+PACING_FRACTION = 0.8
+
+
+def run_sender(full_id: bytes, proxy_ports: (int, int), args,
+               pace: bool, end_time: float):
+    """ Sends frames of args.frame_size bytes at args.fps. """
+    in_socket, out_socket = create_client(full_id, proxy_ports)
+    time.sleep(1)  # let the server add the client
+
+    def send(packet: bytes):
+        out_socket.sendto(packet, (IP, proxy_ports[1]))
+
+    frame_index = 0
+    scheduler = FrameScheduler()
+    data = bytes(args.frame_size)
+    while time.monotonic() < end_time:
+        scheduler.wait(args.fps)
+        packets = [pack_data(full_id, p.encode())
+                   for p in UdpPacketsHandler.create_packets(frame_index,
+                                                             data)]
+        if pace:
+            PacketPacer.send(packets, send, PACING_FRACTION / args.fps)
+        else:
+            for packet in packets:
+                send(packet)
+        frame_index += 1
+
+
+def run_receiver(full_id: bytes, proxy_ports: (int, int), sender_id: bytes,
+                 stats: dict, end_time: float):
+    """ Counts the received packets and the completed frames. """
+    in_socket, out_socket = create_client(full_id, proxy_ports)
+    selector = selectors.DefaultSelector()
+    selector.register(in_socket, selectors.EVENT_READ)
+    handler = UdpPacketsHandler()
+    while time.monotonic() < end_time:
+        if not selector.select(0.05):
+            continue
+        try:
+            while True:
+                data = in_socket.recv(65536)
+                offset = NETWORK_BYTES_PER_NUM + len(sender_id)
+                p = UdpPacket.decode(data, offset)
+                if p is not None:
+                    stats['packets'] += 1
+                    stats['frames'] += len(handler.process_packet(p))
+        except BlockingIOError:
+            pass
+
+
+def run(args, pace: bool) -> dict:
+    """
+    Runs a server, the proxy, a sender and the receivers for
+    args.duration seconds, and returns the stats.
+    """
+    server_ports = (find_free_port(), find_free_port())
+    proxy_ports = (find_free_port(), find_free_port())
+    server = FeedbackUdpServer(IP, *server_ports, 'video',
+                               lambda client_id: True)
+    server.daemon = True
+    server.start()
+    # the receivers share the downlink, like behind the same router
+    downlink = Link(bandwidth=args.bandwidth, seed=args.seed,
+                    max_queue_delay=args.queue)
+    proxy = ImpairmentProxy(IP, *proxy_ports, (IP, *server_ports),
+                            Link(), downlink)
+    proxy.start()
+
+    meeting_id = bytes(MEETING_ID_LEN)
+    ids = [meeting_id + i.to_bytes(CLIENT_ID_LEN, 'big')
+           for i in range(args.receivers + 1)]
+    stats = {'packets': 0, 'frames': 0}
+    end_time = time.monotonic() + 1 + args.duration
+    threads = [threading.Thread(target=run_sender, daemon=True, args=(
+        ids[0], proxy_ports, args, pace, end_time))]
+    threads += [threading.Thread(target=run_receiver, daemon=True, args=(
+        full_id, proxy_ports, ids[0], stats, end_time))
+        for full_id in ids[1:]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats['dropped'] = downlink.dropped_packets
+    stats['sent'] = downlink.sent_packets
+    return stats
+
+
+def main():
+    """ Runs the burst and the paced senders and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--receivers', type=int, default=2)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--frame-size', type=int, default=12000,
+                        help='in bytes')
+    parser.add_argument('--bandwidth', type=float, default=10e6,
+                        help='the downlink bandwidth (bits/s)')
+    parser.add_argument('--queue', type=float, default=0.01,
+                        help='the maximum queueing delay in seconds')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    bitrate = args.frame_size * 8 * args.fps * args.receivers
+    print(f'{args.receivers} receivers, {bitrate / 1e6:.1f}Mbps over a '
+          f'{args.bandwidth / 1e6:.1f}Mbps downlink with a '
+          f'{args.queue * 1000:.0f}ms queue')
+    stdout = sys.stdout
+    for pace in (False, True):
+        # the server prints on every join
+        sys.stdout = open(os.devnull, 'w')
+        stats = run(args, pace)
+        sys.stdout = stdout
+        total = stats['sent'] + stats['dropped']
+        expected_frames = args.fps * args.duration * args.receivers
+        print(f'{"paced" if pace else "burst"}: '
+              f'router loss={stats["dropped"] / max(total, 1):.3f}, '
+              f'received packets={stats["packets"]}, '
+              f'frames={stats["frames"] / expected_frames:.2f}')
+
+
+if __name__ == '__main__':
+    main()
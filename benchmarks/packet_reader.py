@@ -0,0 +1,82 @@
+"""
+    Hadar Shahar
+    Compares the receiving throughput of tcp_network_utils.recv_packet
+    and PacketReader, for several packet sizes.
+
+    Run: python -m benchmarks.packet_reader
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+from network.packet_reader import PacketReader
+from network.tcp_network_utils import create_packet, recv_packet
+
+PACKET_SIZES = (16, 256, 4096, 65536, 1024 * 1024)
+
+
+def send_loop(sock: socket.socket, packet: bytes, num_packets: int):
+    """ Sends a given packet a given number of times. """
+    # send in batches to make the sending side cheaper than the receiving
+    batch_size = max(1, 65536 // len(packet))
+    batch = packet * batch_size
+    for _ in range(num_packets // batch_size):
+        sock.sendall(batch)
+    sock.sendall(packet * (num_packets % batch_size))
+
+
+def measure(receive, size: int, total_bytes: int) -> (float, float):
+    """
+    Measures receiving packets of a given size using a given function.
+    :returns: (packets per second, MB per second)
+    """
+    num_packets = max(1, total_bytes // size)
+    sender, receiver = socket.socketpair()
+    thread = threading.Thread(target=send_loop, args=(
+        sender, create_packet(os.urandom(size)), num_packets))
+
+    start = time.perf_counter()
+    thread.start()
+    receive(receiver, num_packets)
+    duration = time.perf_counter() - start
+    thread.join()
+    sender.close()
+    receiver.close()
+    return num_packets / duration, num_packets * size / duration / 1e6
+
+
+def receive_with_recv_packet(sock: socket.socket, num_packets: int):
+    """ Receives the packets using recv_packet. """
+    for _ in range(num_packets):
+        recv_packet(sock)
+
+
+def receive_with_packet_reader(sock: socket.socket, num_packets: int):
+    """ Receives the packets using a PacketReader. """
+    reader = PacketReader(sock)
+    for _ in range(num_packets):
+        reader.recv_packet()
+
+
+def main():
+    """ Runs the benchmark and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--total-mb', type=int, default=64,
+                        help='the number of MB received for each size '
+                             '(at most 1 million packets)')
+    args = parser.parse_args()
+
+    for size in PACKET_SIZES:
+        total_bytes = min(args.total_mb * 1024 * 1024, size * 10 ** 6)
+        results = [f'size={size}']
+        for name, receive in (('recv_packet', receive_with_recv_packet),
+                              ('PacketReader', receive_with_packet_reader)):
+            packets_per_sec, mb_per_sec = measure(receive, size, total_bytes)
+            results.append(f'{name}: packets/s={packets_per_sec:.0f} '
+                           f'MB/s={mb_per_sec:.1f}')
+        print(', '.join(results))
+
+
+if __name__ == '__main__':
+    main()
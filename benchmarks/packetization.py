@@ -0,0 +1,90 @@
+"""
+    Hadar Shahar
+    Measures the packets per second of splitting frames into packets
+    and sending them:
+    - copy: UdpPacketsHandler.create_packets, UdpPacket.encode and
+      pack_data, then sendto (like the clients did before the
+      UdpPacketizer).
+    - join: UdpPacketizer, then joining the header and the data for
+      sendto (like BasicUdpClient.send_buffers without sendmsg).
+    - sendmsg: UdpPacketizer, then sendmsg.
+    Also measures the packetization alone, and checks that all the
+    ways produce the same packets.
+
+    Run: python -m benchmarks.packetization
+"""
+import argparse
+import os
+import socket
+import time
+from benchmarks.udp_relay_scaling import IP, pack_data
+from client.video.udp_packetizer import UdpPacketizer
+from client.video.udp_packets_handler import UdpPacketsHandler
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+
+FULL_ID = bytes(MEETING_ID_LEN + CLIENT_ID_LEN)
+
+
+def packetize_copy(frame_index: int, data: bytes, args) -> list:
+    """ Returns the packets like the clients did before. """
+    return [pack_data(FULL_ID, p.encode())
+            for p in UdpPacketsHandler.create_packets(
+                frame_index, data, fec_group_size=args.fec_group_size)]
+
+
+def run(args, name: str, data: bytes, send) -> float:
+    """ Returns the packets per second of a given way. """
+    packetizer = UdpPacketizer(pack_data(FULL_ID, b''))
+    packets_count = 0
+    start = time.perf_counter()
+    for frame_index in range(args.frames):
+        if name == 'copy':
+            packets = packetize_copy(frame_index, data, args)
+        else:
+            packets = packetizer.packetize(frame_index, [data],
+                                           args.fec_group_size)
+        if send is not None:
+            for packet in packets:
+                send(packet)
+        packets_count += len(packets)
+    return packets_count / (time.perf_counter() - start)
+
+
+def main():
+    """ Runs all the ways and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frame-size', type=int, default=200_000,
+                        help='in bytes')
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--fec-group-size', type=int, default=0)
+    args = parser.parse_args()
+
+    data = os.urandom(args.frame_size)
+    packetizer = UdpPacketizer(pack_data(FULL_ID, b''))
+    assert [b''.join(packet) for packet in packetizer.packetize(
+        7, [data], args.fec_group_size)] == \
+        packetize_copy(7, data, args), 'the packets are different'
+
+    # the packets are sent to a socket that doesn't read them
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind((IP, 0))
+    address = receiver.getsockname()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    print(f'{args.frame_size} bytes frames, '
+          f'fec group size {args.fec_group_size}')
+    ways = (
+        ('copy', 'copy', None),
+        ('packetizer', 'packetizer', None),
+        ('copy + sendto', 'copy',
+         lambda packet: sock.sendto(packet, address)),
+        ('join + sendto', 'packetizer',
+         lambda packet: sock.sendto(b''.join(packet), address)),
+        ('sendmsg', 'packetizer',
+         lambda packet: sock.sendmsg(packet, (), 0, address)))
+    for title, name, send in ways:
+        print(f'{title}: {run(args, name, data, send):,.0f} packets/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+    Hadar Shahar
+    Runs a video sender and receivers through the impairment proxy,
+    and shows how the sender's RateController adapts when the bandwidth
+    of the proxy changes (every phase has a different bandwidth).
+
+    The frames are synthetic: their size is a model of a JPEG frame
+    at the controller's quality and resolution scale
+    (FULL_FRAME_SIZE at the default quality and full resolution).
+    The receivers report to the FeedbackUdpServer like the real clients.
+
+    Run: python -m benchmarks.rate_adaptation
+"""
+import argparse
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+from benchmarks.impairment_proxy import ImpairmentProxy, \
+    add_link_arguments, create_link
+from benchmarks.udp_relay_scaling import IP, find_free_port, pack_data
+from client.video.frame_scheduler import FrameScheduler
+from client.video.packet_pacer import PacketPacer
+from client.video.rate_controller import RateController
+from client.video.udp_packet import UdpPacket
+from client.video.udp_packets_handler import UdpPacketsHandler
+from network.constants import NETWORK_BYTES_PER_NUM, UDP_NEW_CLIENT_MSG, \
+    UDP_REPORT_MSG
+from network.custom_messages.receiver_report import ReceiverReport
+from server.feedback_udp_server import FeedbackUdpServer
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+
+# the size of a 640x480 JPEG frame at quality 80 (in bytes)
+FULL_FRAME_SIZE = 40000
+FULL_QUALITY = 80
+MAX_FPS = 30
+# like BasicUdpVideoClient.PACING_FRACTION
+PACING_FRACTION = 0.8
+REPORT_INTERVAL = 1
+
+
+def get_frame_size(quality: int, scale: float) -> int:
+    """
+    Returns the size of a synthetic frame: proportional to the number
+    of pixels, and it grows faster than linearly with the quality
+    (roughly like JPEG).
+    """
+    return int(FULL_FRAME_SIZE * scale ** 2 *
+               (quality / FULL_QUALITY) ** 1.5)
+
+
+def create_client(full_id: bytes, proxy_ports: (int, int)) \
+        -> (socket.socket, socket.socket):
+    """
+    Creates the input and output sockets of a client,
+    and connects it to the server through the proxy.
+    """
+    in_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    out_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    in_socket.sendto(pack_data(full_id, UDP_NEW_CLIENT_MSG),
+                     (IP, proxy_ports[1]))
+    in_socket.setblocking(False)
+    return in_socket, out_socket
+
+
+def run_sender(full_id: bytes, proxy_ports: (int, int),
+               controller: RateController, end_time: float):
+    """
+    Sends synthetic frames at the controller's rate (paced like
+    BasicUdpVideoClient), and passes it the aggregated reports.
+    """
+    in_socket, out_socket = create_client(full_id, proxy_ports)
+    time.sleep(1)  # let the server add the client
+    frame_index = 0
+    scheduler = FrameScheduler()
+    while time.monotonic() < end_time:
+        scheduler.wait(controller.fps)
+        data = bytes(get_frame_size(controller.quality, controller.scale))
+        packets = [pack_data(full_id, p.encode())
+                   for p in UdpPacketsHandler.create_packets(frame_index,
+                                                             data)]
+        PacketPacer.send(
+            packets, lambda packet: out_socket.sendto(
+                packet, (IP, proxy_ports[1])),
+            PACING_FRACTION / controller.fps)
+        frame_index += 1
+        controller.frame_sent(sum(map(len, packets)))
+
+        try:
+            while True:
+                data = in_socket.recv(65536)
+                offset = NETWORK_BYTES_PER_NUM + len(full_id) + \
+                    len(UDP_REPORT_MSG)
+                report = ReceiverReport.decode(data[offset:])
+                if report is not None:
+                    controller.on_report(report)
+        except BlockingIOError:
+            pass
+
+
+def run_receivers(ids: list, proxy_ports: (int, int), sender_id: bytes,
+                  stats: dict, end_time: float):
+    """
+    Receives the frames of the sender in all the receivers,
+    and sends their reports every REPORT_INTERVAL.
+    Adds the received bytes and frames to the stats.
+    """
+    selector = selectors.DefaultSelector()
+    receivers = []
+    for full_id in ids:
+        in_socket, out_socket = create_client(full_id, proxy_ports)
+        handler = UdpPacketsHandler()
+        selector.register(in_socket, selectors.EVENT_READ, handler)
+        receivers.append((full_id, in_socket, handler))
+
+    report_time = time.monotonic()
+    while time.monotonic() < end_time:
+        for key, events in selector.select(0.05):
+            try:
+                while True:
+                    data = key.fileobj.recv(65536)
+                    stats['received_bytes'] += len(data)
+                    offset = NETWORK_BYTES_PER_NUM + len(sender_id)
+                    p = UdpPacket.decode(data, offset)
+                    if p is not None:
+                        stats['frames'] += len(key.data.process_packet(p))
+            except BlockingIOError:
+                pass
+
+        if time.monotonic() - report_time > REPORT_INTERVAL:
+            report_time = time.monotonic()
+            for full_id, in_socket, handler in receivers:
+                report = handler.create_report()
+                stats['loss'] = max(stats['loss'], report.loss)
+                in_socket.sendto(pack_data(full_id, UDP_REPORT_MSG +
+                                           sender_id + report.encode()),
+                                 (IP, proxy_ports[1]))
+
+
+def main():
+    """ Runs the phases and prints the controller state every second. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--receivers', type=int, default=2)
+    parser.add_argument('--bandwidths', type=float, nargs='+',
+                        default=[20e6, 4e6, 2e6, 10e6],
+                        help='the downlink bandwidth of each phase (bits/s)')
+    parser.add_argument('--phase-duration', type=float, default=15)
+    parser.add_argument('--seed', type=int, default=1)
+    add_link_arguments(parser, 'up')
+    add_link_arguments(parser, 'down')
+    args = parser.parse_args()
+
+    server_ports = (find_free_port(), find_free_port())
+    proxy_ports = (find_free_port(), find_free_port())
+    # the server prints on every join
+    sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+    server = FeedbackUdpServer(IP, *server_ports, 'video',
+                               lambda client_id: True)
+    server.daemon = True
+    server.start()
+    downlink = create_link(args, 'down')
+    downlink.bandwidth = args.bandwidths[0]
+    proxy = ImpairmentProxy(IP, *proxy_ports, (IP, *server_ports),
+                            create_link(args, 'up'), downlink)
+    proxy.start()
+
+    meeting_id = bytes(MEETING_ID_LEN)
+    ids = [meeting_id + i.to_bytes(CLIENT_ID_LEN, 'big')
+           for i in range(args.receivers + 1)]
+    controller = RateController(FULL_QUALITY, MAX_FPS)
+    stats = {'received_bytes': 0, 'frames': 0, 'loss': 0}
+    end_time = time.monotonic() + 1 + \
+        len(args.bandwidths) * args.phase_duration
+    threads = [
+        threading.Thread(target=run_sender, daemon=True, args=(
+            ids[0], proxy_ports, controller, end_time)),
+        threading.Thread(target=run_receivers, daemon=True, args=(
+            ids[1:], proxy_ports, ids[0], stats, end_time))]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(1)
+    start_time = time.monotonic()
+    while time.monotonic() < end_time:
+        time.sleep(1)
+        elapsed = time.monotonic() - start_time
+        phase = min(int(elapsed // args.phase_duration),
+                    len(args.bandwidths) - 1)
+        downlink.bandwidth = args.bandwidths[phase]
+        received = stats['received_bytes'] * 8 / args.receivers
+        print(f't={elapsed:.0f}s, '
+              f'bandwidth={downlink.bandwidth / 1e6:.1f}Mbps, '
+              f'target={controller.target_bitrate / 1e6:.2f}Mbps, '
+              f'sent={controller.sent_bitrate / 1e6:.2f}Mbps, '
+              f'received={received / 1e6:.2f}Mbps, '
+              f'loss={stats["loss"]:.2f}, '
+              f'quality={controller.quality}, scale={controller.scale}, '
+              f'fps={controller.fps}, '
+              f'frames={stats["frames"] / args.receivers:.0f}',
+              file=stdout)
+        stats.update(received_bytes=0, frames=0, loss=0)
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == '__main__':
+    main()
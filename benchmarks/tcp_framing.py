@@ -0,0 +1,105 @@
+"""
+    Hadar Shahar
+    Compares the bytes copied (allocated) and the time it takes to relay
+    a message to a meeting, when joining the id packet and the data packet
+    (the old framing) and when sending them as separate buffers.
+
+    Run: python -m benchmarks.tcp_framing
+"""
+import argparse
+import os
+import selectors
+import socket
+import threading
+import time
+import tracemalloc
+from network.tcp_network_utils import create_header, create_packet, \
+    sendall_buffers, HAS_SENDMSG
+
+FULL_ID = os.urandom(6)
+ID_HEADER = create_packet(FULL_ID)
+
+
+def relay_joined(sinks: list, data: bytes):
+    """ Relays the data like the old BroadcastTcpServer.handle_new_data. """
+    packet = create_packet(FULL_ID) + create_packet(data)
+    for sink in sinks:
+        sink.sendall(packet)
+
+
+def relay_buffers(sinks: list, data: bytes):
+    """ Relays the data like the current BroadcastTcpServer. """
+    buffers = (ID_HEADER, create_header(len(data)), data)
+    for sink in sinks:
+        sendall_buffers(sink, buffers)
+
+
+def drain_loop(sockets: list, stop: threading.Event):
+    """ Reads and discards everything that the sinks receive. """
+    selector = selectors.DefaultSelector()
+    for sock in sockets:
+        selector.register(sock, selectors.EVENT_READ)
+    buffer = bytearray(1024 * 1024)
+    while not stop.is_set():
+        for key, mask in selector.select(timeout=0.1):
+            key.fileobj.recv_into(buffer)
+    selector.close()
+
+
+def measure_copied_bytes(relay, sinks: list, data: bytes) -> int:
+    """
+    Returns the peak number of bytes that were allocated
+    while relaying the data once (the copies of the data).
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    relay(sinks, data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - before
+
+
+def measure_time(relay, sinks: list, data: bytes, repeat: int) -> float:
+    """ Returns the average time (in microseconds) of relaying the data. """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        relay(sinks, data)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    """ Runs the benchmark for several message sizes. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--receivers', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    pairs = [socket.socketpair() for _ in range(args.receivers)]
+    sinks = [sink for sink, drained in pairs]
+    stop = threading.Event()
+    drain_thread = threading.Thread(
+        target=drain_loop, args=([drained for sink, drained in pairs], stop))
+    drain_thread.start()
+
+    print(f'receivers={args.receivers}, sendmsg={HAS_SENDMSG}')
+    try:
+        for size in (256, 4096, 65536, 1024 * 1024):
+            data = os.urandom(size)
+            results = [f'size={size}']
+            for name, relay in (('joined', relay_joined),
+                                ('buffers', relay_buffers)):
+                copied = measure_copied_bytes(relay, sinks, data)
+                usec = measure_time(relay, sinks, data, args.repeat)
+                results.append(f'{name}: copied={copied} us={usec:.1f}')
+            print(', '.join(results))
+    finally:
+        stop.set()
+        drain_thread.join()
+        for sink, drained in pairs:
+            sink.close()
+            drained.close()
+
+
+if __name__ == '__main__':
+    main()
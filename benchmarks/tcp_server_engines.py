@@ -0,0 +1,173 @@
+"""
+    Hadar Shahar
+    Compares the BroadcastTcpServer engines:
+    the event loop vs a thread per participant.
+
+    Run: python -m benchmarks.tcp_server_engines
+"""
+import argparse
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+from network.tcp_network_utils import create_packet
+from server.broadcast_tcp_server import BroadcastTcpServer
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+
+IP = '127.0.0.1'
+
+
+def run_server(use_event_loop: bool, ports_queue: multiprocessing.Queue):
+    """ Runs a BroadcastTcpServer (in a separate process). """
+    sys.stdout = open(os.devnull, 'w')  # the server prints on every join
+    server = BroadcastTcpServer(IP, 0, 0, 'benchmark', lambda client_id: True,
+                                use_event_loop)
+    ports_queue.put((server.accept_clients_in.getsockname()[1],
+                     server.accept_clients_out.getsockname()[1]))
+    server.start()
+
+
+def get_process_stats(pid: int) -> dict:
+    """
+    Returns the number of threads and the RSS (in KB) of a given process.
+    They are read from /proc, so they're None if it's not available.
+    """
+    stats = {'threads': None, 'rss_kb': None}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    stats['threads'] = int(line.split()[1])
+                elif line.startswith('VmRSS:'):
+                    stats['rss_kb'] = int(line.split()[1])
+    except OSError:
+        pass
+    return stats
+
+
+def host_address(index: int) -> str:
+    """
+    Returns a different loopback address for each participant,
+    because the server pairs the client sockets by their host address.
+    """
+    return f'127.0.{index // 250}.{index % 250 + 1}'
+
+
+def connect_participants(ports: (int, int), num_meetings: int,
+                         pars_per_meeting: int) -> list:
+    """
+    Connects the participants to the server.
+    :returns: a list of (in_socket, out_socket) of each participant.
+    """
+    in_port, out_port = ports
+    sockets = []
+    for meeting_index in range(num_meetings):
+        meeting_id = meeting_index.to_bytes(MEETING_ID_LEN, 'big')
+        for client_index in range(pars_per_meeting):
+            client_id = client_index.to_bytes(CLIENT_ID_LEN, 'big')
+            source = (host_address(len(sockets)), 0)
+            in_socket = socket.create_connection((IP, in_port),
+                                                 source_address=source)
+            out_socket = socket.create_connection((IP, out_port),
+                                                  source_address=source)
+            out_socket.sendall(create_packet(meeting_id + client_id))
+            sockets.append((in_socket, out_socket))
+    return sockets
+
+
+def send_loop(sockets: list, payload: bytes, stop: threading.Event,
+              counter: list):
+    """ Sends the payload from every participant until stopped. """
+    packet = create_packet(payload)
+    while not stop.is_set():
+        for in_socket, out_socket in sockets:
+            out_socket.sendall(packet)
+            counter[0] += 1
+
+
+def receive_loop(sockets: list, stop: threading.Event, counter: list):
+    """ Counts the bytes that all the participants receive. """
+    selector = selectors.DefaultSelector()
+    for in_socket, out_socket in sockets:
+        selector.register(in_socket, selectors.EVENT_READ)
+    buffer = bytearray(65536)
+    while not stop.is_set():
+        for key, mask in selector.select(timeout=0.1):
+            counter[0] += key.fileobj.recv_into(buffer)
+    selector.close()
+
+
+def run_benchmark(use_event_loop: bool, args) -> dict:
+    """ Runs the benchmark against one engine and returns the results. """
+    ports_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_server,
+                                     args=(use_event_loop, ports_queue))
+    server.start()
+    try:
+        ports = ports_queue.get(timeout=10)
+        idle_stats = get_process_stats(server.pid)
+        sockets = connect_participants(ports, args.meetings,
+                                       args.participants)
+        time.sleep(1)  # let the server register all the participants
+
+        payload = os.urandom(args.payload)
+        stop = threading.Event()
+        sent, received_bytes = [0], [0]
+        threads = [
+            threading.Thread(target=send_loop,
+                             args=(sockets, payload, stop, sent)),
+            threading.Thread(target=receive_loop,
+                             args=(sockets, stop, received_bytes))]
+        for t in threads:
+            t.start()
+        time.sleep(args.duration / 2)
+        load_stats = get_process_stats(server.pid)
+        time.sleep(args.duration / 2)
+        stop.set()
+        for t in threads:
+            t.join()
+        for in_socket, out_socket in sockets:
+            in_socket.close()
+            out_socket.close()
+    finally:
+        server.terminate()
+        server.join()
+
+    # each relayed message is an id packet followed by a data packet
+    relayed_msg_size = 2 * len(create_packet(b'')) + \
+        MEETING_ID_LEN + CLIENT_ID_LEN + args.payload
+    return {
+        'engine': 'event loop' if use_event_loop else 'thread per participant',
+        'idle_threads': idle_stats['threads'],
+        'threads': load_stats['threads'],
+        'rss_kb': load_stats['rss_kb'],
+        'sent_msgs_per_sec': sent[0] / args.duration,
+        'relayed_msgs_per_sec':
+            received_bytes[0] / relayed_msg_size / args.duration,
+    }
+
+
+def main():
+    """ Runs the benchmark against both engines and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--meetings', type=int, default=50)
+    parser.add_argument('--participants', type=int, default=4,
+                        help='participants per meeting')
+    parser.add_argument('--payload', type=int, default=256,
+                        help='payload size in bytes')
+    parser.add_argument('--duration', type=float, default=5,
+                        help='seconds of traffic per engine')
+    args = parser.parse_args()
+
+    for use_event_loop in (False, True):
+        results = run_benchmark(use_event_loop, args)
+        print(', '.join(f'{key}={value:.0f}' if isinstance(value, float)
+                        else f'{key}={value}'
+                        for key, value in results.items()))
+
+
+if __name__ == '__main__':
+    main()
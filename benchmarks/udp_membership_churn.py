@@ -0,0 +1,129 @@
+"""
+    Hadar Shahar
+    Measures the packets per second that a BroadcastUdpServer relays
+    on loopback while clients of many other meetings join and leave,
+    and how long each join / leave takes.
+
+    Run: python -m benchmarks.udp_membership_churn
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from benchmarks.udp_relay_scaling import IP, STARTUP_DELAY, \
+    find_free_port, run_clients
+from server.broadcast_udp_server import BroadcastUdpServer
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+
+# the churn meetings ids start after the ids of the meetings with traffic
+CHURN_FIRST_MEETING = 10 ** 6
+
+
+def churn_loop(relay: BroadcastUdpServer, num_meetings: int,
+               clients_per_meeting: int, rate: float,
+               stop_event: threading.Event) -> list:
+    """
+    Adds and removes clients of the churn meetings, alternately,
+    a given number of times per second (as fast as possible if rate is 0).
+    :returns: the duration of each join / leave.
+    """
+    full_ids = [
+        (CHURN_FIRST_MEETING + m).to_bytes(MEETING_ID_LEN, 'big') +
+        c.to_bytes(CLIENT_ID_LEN, 'big')
+        for m in range(num_meetings) for c in range(clients_per_meeting)]
+    # nothing is sent to these addresses, because the churn clients
+    # don't send any packets
+    address = (IP, 9)
+    durations = []
+    joined = False
+    interval = 1 / rate if rate else 0
+    next_time = time.perf_counter()
+    while not stop_event.is_set():
+        joined = not joined
+        for full_id in full_ids:
+            if stop_event.is_set():
+                break
+            start = time.perf_counter()
+            if joined:
+                relay.add_client(full_id[:MEETING_ID_LEN],
+                                 full_id[MEETING_ID_LEN:], address)
+            else:
+                relay.remove_client(full_id)
+            durations.append(time.perf_counter() - start)
+
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    return durations
+
+
+def run_benchmark(churn_rate: float, args) -> (float, float, float):
+    """
+    Runs the benchmark with a given churn rate (None = without churn).
+    :returns: (relayed packets per second, joins and leaves per second,
+               the maximum duration of a join / leave in ms)
+    """
+    ports = (find_free_port(), find_free_port())
+    relay = BroadcastUdpServer(IP, *ports, 'benchmark', lambda client_id: True)
+    relay.daemon = True
+    relay.start()
+    time.sleep(STARTUP_DELAY)
+
+    stop_event = threading.Event()
+    durations = []
+    churn_thread = threading.Thread(target=lambda: durations.extend(
+        churn_loop(relay, args.churn_meetings, args.participants,
+                   churn_rate, stop_event)))
+    if churn_rate is not None:
+        churn_thread.start()
+
+    results = multiprocessing.Queue()
+    clients = multiprocessing.Process(target=run_clients, args=(
+        ports, 0, args.meetings, args.participants, args.payload,
+        args.duration, results))
+    clients.start()
+    sent, received = results.get()
+    clients.join()
+
+    stop_event.set()
+    if churn_rate is not None:
+        churn_thread.join()
+    # the clients process adds its clients for a second before sending
+    churn_per_sec = len(durations) / (args.duration + 1)
+    max_ms = max(durations, default=0) * 1000
+    return received / args.duration, churn_per_sec, max_ms
+
+
+def main():
+    """ Runs the benchmark with each churn rate. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rates', type=float, nargs='+',
+                        default=[100, 1000, 0],
+                        help='joins and leaves per second (0 = unlimited)')
+    parser.add_argument('--meetings', type=int, default=20,
+                        help='meetings that send packets')
+    parser.add_argument('--churn-meetings', type=int, default=250,
+                        help='meetings whose clients join and leave')
+    parser.add_argument('--participants', type=int, default=4,
+                        help='participants per meeting')
+    parser.add_argument('--payload', type=int, default=1024,
+                        help='payload size in bytes')
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+
+    # the relay prints on every join
+    sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+    print(f'cores={os.cpu_count()}', file=stdout)
+    for rate in [None] + args.rates:
+        relayed, churn_per_sec, max_ms = run_benchmark(rate, args)
+        name = 'no churn' if rate is None else f'churn rate={rate:.0f}'
+        print(f'{name}: relayed/s={relayed:.0f}, '
+              f'joins+leaves/s={churn_per_sec:.0f}, '
+              f'max join/leave={max_ms:.2f}ms', file=stdout)
+
+
+if __name__ == '__main__':
+    main()
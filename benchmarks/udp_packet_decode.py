@@ -0,0 +1,115 @@
+"""
+    Hadar Shahar
+    Compares decoding video packets with the UdpPacket before it had
+    __slots__ (it packed the header again on decode), to UdpPacket.decode
+    and UdpPacket.decode_batch: the packets per second, the memory of the
+    decoded packets (without their data) and the garbage collections.
+
+    Run: python -m benchmarks.udp_packet_decode
+"""
+import argparse
+import gc
+import os
+import struct
+import time
+import tracemalloc
+from client.video.udp_packet import UdpPacket
+from client.video.udp_packets_handler import UdpPacketsHandler
+
+
+class LegacyUdpPacket:
+    """
+    Definition of the class LegacyUdpPacket.
+    The UdpPacket before it had __slots__.
+    """
+
+    def __init__(self, frame_index: int, packet_index: int,
+                 num_packets: int, data: bytes, layer: int = 0,
+                 num_parity: int = 0):
+        """ Constructor. """
+        self.layer = layer
+        self.frame_index = frame_index
+        self.packet_index = packet_index
+        self.num_packets = num_packets
+        self.num_parity = num_parity
+        self.data_size = len(data)
+        self.data = data
+        header_format = (self.layer, self.frame_index, self.packet_index,
+                         self.num_packets, self.num_parity, self.data_size)
+        self.header = struct.pack(UdpPacket.BYTES_FORMAT, *header_format)
+
+    @staticmethod
+    def decode(packet: bytes):
+        """ Decodes a given packet. """
+        try:
+            raw_header = packet[:UdpPacket.HEADER_SIZE]
+            layer, frame_index, packet_index, num_packets, num_parity, \
+                data_size = struct.unpack(UdpPacket.BYTES_FORMAT, raw_header)
+            data = packet[UdpPacket.HEADER_SIZE:
+                          UdpPacket.HEADER_SIZE + data_size]
+            return LegacyUdpPacket(frame_index, packet_index, num_packets,
+                                   data, layer, num_parity)
+        except Exception as e:
+            print('Invalid UdpPacket:', e)
+            return None
+
+
+def measure(decode_all, datagrams: list, rounds: int) -> dict:
+    """
+    Returns the packets per second of a given decoding function,
+    the memory per decoded packet and the collections of generation 0.
+    """
+    # the memory of the decoded packets, without their data
+    # (the data is the same in all the ways)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    decoded = decode_all(datagrams)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    data_size = sum(len(p.data) + 33 for p in decoded)  # 33: bytes object
+    per_packet = (after - before - data_size) / len(decoded)
+    del decoded
+
+    gc.collect()
+    collections = gc.get_stats()[0]['collections']
+    start = time.perf_counter()
+    for _ in range(rounds):
+        # the decoded packets are kept, like in the frame buffers
+        decode_all(datagrams)
+    elapsed = time.perf_counter() - start
+    return {'packets/s': len(datagrams) * rounds / elapsed,
+            'bytes/packet': per_packet,
+            'gen0 collections': gc.get_stats()[0]['collections'] -
+            collections}
+
+
+def main():
+    """ Runs all the ways and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--packets', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    # full packets of several frames, like the received datagrams
+    chunk_size = UdpPacket.MAX_DATA_SIZE - UdpPacket.HEADER_SIZE
+    datagrams = []
+    frame_index = 0
+    while len(datagrams) < args.packets:
+        datagrams += [p.encode() for p in UdpPacketsHandler.create_packets(
+            frame_index, os.urandom(chunk_size * 100))]
+        frame_index += 1
+    datagrams = datagrams[:args.packets]
+
+    ways = (('legacy decode', lambda batch: [LegacyUdpPacket.decode(d)
+                                             for d in batch]),
+            ('decode', lambda batch: [UdpPacket.decode(d) for d in batch]),
+            ('decode_batch', UdpPacket.decode_batch))
+    print(f'{args.packets} packets x {args.rounds} rounds')
+    for name, decode_all in ways:
+        stats = measure(decode_all, datagrams, args.rounds)
+        print(f'{name}: ' + ', '.join(f'{key}={value:,.0f}'
+                                      for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+    Hadar Shahar
+    Compares the packets per second that a BroadcastUdpServer relays
+    on loopback, receiving one datagram per iteration (receive_and_broadcast)
+    and receiving in batches (BatchedUdpServer, which was removed from the
+    server since it wasn't faster, and is kept here so the comparison can
+    be repeated).
+
+    Run: python -m benchmarks.udp_receive_batching
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from benchmarks.udp_relay_scaling import IP, STARTUP_DELAY, \
+    find_free_port, run_clients
+from network.constants import NETWORK_BYTES_PER_NUM, \
+    UDP_SOCKET_BUFFER_SIZE, UDP_NEW_CLIENT_MSG
+from server.broadcast_udp_server import BroadcastUdpServer
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+
+
+class BatchedUdpServer(BroadcastUdpServer):
+    """
+    Definition of the class BatchedUdpServer.
+    Receives all the datagrams that are ready (up to RECEIVE_BATCH_SIZE)
+    into a preallocated ring of buffers, and then broadcasts all of them
+    in one pass, as memoryviews of the buffers (so they aren't copied).
+    Python has no recvmmsg, so every datagram still takes its own system
+    call, and every batch takes another one that finds the socket empty.
+    """
+
+    # the maximum number of datagrams received in each batch
+    RECEIVE_BATCH_SIZE = 64
+
+    def run(self):
+        """ Receives and broadcasts the datagrams in batches. """
+        views = [memoryview(bytearray(UDP_SOCKET_BUFFER_SIZE))
+                 for _ in range(BatchedUdpServer.RECEIVE_BATCH_SIZE)]
+        # (view index, datagram size, client address)
+        batch = []
+        n = NETWORK_BYTES_PER_NUM
+        unpack_id_len = BroadcastUdpServer.ID_LEN_STRUCT.unpack_from
+        try:
+            while True:
+                # blocks until the first datagram is received
+                batch.append((0, *self.in_socket.recvfrom_into(views[0])))
+                try:
+                    for i in range(1, BatchedUdpServer.RECEIVE_BATCH_SIZE):
+                        batch.append((i, *self.in_socket.recvfrom_into(
+                            views[i], 0, socket.MSG_DONTWAIT)))
+                except BlockingIOError:
+                    pass
+
+                # the same snapshot is used for the whole batch
+                recipients_by_id = self.recipients
+                for i, size, client_address in batch:
+                    view = views[i]
+                    id_len = unpack_id_len(view)[0]
+                    received_id = bytes(view[n: n + id_len])
+
+                    recipients = recipients_by_id.get(received_id)
+                    if recipients is not None:
+                        sent = self.broadcast(received_id, recipients,
+                                              view[:size])
+                        self.count_packet(received_id, size, sent)
+                    elif len(received_id) == MEETING_ID_LEN + \
+                            CLIENT_ID_LEN and \
+                            view[n + id_len: min(
+                                size, n + id_len + len(UDP_NEW_CLIENT_MSG))] \
+                            == UDP_NEW_CLIENT_MSG:
+                        self.add_new_client(received_id[:MEETING_ID_LEN],
+                                            received_id[MEETING_ID_LEN:],
+                                            client_address)
+                        recipients_by_id = self.recipients
+                batch.clear()
+
+        except socket.error as e:
+            print(f'{self.server_name} BatchedUdpServer.run: {e}')
+
+
+def get_thread_cpu_time(native_id: int) -> float:
+    """
+    Returns the CPU time (in seconds) of a thread of this process.
+    It's read from /proc, so it's None if it's not available.
+    """
+    try:
+        with open(f'/proc/self/task/{native_id}/stat') as f:
+            # the fields after the thread name, utime and stime are
+            # the 14th and 15th fields of the whole line
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def run_benchmark(batched: bool, args) -> (float, float, float):
+    """
+    Runs the benchmark in a given mode.
+    :returns: (sent packets per second, relayed packets per second,
+               the relay CPU time per received packet in microseconds)
+    """
+    ports = (find_free_port(), find_free_port())
+    server_class = BatchedUdpServer if batched else BroadcastUdpServer
+    relay = server_class(IP, *ports, 'benchmark', lambda client_id: True)
+    relay.daemon = True
+    relay.start()
+    time.sleep(STARTUP_DELAY)
+    start_cpu_time = get_thread_cpu_time(relay.native_id)
+
+    # each client sends a packet in every iteration,
+    # so the relay receives bursts of (meetings * participants) packets
+    results = multiprocessing.Queue()
+    clients = multiprocessing.Process(target=run_clients, args=(
+        ports, 0, args.meetings, args.participants, args.payload,
+        args.duration, results))
+    clients.start()
+    sent, received = results.get()
+    clients.join()
+
+    cpu_time_per_packet = None
+    end_cpu_time = get_thread_cpu_time(relay.native_id)
+    if start_cpu_time is not None and end_cpu_time is not None:
+        # every received packet is relayed to (participants - 1) clients
+        received_by_relay = received / max(1, args.participants - 1)
+        cpu_time_per_packet = \
+            (end_cpu_time - start_cpu_time) / received_by_relay * 1e6
+    return sent / args.duration, received / args.duration, \
+        cpu_time_per_packet
+
+
+def main():
+    """ Runs the benchmark in each mode. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--meetings', type=int, default=20)
+    parser.add_argument('--participants', type=int, default=4,
+                        help='participants per meeting')
+    parser.add_argument('--payload', type=int, default=1024,
+                        help='payload size in bytes')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--rounds', type=int, default=2,
+                        help='the number of times to run each mode')
+    args = parser.parse_args()
+    if not hasattr(socket, 'MSG_DONTWAIT'):
+        print('MSG_DONTWAIT is needed for the batches.')
+        return
+
+    # the relay prints on every join
+    sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+    print(f'cores={os.cpu_count()}', file=stdout)
+    for _ in range(args.rounds):
+        for batched in (False, True):
+            sent, relayed, cpu_time = run_benchmark(batched, args)
+            name = 'batched' if batched else 'one per iteration'
+            cpu_time = 'n/a' if cpu_time is None else f'{cpu_time:.1f}us'
+            print(f'{name}: sent/s={sent:.0f}, relayed/s={relayed:.0f}, '
+                  f'relay cpu per packet={cpu_time}', file=stdout)
+
+
+if __name__ == '__main__':
+    main()
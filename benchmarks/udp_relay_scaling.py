@@ -0,0 +1,152 @@
+"""
+    Hadar Shahar
+    Measures the packets per second that the udp relay forwards
+    on loopback, with a different number of worker processes
+    (0 workers = a single BroadcastUdpServer thread), and with the
+    meetings sharded between the workers (--shard-meetings, the packets
+    of other workers' meetings are forwarded to them).
+
+    Run: python -m benchmarks.udp_relay_scaling
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import time
+from network.constants import NETWORK_BYTES_FORMAT, UDP_NEW_CLIENT_MSG
+from server.broadcast_udp_server import BroadcastUdpServer
+from server.multi_process_udp_server import MultiProcessUdpServer
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+
+IP = '127.0.0.1'
+
+# the time it takes the relay (and its worker processes) to start
+STARTUP_DELAY = 3
+
+
+def find_free_port() -> int:
+    """ Returns a udp port that isn't in use. """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((IP, 0))
+        return sock.getsockname()[1]
+
+
+def create_relay(num_workers: int, client_in_port: int,
+                 client_out_port: int, shard_meetings=False):
+    """ Creates the relay with a given number of workers. """
+    if num_workers:
+        return MultiProcessUdpServer(IP, client_in_port, client_out_port,
+                                     'benchmark', lambda client_id: True,
+                                     num_workers,
+                                     shard_meetings=shard_meetings)
+    return BroadcastUdpServer(IP, client_in_port, client_out_port,
+                              'benchmark', lambda client_id: True)
+
+
+def pack_data(full_id: bytes, data: bytes) -> bytes:
+    """ Packs the data like BasicUdpClient.pack_data. """
+    return struct.pack(NETWORK_BYTES_FORMAT, len(full_id)) + full_id + data
+
+
+def run_clients(ports: (int, int), first_meeting: int, num_meetings: int,
+                clients_per_meeting: int, payload_size: int,
+                duration: float, results: multiprocessing.Queue):
+    """
+    Runs the clients of some of the meetings (in a separate process),
+    each one sends packets as fast as it can.
+    Puts the number of sent and received packets in the results queue.
+    """
+    client_in_port, client_out_port = ports
+    server_in_address = (IP, client_out_port)
+    clients = []
+    for meeting_index in range(first_meeting, first_meeting + num_meetings):
+        meeting_id = meeting_index.to_bytes(MEETING_ID_LEN, 'big')
+        for client_index in range(clients_per_meeting):
+            full_id = meeting_id + client_index.to_bytes(CLIENT_ID_LEN, 'big')
+            in_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            in_socket.setblocking(False)
+            out_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            in_socket.sendto(pack_data(full_id, UDP_NEW_CLIENT_MSG),
+                             server_in_address)
+            packet = pack_data(full_id, os.urandom(payload_size))
+            clients.append((in_socket, out_socket, packet))
+    time.sleep(1)  # let the relay add the clients
+
+    sent = received = 0
+    end_time = time.perf_counter() + duration
+    while time.perf_counter() < end_time:
+        for in_socket, out_socket, packet in clients:
+            out_socket.sendto(packet, server_in_address)
+        sent += len(clients)
+        for in_socket, out_socket, packet in clients:
+            try:
+                while True:
+                    in_socket.recv(65536)
+                    received += 1
+            except BlockingIOError:
+                pass
+    results.put((sent, received))
+
+
+def run_benchmark(num_workers: int, args) -> (float, float):
+    """
+    Runs the benchmark with a given number of workers.
+    :returns: (sent packets per second, relayed packets per second)
+    """
+    ports = (find_free_port(), find_free_port())
+    relay = create_relay(num_workers, *ports, args.shard_meetings)
+    relay.daemon = True
+    relay.start()
+    time.sleep(STARTUP_DELAY)
+
+    results = multiprocessing.Queue()
+    meetings_per_process = args.meetings // args.client_processes
+    clients = [multiprocessing.Process(target=run_clients, args=(
+        ports, i * meetings_per_process, meetings_per_process,
+        args.participants, args.payload, args.duration, results))
+        for i in range(args.client_processes)]
+    for process in clients:
+        process.start()
+    totals = [results.get() for _ in clients]
+    for process in clients:
+        process.join()
+    if num_workers:
+        relay.close()
+
+    sent = sum(s for s, r in totals)
+    received = sum(r for s, r in totals)
+    return sent / args.duration, received / args.duration
+
+
+def main():
+    """ Runs the benchmark with each number of workers. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[0, 1, 2, 4])
+    parser.add_argument('--meetings', type=int, default=20)
+    parser.add_argument('--participants', type=int, default=4,
+                        help='participants per meeting')
+    parser.add_argument('--payload', type=int, default=1024,
+                        help='payload size in bytes')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--client-processes', type=int, default=2)
+    parser.add_argument('--shard-meetings', action='store_true')
+    args = parser.parse_args()
+
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        print('SO_REUSEPORT is not available, running without workers.')
+        args.workers = [0]
+
+    # the relay prints on every join
+    sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+    print(f'cores={os.cpu_count()}', file=stdout)
+    for num_workers in args.workers:
+        sent, relayed = run_benchmark(num_workers, args)
+        print(f'workers={num_workers}, sent/s={sent:.0f}, '
+              f'relayed/s={relayed:.0f}', file=stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+    Hadar Shahar
+    Compares the frame rate and the latency of capturing, encoding and
+    sending 1080p frames one after the other in a single thread, to
+    running the stages in a VideoPipeline.
+
+    The capture is emulated by sleeping (like a screenshot, which waits
+    for the display server) and by moving a synthetic screen.
+    The frames are encoded as JPEG (like the clients), or with zlib where
+    cv2 isn't available (zlib releases the GIL too).
+
+    Run: python -m benchmarks.video_pipeline [--codec zlib]
+"""
+import argparse
+import socket
+import time
+import zlib
+import numpy as np
+from client.video.frame_scheduler import FrameScheduler
+from client.video.packet_pacer import PacketPacer
+from client.video.udp_packets_handler import UdpPacketsHandler
+from client.video.video_pipeline import VideoPipeline
+
+# like BasicUdpVideoClient.PACING_FRACTION
+PACING_FRACTION = 0.8
+
+
+class SyntheticSource(object):
+    """
+    Definition of the class SyntheticSource.
+    Captures, encodes and sends synthetic frames.
+    """
+
+    def __init__(self, args):
+        """ Constructor. """
+        self.args = args
+        height, width = args.height, args.width
+        # a smooth screen with some details, which is moved every frame
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, np.newaxis]
+        rng = np.random.default_rng(1)
+        base = (x + y) / 2 + rng.normal(0, 2, (height, width))
+        self.screen = np.clip(base, 0, 255).astype(np.uint8)[..., np.newaxis]
+        self.screen = np.repeat(self.screen, 3, axis=2)
+        self.frame_count = 0
+
+        if args.codec == 'jpeg':
+            from client.video.video_encoder import VideoEncoder
+            self.encode_data = VideoEncoder.encode_frame
+        else:
+            self.encode_data = lambda frame: zlib.compress(frame, 1)
+
+        # the packets are sent to a socket that doesn't read them
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(('127.0.0.1', 0))
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.frame_index = 0
+
+    def capture(self) -> np.ndarray:
+        """ Returns the next frame. """
+        time.sleep(self.args.capture_ms / 1000)
+        self.frame_count += 1
+        return np.roll(self.screen, self.frame_count * 8, axis=1)
+
+    def encode(self, frame: np.ndarray) -> list:
+        """ Returns the encoded frame (a single layer). """
+        return [self.encode_data(frame)]
+
+    def send(self, layers: list):
+        """ Sends the encoded frame, paced over the frame interval. """
+        address = self.receiver.getsockname()
+        packets = [p.encode() for data in layers
+                   for p in UdpPacketsHandler.create_packets(
+                       self.frame_index, data)]
+        PacketPacer.send(packets,
+                         lambda packet: self.sender.sendto(packet, address),
+                         PACING_FRACTION / self.args.fps)
+        self.frame_index += 1
+
+
+def run_serial(args) -> dict:
+    """
+    Runs the stages one after the other in a single thread
+    (like the clients did before the VideoPipeline).
+    """
+    source = SyntheticSource(args)
+    scheduler = FrameScheduler()
+    latencies = []
+    end_time = time.monotonic() + args.duration
+    while time.monotonic() < end_time:
+        scheduler.wait(args.fps)
+        start = time.monotonic()
+        source.send(source.encode(source.capture()))
+        latencies.append(time.monotonic() - start)
+    return {'fps': len(latencies) / args.duration,
+            'total_ms': np.mean(latencies) * 1000}
+
+
+def run_pipeline(args) -> dict:
+    """ Runs the stages in a VideoPipeline. """
+    source = SyntheticSource(args)
+    pipeline = VideoPipeline(lambda: args.fps, source.capture,
+                             lambda frame: frame, source.encode, source.send)
+    end_time = time.monotonic() + args.duration
+    pipeline.stats()  # starts counting the frames
+    pipeline.run(lambda: time.monotonic() < end_time)
+    return pipeline.stats()
+
+
+def main():
+    """ Runs both and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--codec', choices=('jpeg', 'zlib'), default='jpeg')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--capture-ms', type=float, default=15)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f'{args.width}x{args.height}, target {args.fps:.0f} fps, '
+          f'capture {args.capture_ms:.0f}ms, {args.codec}, '
+          f'{VideoPipeline.ENCODE_THREADS} encode threads')
+    for name, run in (('serial', run_serial), ('pipeline', run_pipeline)):
+        stats = run(args)
+        print(f'{name}: ' + ', '.join(
+            f'{key}={value:.1f}' for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+    Hadar Shahar
+    Compares the old silence check of AudioStream.is_silent (the max
+    sample of an array('h'), against a fixed threshold) to the
+    VoiceActivityDetector:
+    - the time it takes to process each chunk (and the NumPy is_silent).
+    - the chunks they send, in a synthetic scene: a voice that talks in
+      spurts (with pauses between the syllables, and quiet word endings),
+      over a quiet room, and then over a fan that's louder than the
+      fixed threshold. The speech is the chunks of the spurts (their
+      pauses included), so the sent speech is the part of it that's
+      played, and the sent noise is wasted bandwidth.
+
+    Run: python -m benchmarks.voice_activity
+"""
+import argparse
+import time
+from array import array
+import numpy as np
+from benchmarks.audio_codecs import create_voice
+from client.audio.voice_activity_detector import VoiceActivityDetector
+
+# like AudioStream (which needs pyaudio)
+CHUNK = 1024
+RATE = 44100
+SILENT_THRESHOLD = 500
+
+# the talk spurts and the silences between them (in seconds)
+SPURT = 2
+SILENCE = 1.5
+
+
+def legacy_is_silent(data: bytes) -> bool:
+    """ AudioStream.is_silent before the VoiceActivityDetector. """
+    if data == b'':
+        return True
+    # convert the data to array of signed shorts (closer to 0 is quieter)
+    data = array('h', data)
+    return max(data) < SILENT_THRESHOLD
+
+
+def is_silent(data: bytes) -> bool:
+    """ Like AudioStream.is_silent (which needs pyaudio). """
+    if data == b'':
+        return True
+    samples = np.frombuffer(data, dtype=np.int16)
+    return samples.max() < SILENT_THRESHOLD and \
+        samples.min() > -SILENT_THRESHOLD
+
+
+def create_scene(args) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Returns the samples of the scene, whether each chunk is speech,
+    and whether the fan is on in each chunk.
+    """
+    rng = np.random.default_rng(args.seed)
+    n = int(args.duration * RATE) // CHUNK * CHUNK
+    t = np.arange(n) / RATE
+    talking = t % (SPURT + SILENCE) < SPURT
+    voice = create_voice(args.duration, args.seed)[:n] * \
+        (args.voice_peak / 20000) * talking
+
+    room = rng.normal(0, args.room_noise, n)
+    # a fan: low-passed noise (a moving average) that's steady
+    fan = np.convolve(rng.normal(0, 1, n), np.ones(8) / 8, 'same')
+    fan *= args.fan_noise / fan.std()
+    fan_on = t >= args.fan_start
+    samples = np.clip(voice + room + fan * fan_on, -32768, 32767).astype(
+        np.int16)
+    return samples, talking[::CHUNK], fan_on[::CHUNK]
+
+
+def measure_time(check, chunks: list, rounds: int) -> float:
+    """ Returns the time a function takes per chunk (in seconds). """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for chunk in chunks:
+            check(chunk)
+    return (time.perf_counter() - start) / rounds / len(chunks)
+
+
+def main():
+    """ Runs both ways and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=40)
+    parser.add_argument('--fan-start', type=float, default=20,
+                        help='the time the fan starts (in seconds)')
+    parser.add_argument('--voice-peak', type=float, default=8000)
+    parser.add_argument('--room-noise', type=float, default=30,
+                        help='the standard deviation of the room noise')
+    parser.add_argument('--fan-noise', type=float, default=400,
+                        help='the standard deviation of the fan noise')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    samples, is_speech, fan_on = create_scene(args)
+    chunks = [samples[i: i + CHUNK].tobytes()
+              for i in range(0, len(samples), CHUNK)]
+
+    print('us per chunk: ' + ', '.join(
+        f'{name}={measure_time(check, chunks, args.rounds) * 1e6:.1f}'
+        for name, check in (
+            ('legacy is_silent', legacy_is_silent),
+            ('is_silent', is_silent),
+            ('vad', VoiceActivityDetector().process))))
+
+    vad = VoiceActivityDetector()
+    ways = (('legacy is_silent',
+             np.array([not legacy_is_silent(c) for c in chunks])),
+            ('vad', np.array([vad.process(c) for c in chunks])))
+    for name, sent in ways:
+        print(f'{name}:')
+        for title, part in (('quiet room', ~fan_on), ('fan', fan_on)):
+            speech = is_speech & part
+            noise = ~is_speech & part
+            print(f'  {title}: '
+                  f'sent speech={sent[speech].mean():.2f}, '
+                  f'sent noise={sent[noise].mean():.2f}, '
+                  f'sent={sent[part].mean():.2f} of the chunks')
+
+
+if __name__ == '__main__':
+    main()
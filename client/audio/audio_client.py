@@ -2,14 +2,39 @@
     Hadar Shahar
     The audio client code.
 """
+import threading
+import time
+from collections import deque
+import numpy as np
+from PyQt5.QtCore import pyqtSignal
 from client.network_constants import Constants
 from client.basic_udp_client import BasicUdpClient
 from client.audio.audio_stream import AudioStream
+from client.audio.voice_activity_detector import VoiceActivityDetector
+from network.audio.audio_codecs import create_codec
+from network.audio.audio_packet import AudioPacket
+from network.audio.jitter_buffer import JitterBuffer
+from network.audio.mulaw_codec import MuLawCodec
 
 
 class AudioClient(BasicUdpClient):
     """ Definition of the class AudioClient. """
 
+    # this signal is emitted when the user starts or stops speaking
+    speaking_changed = pyqtSignal(bool)  # is speaking
+
+    # the codec of the sent audio (see audio_codecs),
+    # the received audio is decoded by the codec id of each chunk
+    CODEC_ID = MuLawCodec.CODEC_ID
+
+    # the jitter buffer of a sender that hasn't sent anything
+    # for that long (in seconds) is removed
+    IDLE_TIMEOUT = 10
+
+    # the VoiceActivityDetector starts the speech only after its ATTACK,
+    # so the last chunks before it are sent when it starts
+    PRE_ROLL_CHUNKS = 2
+
     def __init__(self, client_id: bytes):
         """ Constructor. """
         super(AudioClient, self).__init__(
@@ -17,6 +42,19 @@ class AudioClient(BasicUdpClient):
             Constants.CLIENT_OUT_AUDIO_PORT, client_id)
         self.in_stream = AudioStream(input=True, output=False)
         self.out_stream = AudioStream(input=False, output=True)
+        self.encoder = create_codec(AudioClient.CODEC_ID)
+        # the sequence number of the next sent packet, and the timestamp
+        # of the next read chunk (see AudioPacket)
+        self.sequence = 0
+        self.timestamp = 0
+        self.vad = VoiceActivityDetector()
+        # the last (timestamp, chunk) that weren't sent
+        self.pre_roll = deque(maxlen=AudioClient.PRE_ROLL_CHUNKS)
+        # { sender id: JitterBuffer }, the buffers are added by the
+        # receiving thread, and played (and removed) by the playout thread,
+        # the dict is changed while holding jitter_buffers_lock
+        self.jitter_buffers = {}
+        self.jitter_buffers_lock = threading.Lock()
 
     def send_data_loop(self):
         """
@@ -34,27 +72,111 @@ class AudioClient(BasicUdpClient):
                 print('Recreating the input stream...')
                 self.in_stream = AudioStream(input=True, output=False)
                 continue
-            if not AudioStream.is_silent(chunk):
-                self.send_data(chunk)
+            was_speaking = self.vad.is_speaking
+            if self.vad.process(chunk):
+                for timestamp, silent_chunk in self.pre_roll:
+                    self.send_chunk(timestamp, silent_chunk)
+                self.pre_roll.clear()
+                self.send_chunk(self.timestamp, chunk)
+            else:
+                self.pre_roll.append((self.timestamp, chunk))
+            if self.vad.is_speaking != was_speaking:
+                self.speaking_changed.emit(self.vad.is_speaking)
+            # the silent chunks advance the timestamp too
+            self.timestamp = AudioPacket.advance(self.timestamp,
+                                                 len(chunk) // 2)
+
+    def send_chunk(self, timestamp: int, chunk: bytes):
+        """ Encodes a chunk and sends it in the next packet. """
+        packet = AudioPacket(self.sequence, timestamp,
+                             self.encoder.encode(chunk))
+        self.send_data(packet.encode())
+        self.sequence = AudioPacket.advance(self.sequence)
 
     def receive_data_loop(self):
         """
-        Receives each audio chunk from the server
-        and writes it to an output stream (plays it).
+        Receives each audio packet from the server and puts it in
+        the jitter buffer of its sender, they are played by the
+        playout thread.
         """
+        threading.Thread(target=self.catch_exception,
+                         args=(self.playout_loop,)).start()
         while self.running:
             sender_id, data = self.receive_data()
             if data is not None:
-                try:
-                    self.out_stream.write(data)
-                except OSError as e:
-                    # [Errno -9999] Unanticipated host error
-                    # occurs if 2 clients are running on the same computer
-                    # recreating the stream fixes it
-                    print('AudioClient.receive_data_loop:', e)
-                    self.out_stream.close()
-                    print('Recreating the stream...')
-                    self.out_stream = AudioStream(input=False, output=True)
+                packet = AudioPacket.decode(data)
+                if packet is None:
+                    continue
+                # put while holding the lock, so the playout thread
+                # doesn't remove the buffer before the packet is in it
+                with self.jitter_buffers_lock:
+                    jitter_buffer = self.jitter_buffers.get(sender_id)
+                    if jitter_buffer is None:
+                        jitter_buffer = JitterBuffer()
+                        self.jitter_buffers[sender_id] = jitter_buffer
+                    jitter_buffer.put(packet)
+
+    def playout_loop(self):
+        """
+        Mixes a chunk of all the senders that are playing and writes it
+        to the output stream (plays it), in a loop. Writing blocks until
+        the stream has room for it, so the stream is the playout clock.
+        """
+        silence = bytes(AudioStream.CHUNK * 2)
+        while self.running:
+            now = time.monotonic()
+            chunks = []
+            idle_senders = []
+            with self.jitter_buffers_lock:
+                jitter_buffers = list(self.jitter_buffers.items())
+            for sender_id, jitter_buffer in jitter_buffers:
+                samples = jitter_buffer.read(AudioStream.CHUNK, now)
+                if samples is not None:
+                    chunks.append(samples)
+                elif now - jitter_buffer.last_arrival_time > \
+                        AudioClient.IDLE_TIMEOUT:
+                    idle_senders.append(sender_id)
+            if idle_senders:
+                self.remove_idle_senders(idle_senders)
+            if chunks:
+                # int32, so it doesn't overflow before clipping
+                mixed = np.sum(chunks, axis=0, dtype=np.int32)
+                chunk = np.clip(mixed, -32768, 32767).astype(
+                    np.int16).tobytes()
+            else:
+                chunk = silence
+            try:
+                self.out_stream.write(chunk)
+            except OSError as e:
+                # [Errno -9999] Unanticipated host error
+                # occurs if 2 clients are running on the same computer
+                # recreating the stream fixes it
+                print('AudioClient.playout_loop:', e)
+                self.out_stream.close()
+                print('Recreating the stream...')
+                self.out_stream = AudioStream(input=False, output=True)
+
+    def remove_idle_senders(self, senders_ids: list):
+        """
+        Removes the jitter buffers of the given senders,
+        unless a packet arrived since they were found idle.
+        """
+        now = time.monotonic()
+        with self.jitter_buffers_lock:
+            for sender_id in senders_ids:
+                if now - self.jitter_buffers[sender_id].last_arrival_time > \
+                        AudioClient.IDLE_TIMEOUT:
+                    del self.jitter_buffers[sender_id]
+
+    def stats(self) -> dict:
+        """
+        Returns the stats of the jitter buffer of each sender
+        (see JitterBuffer.stats).
+        """
+        with self.jitter_buffers_lock:
+            jitter_buffers = list(self.jitter_buffers.items())
+        return {sender_id: jitter_buffer.stats()
+                for sender_id, jitter_buffer in jitter_buffers}
 
     def close(self):
         """ Closes the streams. """
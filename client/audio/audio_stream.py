@@ -4,8 +4,8 @@
 """
 import pyaudio
 import wave
-from array import array
 import threading
+import numpy as np
 
 
 class AudioStream(object):
@@ -16,8 +16,9 @@ class AudioStream(object):
     CHANNELS = 1              # this value is 2 in the documentation example
     RATE = 44100              # record at 44100 samples per second
 
-    # if the max number in a chunk is less than this threshold,
+    # if the max amplitude in a chunk is less than this threshold,
     # this chunk is considered silent
+    # (AudioClient uses a VoiceActivityDetector instead)
     SILENT_THRESHOLD = 500
 
     def __init__(self, input=True, output=True):
@@ -72,9 +73,11 @@ class AudioStream(object):
         """
         if data == b'':
             return True
-        # convert the data to array of signed shorts (closer to 0 is quieter)
-        data = array('h', data)
-        return max(data) < AudioStream.SILENT_THRESHOLD
+        # signed shorts (closer to 0 is quieter), the negative peaks count
+        # too (without np.abs, which overflows on -32768)
+        samples = np.frombuffer(data, dtype=np.int16)
+        return samples.max() < AudioStream.SILENT_THRESHOLD and \
+            samples.min() > -AudioStream.SILENT_THRESHOLD
 
 
 # ==================================================================== testing
@@ -0,0 +1,115 @@
+"""
+    Hadar Shahar
+    VoiceActivityDetector.
+"""
+from collections import deque
+import numpy as np
+
+
+class VoiceActivityDetector(object):
+    """
+    Definition of the class VoiceActivityDetector.
+
+    Decides whether each chunk of the microphone has speech in it, by
+    the level of the chunk (its RMS in dB) above the noise floor.
+    The noise floor follows the quietest levels: it drops at once to a
+    quieter level, and rises slowly (so the speech doesn't raise it),
+    unless the level has been steady for STEADY_DURATION (like a fan),
+    then it rises quickly to that level.
+    The speaking probability grows with the level above the floor.
+    Speech starts after ATTACK seconds of probable speech (so a click
+    doesn't start it), and stops after HANGOVER seconds without it (so
+    the ends of words and the short pauses aren't cut).
+    Each VoiceActivityDetector follows a single stream.
+    """
+
+    # the sample rate of the stream (AudioStream.RATE)
+    RATE = 44100
+
+    # the level (in dB) above the noise floor at which the speaking
+    # probability is 0.5, and how quickly it grows around it
+    SPEECH_SNR = 9
+    SNR_SLOPE = 2
+    # quieter chunks (in dB, 20 * log10 of the RMS) are never speech
+    MIN_SPEECH_LEVEL = 40
+
+    # the rate at which the noise floor rises (in dB per second)
+    FLOOR_RISE = 0.5
+    # if the levels stay within STEADY_RANGE dB for STEADY_DURATION
+    # seconds, the noise floor moves STEADY_GAIN of the way to them in
+    # every chunk
+    STEADY_RANGE = 6
+    STEADY_DURATION = 1
+    STEADY_GAIN = 0.2
+
+    # the durations of speech that start it, and of silence that stop it
+    # (in seconds)
+    ATTACK = 0.04
+    HANGOVER = 0.3
+
+    def __init__(self):
+        """ Constructor. """
+        self.noise_floor = None
+        # the levels of the last STEADY_DURATION seconds (in dB)
+        self.levels = deque()
+        self.levels_duration = 0
+
+        self.probability = 0.0
+        self.is_speaking = False
+        # the duration of the probable speech (while not speaking)
+        # and of the silence (while speaking), in seconds
+        self.speech_duration = 0
+        self.silence_duration = 0
+
+    def process(self, chunk: bytes) -> bool:
+        """ Processes the next chunk, and returns whether it's speech. """
+        samples = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
+        if len(samples) == 0:
+            return self.is_speaking
+        duration = len(samples) / VoiceActivityDetector.RATE
+        # np.dot is faster than squaring and summing
+        rms = np.sqrt(np.dot(samples, samples) / len(samples))
+        level = 20 * np.log10(rms + 1)
+        self.update_noise_floor(level, duration)
+
+        if level < VoiceActivityDetector.MIN_SPEECH_LEVEL:
+            self.probability = 0.0
+        else:
+            snr = level - self.noise_floor
+            self.probability = 1 / (1 + np.exp(
+                (VoiceActivityDetector.SPEECH_SNR - snr) /
+                VoiceActivityDetector.SNR_SLOPE))
+        self.update_state(self.probability >= 0.5, duration)
+        return self.is_speaking
+
+    def update_noise_floor(self, level: float, duration: float):
+        """ Updates the noise floor with the level of a chunk. """
+        self.levels.append(level)
+        self.levels_duration += duration
+        while self.levels_duration - duration >= \
+                VoiceActivityDetector.STEADY_DURATION:
+            self.levels.popleft()
+            self.levels_duration -= duration
+
+        if self.noise_floor is None or level < self.noise_floor:
+            self.noise_floor = level
+        elif self.levels_duration >= VoiceActivityDetector.STEADY_DURATION \
+                and max(self.levels) - min(self.levels) < \
+                VoiceActivityDetector.STEADY_RANGE:
+            self.noise_floor += (min(self.levels) - self.noise_floor) * \
+                VoiceActivityDetector.STEADY_GAIN
+        else:
+            self.noise_floor += VoiceActivityDetector.FLOOR_RISE * duration
+
+    def update_state(self, is_speech: bool, duration: float):
+        """ Starts or stops the speech (by the attack and hangover). """
+        if is_speech:
+            self.silence_duration = 0
+            self.speech_duration += duration
+            if self.speech_duration >= VoiceActivityDetector.ATTACK:
+                self.is_speaking = True
+        else:
+            self.speech_duration = 0
+            self.silence_duration += duration
+            if self.silence_duration > VoiceActivityDetector.HANGOVER:
+                self.is_speaking = False
@@ -6,7 +6,9 @@ import socket
 from abc import ABC
 from client.basic_client import BasicClient
 from network.constants import EXIT_SIGN
-from network.tcp_network_utils import create_packet
+from network.packet_reader import PacketReader
+from network.tcp_network_utils import create_packet_buffers, \
+    sendall_buffers
 
 
 class BasicTcpClient(BasicClient, ABC):
@@ -19,6 +21,8 @@ class BasicTcpClient(BasicClient, ABC):
         try:
             self.in_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.in_socket.connect((ip, in_socket_port))
+            # reads the packets that the server sends
+            self.in_reader = PacketReader(self.in_socket)
 
             self.out_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.out_socket.connect((ip, out_socket_port))
@@ -34,7 +38,7 @@ class BasicTcpClient(BasicClient, ABC):
     def send_packet(self, data: bytes):
         """ Creates a packet of data and sends it.  """
         try:
-            self.out_socket.sendall(create_packet(data))
+            sendall_buffers(self.out_socket, create_packet_buffers(data))
         except socket.error as e:
             if self.running:
                 # prints the full class name and the exception
@@ -43,6 +43,18 @@ class BasicUdpClient(BasicClient, ABC):
         """ Packs and sends data to the server. """
         self.out_socket.sendto(self.pack_data(data), self.server_in_address)
 
+    def send_buffers(self, buffers: tuple):
+        """
+        Sends the given buffers to the server as a single packet,
+        which must already be packed (see pack_data).
+        sendmsg gathers the buffers without joining them first,
+        but it isn't available on Windows.
+        """
+        if hasattr(self.out_socket, 'sendmsg'):
+            self.out_socket.sendmsg(buffers, (), 0, self.server_in_address)
+        else:
+            self.out_socket.sendto(b''.join(buffers), self.server_in_address)
+
     def receive_data(self) -> Union[Tuple[bytes, bytes], Tuple[None, None]]:
         """
         Receives data from the server.
@@ -4,7 +4,6 @@
 """
 import pickle
 from PyQt5.QtCore import pyqtSignal
-from network.tcp_network_utils import recv_packet
 from network.custom_messages.chat_msg import ChatMsg
 from client.network_constants import Constants
 from client.basic_tcp_client import BasicTcpClient
@@ -34,7 +33,7 @@ class ChatClient(BasicTcpClient):
         and forwards them to the main window using the new_msg signal.
         """
         while self.running:
-            msg = pickle.loads(recv_packet(self.in_socket))
+            msg = pickle.loads(self.in_reader.recv_packet())
             self.new_msg.emit(msg)
 
     def send_msg(self, msg: ChatMsg):
@@ -5,7 +5,6 @@
 from typing import Union
 import pickle
 from PyQt5.QtCore import pyqtSignal
-from network.tcp_network_utils import recv_packet
 from client.network_constants import Constants
 from client.basic_tcp_client import BasicTcpClient
 from network.custom_messages.general_info import Info
@@ -42,7 +41,7 @@ class InfoClient(BasicTcpClient):
         """
         while self.running:
             # tuple of the msg name and the msg data
-            full_msg = pickle.loads(recv_packet(self.in_socket))
+            full_msg = pickle.loads(self.in_reader.recv_packet())
 
             # emit a signal indicating that new info was received
             self.new_info.emit(full_msg)
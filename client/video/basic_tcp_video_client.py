@@ -6,7 +6,6 @@ import numpy as np
 from PyQt5.QtCore import pyqtSignal
 from abc import abstractmethod
 from network.constants import CHUNK_SIZE, EOF
-from network.tcp_network_utils import recv_packet
 from client.basic_tcp_client import BasicTcpClient
 from client.video.video_encoder import VideoEncoder
 
@@ -68,9 +67,10 @@ class BasicTcpVideoClient(BasicTcpClient):
 
         while self.running:
             # bytearray is unhashable => can't be a dictionary key
-            sender_id = bytes(recv_packet(self.in_socket))
+            sender_id = bytes(self.in_reader.recv_packet())
             # receive the frame in chunks
-            data = recv_packet(self.in_socket)
+            # (the data is valid until the next packet is received)
+            data = self.in_reader.recv_packet()
             if data != EOF:
                 if sender_id in clients_buffers:
                     clients_buffers[sender_id].extend(data)
@@ -2,6 +2,9 @@
     Hadar Shahar
     BasicVideoClient.
 """
+import struct
+import threading
+import time
 import numpy as np
 from PyQt5.QtCore import pyqtSignal
 from abc import abstractmethod
@@ -9,6 +12,14 @@ from client.basic_udp_client import BasicUdpClient
 from client.video.udp_packet import UdpPacket
 from client.video.udp_packets_handler import UdpPacketsHandler
 from client.video.video_encoder import VideoEncoder
+from client.video.rate_controller import RateController
+from client.video.packet_pacer import PacketPacer
+from client.video.udp_packetizer import UdpPacketizer
+from client.video.video_pipeline import VideoPipeline
+from client.video.decode_pool import DecodePool
+from network.constants import UDP_LAYER_REQUEST_MSG, UDP_NACK_MSG, \
+    UDP_REPORT_MSG
+from network.custom_messages.receiver_report import ReceiverReport
 
 
 class BasicUdpVideoClient(BasicUdpClient):
@@ -20,12 +31,66 @@ class BasicUdpVideoClient(BasicUdpClient):
     # this signal indicates that a new frame was received
     frame_received = pyqtSignal(np.ndarray, bytes)  # (cv2 image, client id)
 
+    # the number of simulcast layers that are sent (see VideoEncoder.LAYERS)
+    NUM_LAYERS = 1
+
+    # how often to send the requested layer again (in seconds),
+    # in case the request was lost
+    LAYER_REQUEST_INTERVAL = 2
+
+    # a parity packet is sent for every FEC_GROUP_SIZE packets of a frame,
+    # so a lost packet in each group can be restored (see ParityFec).
+    # 0 to send no parity packets
+    FEC_GROUP_SIZE = 0
+
+    # whether to ask the server to send the lost packets again
+    # (see RetransmittingUdpServer)
+    SEND_NACKS = True
+
+    # after UDP_NACK_MSG and the sender id: layer, frame index,
+    # and then the packet indexes
+    NACK_HEADER_FORMAT = '>BI'
+    NACK_INDEX_FORMAT = 'H'
+
+    # the maximum frames per second that are sent
+    # (the RateController might send less)
+    MAX_FPS = 30
+
+    # whether to spread the packets of each frame over PACING_FRACTION
+    # of the frame interval (see PacketPacer)
+    PACE_PACKETS = True
+    PACING_FRACTION = 0.8
+
+    # how often to report the reception of each sender (in seconds)
+    REPORT_INTERVAL = 1
+
     def __init__(self, ip: str, in_socket_port: int, out_socket_port: int,
                  client_id: bytes, is_sharing=True):
         """ Constructor. """
         super(BasicUdpVideoClient, self).__init__(
             ip, in_socket_port, out_socket_port, client_id, is_sharing)
         self.frame_index = 0  # for the UdpPacketsHandler
+        # the packets are sent with the client id prefix (see pack_data)
+        self.packetizer = UdpPacketizer(self.pack_data(b''))
+
+        # the simulcast layer this client wants to receive
+        # (None if it hasn't requested a layer)
+        self.requested_layer = None
+        self.last_layer_request_time = 0
+
+        # adapts the sent video to the receivers reports
+        self.rate_controller = RateController(VideoEncoder.JPEG_QUALITY,
+                                              self.MAX_FPS)
+        # { client id: handler that handles the packets coming from the
+        # client }, they are used by the receiving thread and reported
+        # by the reports thread (see report_loop)
+        self.clients_handlers: [bytes, UdpPacketsHandler] = {}
+        self.clients_handlers_lock = threading.Lock()
+        self.pipeline = None  # created when it starts sharing
+        # decodes the received frames (see receive_data_loop)
+        self.decode_pool = DecodePool(self.decode_frame,
+                                      self.is_independent_frame,
+                                      self.frame_received.emit)
 
     @abstractmethod
     def get_frame(self):
@@ -39,47 +104,173 @@ class BasicUdpVideoClient(BasicUdpClient):
         """
         Captures video from the camera and
         sends each frame to the server.
+        The stages run on separate threads (see VideoPipeline).
         """
-        while self.running and self.is_sharing:
-            frame = self.get_frame()
-
-            # if the frame was not read successfully
-            # can't check 'if not frame:' because an exception is raised
-            if frame is None:
-                continue
+        self.pipeline = VideoPipeline(
+            lambda: self.rate_controller.fps, self.capture_frame,
+            self.prepare_frame, self.encode_frame, self.send_frame)
+        self.pipeline.run(lambda: self.running and self.is_sharing)
 
+    def capture_frame(self):
+        """
+        Returns a frame and shows it in the gui,
+        or None if it wasn't read successfully.
+        """
+        frame = self.get_frame()
+        # can't check 'if not frame:' because an exception is raised
+        if frame is not None:
             # send a signal to show the frame in the gui
             self.frame_captured.emit(frame)
+        return frame
+
+    def prepare_frame(self, frame: np.ndarray):
+        """
+        Prepares a given frame for encoding. It's called in the capture
+        order, one frame at a time (unlike encode_frame).
+        """
+        return frame
+
+    def encode_frame(self, frame: np.ndarray) -> list:
+        """
+        Encodes a given frame at the rate controller's quality and scale.
+        Returns a list of the encoded simulcast layers.
+        """
+        return VideoEncoder.encode_layers(
+            frame, self.NUM_LAYERS, self.rate_controller.quality,
+            self.rate_controller.scale)
+
+    def send_frame(self, layers: list):
+        """
+        Sends the encoded layers of a frame, all the layers of the frame
+        are sent with the same frame index.
+        """
+        packets = self.packetizer.packetize(self.frame_index, layers,
+                                            self.FEC_GROUP_SIZE)
+        if self.PACE_PACKETS:
+            PacketPacer.send(packets, self.send_buffers,
+                             self.PACING_FRACTION / self.rate_controller.fps)
+        else:
+            for packet in packets:
+                self.send_buffers(packet)
+        self.frame_index += 1
+        self.rate_controller.frame_sent(
+            sum(len(header) + len(data) for header, data in packets))
 
-            # convert the frame (numpy.ndarray) to bytes
-            data = VideoEncoder.encode_frame(frame)
+    def decode_frame(self, sender_id: bytes, buffer: bytes):
+        """
+        Decodes a given frame of a given sender.
+        Returns a cv2 image, or None if there's nothing to show.
+        """
+        return VideoEncoder.decode_frame_buffer(buffer)
 
-            packets = UdpPacketsHandler.create_packets(self.frame_index, data)
-            for p in packets:
-                self.send_data(p.encode())
-            self.frame_index += 1
+    def is_independent_frame(self, buffer: bytes) -> bool:
+        """
+        Returns whether a given frame can be decoded without the previous
+        frames of its sender (so they can be skipped, see DecodePool).
+        """
+        return True
+
+    def request_layer(self, layer: int):
+        """
+        Requests the server to send only a given simulcast layer
+        of the other clients' video.
+        """
+        self.requested_layer = layer
+        self.last_layer_request_time = time.monotonic()
+        # sent from the input socket, like UDP_NEW_CLIENT_MSG
+        self.in_socket.sendto(
+            self.pack_data(UDP_LAYER_REQUEST_MSG + bytes([layer])),
+            self.server_in_address)
+
+    def send_nack(self, sender_id: bytes, layer: int, frame_index: int,
+                  packet_indexes: list):
+        """
+        Asks the server to send again the packets of a given frame
+        that were lost.
+        """
+        nack = UDP_NACK_MSG + sender_id + struct.pack(
+            BasicUdpVideoClient.NACK_HEADER_FORMAT +
+            BasicUdpVideoClient.NACK_INDEX_FORMAT * len(packet_indexes),
+            layer, frame_index, *packet_indexes)
+        # sent from the input socket, like UDP_NEW_CLIENT_MSG
+        self.in_socket.sendto(self.pack_data(nack), self.server_in_address)
+
+    def report_loop(self):
+        """
+        Runs in a separate thread, reports the reception of each sender
+        every REPORT_INTERVAL, and requests the layer again every
+        LAYER_REQUEST_INTERVAL. It doesn't depend on receiving packets,
+        so a receiver that receives nothing still reports it.
+        """
+        while self.running:
+            time.sleep(BasicUdpVideoClient.REPORT_INTERVAL)
+            self.send_reports()
+            if self.requested_layer is not None and \
+                    time.monotonic() - self.last_layer_request_time > \
+                    BasicUdpVideoClient.LAYER_REQUEST_INTERVAL:
+                self.request_layer(self.requested_layer)
+
+    def send_reports(self):
+        """
+        Reports the reception of each sender that's still sending
+        to the server.
+        """
+        now = time.monotonic()
+        with self.clients_handlers_lock:
+            reports = [(sender_id, handler.create_report())
+                       for sender_id, handler in self.clients_handlers.items()
+                       if handler.is_active(now)]
+        for sender_id, report in reports:
+            # sent from the input socket, like UDP_NEW_CLIENT_MSG
+            self.in_socket.sendto(
+                self.pack_data(UDP_REPORT_MSG + sender_id + report.encode()),
+                self.server_in_address)
 
     def receive_data_loop(self):
         """
         Receives each frame from the server,
-        decodes it and shows it.
+        and passes it to the DecodePool that decodes it and shows it.
         """
-        # {client id: handler that handles that packets coming from the client}
-        clients_handlers: [bytes, UdpPacketsHandler] = {}
+        self.decode_pool.start()
+        threading.Thread(target=self.catch_exception,
+                         args=(self.report_loop,)).start()
+        try:
+            self.receive_frames()
+        finally:
+            self.decode_pool.stop()
 
+    def receive_frames(self):
+        """ Receives the packets and reassembles the frames. """
         while self.running:
             sender_id, data = self.receive_data()
             if data is None:
                 continue
 
-            if sender_id not in clients_handlers:
-                clients_handlers[sender_id] = UdpPacketsHandler()
+            # the aggregated report of this client's receivers
+            if data.startswith(UDP_REPORT_MSG):
+                report = ReceiverReport.decode(data[len(UDP_REPORT_MSG):])
+                if report is not None:
+                    self.rate_controller.on_report(report)
+                continue
 
             p = UdpPacket.decode(data)
             if p is None:  # invalid packet
                 continue
 
-            buffer = clients_handlers[sender_id].process_packet(p)
-            if buffer is not None:
-                frame = VideoEncoder.decode_frame_buffer(buffer)
-                self.frame_received.emit(frame, sender_id)
+            with self.clients_handlers_lock:
+                handler = self.clients_handlers.get(sender_id)
+                if handler is None:
+                    handler = UdpPacketsHandler()
+                    self.clients_handlers[sender_id] = handler
+                dropped_frames = handler.dropped_frames
+                buffers = handler.process_packet(p)
+                is_lost = handler.dropped_frames != dropped_frames
+                nacks = handler.get_nacks() if self.SEND_NACKS else []
+
+            if is_lost:
+                # the frames after it might depend on it
+                self.decode_pool.frame_lost(sender_id)
+            for buffer in buffers:
+                self.decode_pool.put(sender_id, buffer)
+            for layer, frame_index, indexes in nacks:
+                self.send_nack(sender_id, layer, frame_index, indexes)
@@ -5,11 +5,18 @@
 from client.network_constants import Constants
 from client.video.basic_udp_video_client import BasicUdpVideoClient
 from client.video.video_camera import VideoCamera
+from client.video.video_encoder import VideoEncoder
 
 
 class CameraClient(BasicUdpVideoClient):
     """ Definition of the class CameraClient. """
 
+    # the camera video is relayed by the SimulcastUdpServer
+    NUM_LAYERS = len(VideoEncoder.LAYERS)
+
+    # get_frame also waits for the camera, which might be slower
+    MAX_FPS = 30
+
     def __init__(self, client_id: bytes):
         """ Constructor. """
         super(CameraClient, self).__init__(
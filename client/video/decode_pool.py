@@ -0,0 +1,155 @@
+"""
+    Hadar Shahar
+    DecodePool.
+"""
+import threading
+from collections import deque
+from typing import Callable, Dict
+
+
+class DecodePool(object):
+    """
+    Definition of the class DecodePool.
+
+    Decodes the received frames on DECODE_THREADS threads, so the thread
+    that reads the socket isn't blocked by decoding (and the socket buffer
+    doesn't overflow). Each sender has a decode slot: when a newer frame
+    arrives before the previous frames of the sender were decoded, the
+    older frames are skipped. A frame that depends on the previous frames
+    (like the tiles of the TileEncoder) doesn't replace them, and only the
+    last of the decoded frames is shown. The frames of each sender are
+    decoded by one thread at a time, in order.
+    A dependent frame is dropped if its base is missing: before the
+    first independent frame, after a frame of the sender was lost (see
+    frame_lost), or after a frame was dropped because the slot had
+    MAX_PENDING_FRAMES. The frames are dropped until the next
+    independent frame, so a slot never grows beyond MAX_PENDING_FRAMES.
+    """
+
+    DECODE_THREADS = 2
+
+    # the maximum number of frames that wait in a slot
+    MAX_PENDING_FRAMES = 8
+
+    # how long the threads wait for a frame before checking whether
+    # the pool was stopped (in seconds)
+    WAIT_TIMEOUT = 0.1
+
+    def __init__(self, decode: Callable[[bytes, bytes], object],
+                 is_independent: Callable[[bytes], bool],
+                 on_frame: Callable[[object, bytes], None]):
+        """
+        Constructor.
+        decode receives a sender id and a frame buffer, and returns the
+        decoded frame or None. is_independent returns whether a frame
+        buffer can be decoded without the previous frames, and on_frame
+        receives each decoded frame to show and its sender id.
+        """
+        self.decode = decode
+        self.is_independent = is_independent
+        self.on_frame = on_frame
+
+        # { sender id: the frames that are waiting to be decoded }
+        self.slots: Dict[bytes, list] = {}
+        # the senders that have frames waiting and aren't being decoded
+        self.ready = deque()
+        self.busy = set()  # the senders that are being decoded
+        # the senders whose dependent frames can be decoded
+        # (they have a base: an independent frame and the frames after it)
+        self.based = set()
+        self.condition = threading.Condition()
+        self.running = False
+
+        # changed while holding the condition's lock
+        self.decoded_frames = 0
+        # { sender id: the number of frames that were skipped }
+        self.skipped_frames: Dict[bytes, int] = {}
+
+    def start(self):
+        """ Starts the decoding threads. """
+        self.running = True
+        for _ in range(DecodePool.DECODE_THREADS):
+            threading.Thread(target=self.decode_loop, daemon=True).start()
+
+    def stop(self):
+        """ Stops the decoding threads. """
+        self.running = False
+
+    def put(self, sender_id: bytes, buffer: bytes):
+        """ Adds a full frame of a given sender to its decode slot. """
+        independent = self.is_independent(buffer)
+        with self.condition:
+            pending = self.slots.setdefault(sender_id, [])
+            if independent:
+                self.skip_frames(sender_id, len(pending))
+                pending.clear()
+                self.based.add(sender_id)
+            elif sender_id not in self.based or \
+                    len(pending) >= DecodePool.MAX_PENDING_FRAMES:
+                # the frames after it can't be decoded without it
+                self.based.discard(sender_id)
+                self.skip_frames(sender_id, 1)
+                if not pending:
+                    del self.slots[sender_id]
+                return
+            pending.append(buffer)
+            if sender_id not in self.busy and sender_id not in self.ready:
+                self.ready.append(sender_id)
+                self.condition.notify()
+
+    def frame_lost(self, sender_id: bytes):
+        """
+        Drops the next dependent frames of a given sender (until its next
+        independent frame), because one of its frames was lost.
+        """
+        with self.condition:
+            self.based.discard(sender_id)
+
+    def skip_frames(self, sender_id: bytes, count: int):
+        """
+        Counts the skipped frames of a sender.
+        Must be called while holding the condition's lock.
+        """
+        if count:
+            self.skipped_frames[sender_id] = \
+                self.skipped_frames.get(sender_id, 0) + count
+
+    def decode_loop(self):
+        """ Decodes the waiting frames of one sender at a time. """
+        while self.running:
+            with self.condition:
+                if not self.condition.wait_for(lambda: self.ready,
+                                               DecodePool.WAIT_TIMEOUT):
+                    continue
+                sender_id = self.ready.popleft()
+                buffers = self.slots.pop(sender_id)
+                self.busy.add(sender_id)
+
+            frame = None
+            decoded_frames = 0
+            for buffer in buffers:
+                try:
+                    decoded = self.decode(sender_id, buffer)
+                except Exception as e:
+                    print('decode:', e)
+                    continue
+                decoded_frames += 1
+                if decoded is not None:
+                    frame = decoded
+            if frame is not None:
+                self.on_frame(frame, sender_id)
+
+            with self.condition:
+                self.decoded_frames += decoded_frames
+                self.busy.discard(sender_id)
+                # frames that arrived while it was decoding
+                if self.slots.get(sender_id):
+                    self.ready.append(sender_id)
+                    self.condition.notify()
+
+    def stats(self) -> dict:
+        """ Returns the decoded frames and the skipped frames. """
+        with self.condition:
+            return {'decoded_frames': self.decoded_frames,
+                    'skipped_frames': sum(self.skipped_frames.values()),
+                    'skipped_frames_per_sender': dict(self.skipped_frames)}
@@ -0,0 +1,106 @@
+"""
+    Hadar Shahar
+    FrameBuffer.
+"""
+from client.video.udp_packet import UdpPacket
+from client.video.parity_fec import ParityFec
+
+
+class FrameBuffer(object):
+    """
+    Definition of the class FrameBuffer.
+    Collects the packets of a single frame (of a single simulcast layer),
+    and restores the lost packets that can be restored from the parity
+    packets (see ParityFec).
+    """
+
+    def __init__(self, p: UdpPacket, arrival_time: float):
+        """
+        Constructor.
+        Receives the first packet that was received of the frame,
+        and the time it was received.
+        """
+        self.layer = p.layer
+        # the times the first and the last packets were received
+        self.arrival_time = self.last_arrival_time = arrival_time
+        self.packets_data = [b''] * p.num_packets
+        self.remaining_packets = p.num_packets
+        # the parity chunks of the frame
+        self.parity_data = [b''] * p.num_parity
+        # the number of missing data packets in each parity group
+        self.groups_missing = [len(range(g, p.num_packets, p.num_parity))
+                               for g in range(p.num_parity)]
+        self.restored_packets = 0
+        # the number of data and parity packets of the frame,
+        # and how many of them were received
+        self.num_packets = p.num_packets + p.num_parity
+        self.received_packets = 0
+        # the highest data packet index that was received
+        self.max_packet_index = -1
+        # the missing packets before this index were already requested
+        # again (see get_missing_indexes)
+        self.nacked_until = 0
+
+    def add_packet(self, p: UdpPacket):
+        """ Places a given packet of the frame at the right place. """
+        if p.packet_index >= len(self.packets_data) + len(self.parity_data):
+            print('malformed packet.')
+            return
+        if p.packet_index >= len(self.packets_data):  # a parity packet
+            group = p.packet_index - len(self.packets_data)
+            if self.parity_data[group]:  # a duplicate packet
+                return
+            self.parity_data[group] = p.data
+            self.received_packets += 1
+        else:
+            if self.packets_data[p.packet_index]:  # a duplicate packet
+                return
+            self.packets_data[p.packet_index] = p.data
+            self.received_packets += 1
+            self.remaining_packets -= 1
+            self.max_packet_index = max(self.max_packet_index,
+                                        p.packet_index)
+            if self.parity_data:
+                group = p.packet_index % len(self.parity_data)
+                self.groups_missing[group] -= 1
+
+        if self.parity_data and self.groups_missing[group] == 1 and \
+                self.parity_data[group]:
+            self.restore_packet(group)
+
+    def restore_packet(self, group: int):
+        """
+        Restores the missing data packet of a given parity group,
+        from the group's parity packet and the other packets.
+        """
+        indexes = range(group, len(self.packets_data), len(self.parity_data))
+        missing_index = next(i for i in indexes if not self.packets_data[i])
+        restored = ParityFec.restore_chunk(
+            self.parity_data[group],
+            [self.packets_data[i] for i in indexes if i != missing_index])
+        if restored is None:
+            print('invalid parity packet.')
+            return
+        self.packets_data[missing_index] = restored
+        self.remaining_packets -= 1
+        self.groups_missing[group] -= 1
+        self.restored_packets += 1
+
+    def get_missing_indexes(self, until: int) -> list:
+        """
+        Returns the indexes of the missing data packets before a given
+        index, which weren't requested again yet, and marks them as
+        requested.
+        """
+        missing = [i for i in range(self.nacked_until, until)
+                   if not self.packets_data[i]]
+        self.nacked_until = max(self.nacked_until, until)
+        return missing
+
+    def is_complete(self) -> bool:
+        """ Returns whether all the data packets were collected. """
+        return self.remaining_packets == 0
+
+    def get_frame(self) -> bytes:
+        """ Returns the full frame. """
+        return b''.join(self.packets_data)
@@ -0,0 +1,35 @@
+"""
+    Hadar Shahar
+    FrameScheduler.
+"""
+import time
+
+
+class FrameScheduler(object):
+    """
+    Definition of the class FrameScheduler.
+    Schedules the frames on a fixed grid of the monotonic clock (so the
+    frame rate doesn't drift by the time it takes to capture and send).
+    When the sender is behind by whole frame intervals, the missed frames
+    are skipped instead of being captured late one after the other.
+    """
+
+    def __init__(self):
+        """ Constructor. """
+        # the time of the next frame (None before the first frame)
+        self.next_frame_time = None
+        self.skipped_frames = 0
+
+    def wait(self, fps: float):
+        """ Waits until it's time to capture the next frame. """
+        interval = 1 / fps
+        now = time.monotonic()
+        if self.next_frame_time is None:
+            self.next_frame_time = now
+        elif now < self.next_frame_time:
+            time.sleep(self.next_frame_time - now)
+        elif now >= self.next_frame_time + interval:
+            skipped = int((now - self.next_frame_time) / interval)
+            self.next_frame_time += skipped * interval
+            self.skipped_frames += skipped
+        self.next_frame_time += interval
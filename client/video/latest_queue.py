@@ -0,0 +1,44 @@
+"""
+    Hadar Shahar
+    LatestQueue.
+"""
+import threading
+from collections import deque
+
+
+class LatestQueue(object):
+    """
+    Definition of the class LatestQueue.
+    A bounded queue between two threads, which drops the oldest item
+    when it's full (so the consumer always gets the latest items,
+    instead of falling behind).
+    """
+
+    def __init__(self, maxsize: int = 1):
+        """ Constructor. """
+        self.items = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.dropped = 0  # the number of items that were dropped
+
+    def put(self, item) -> bool:
+        """
+        Adds a given item.
+        Returns whether the oldest item was dropped to make room for it.
+        """
+        with self.condition:
+            dropped = len(self.items) == self.items.maxlen
+            if dropped:
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+        return dropped
+
+    def get(self, timeout: float = None):
+        """
+        Removes and returns the oldest item,
+        or None if there's no item until the timeout.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items, timeout):
+                return None
+            return self.items.popleft()
@@ -0,0 +1,32 @@
+"""
+    Hadar Shahar
+    PacketPacer.
+"""
+import time
+from typing import Callable
+
+
+class PacketPacer(object):
+    """
+    Definition of the class PacketPacer.
+    Spreads the packets of a frame evenly over a given duration, instead
+    of sending them in a single burst (which overflows the queues of the
+    routers and of the server even when the average bitrate fits).
+    """
+
+    # a shorter delay isn't slept (time.sleep isn't accurate enough),
+    # so a few packets are sent at once and the pacer catches up
+    MIN_SLEEP = 0.001  # in seconds
+
+    @staticmethod
+    def send(packets: list, send: Callable[[bytes], None], duration: float):
+        """ Sends the given packets over a given duration (in seconds). """
+        if not packets:
+            return
+        start = time.monotonic()
+        gap = duration / len(packets)
+        for i, packet in enumerate(packets):
+            delay = start + i * gap - time.monotonic()
+            if delay > PacketPacer.MIN_SLEEP:
+                time.sleep(delay)
+            send(packet)
@@ -0,0 +1,89 @@
+"""
+    Hadar Shahar
+    ParityFec.
+"""
+import math
+import struct
+from typing import Union
+import numpy as np
+
+
+class ParityFec(object):
+    """
+    Definition of the class ParityFec.
+
+    XOR parity forward error correction for the packets of a frame.
+    The data chunks are split into interleaved groups: group g contains
+    chunks g, g + num_parity, g + 2 * num_parity, ...
+    (so a burst of lost packets hits different groups), and each group
+    has one parity chunk, which can restore one lost chunk of the group.
+
+    Each chunk is padded with zeros to the size of the largest one.
+    A parity chunk starts with the XOR of the group's chunks lengths
+    (like in RFC 5109), so a restored chunk gets its original length.
+    """
+
+    LENGTH_STRUCT = struct.Struct('>I')
+
+    @staticmethod
+    def get_num_parity(num_chunks: int, group_size: int) -> int:
+        """
+        Returns the number of parity chunks for a given number of chunks,
+        with (at most) group_size chunks in each group.
+        0 group size means no parity chunks.
+        """
+        if not group_size:
+            return 0
+        return math.ceil(num_chunks / group_size)
+
+    @staticmethod
+    def create_parity_chunks(data: bytes, chunk_size: int,
+                             num_parity: int) -> list:
+        """
+        Returns the parity chunks of a given data,
+        which is split into chunks of chunk_size bytes.
+        """
+        num_chunks = math.ceil(len(data) / chunk_size)
+        # pad the number of chunks to a multiple of num_parity
+        # (padding chunks are zeros, so they don't change the XOR)
+        num_rows = math.ceil(num_chunks / num_parity)
+        chunks = np.zeros(num_rows * num_parity * chunk_size, np.uint8)
+        chunks[:len(data)] = np.frombuffer(data, np.uint8)
+        # chunks[row, g] is the chunk row * num_parity + g,
+        # which is in group g
+        chunks = chunks.reshape(num_rows, num_parity, chunk_size)
+        parities = np.bitwise_xor.reduce(chunks, axis=0)
+
+        # all the chunks are full except the last one
+        last_chunk_size = len(data) - (num_chunks - 1) * chunk_size
+        parity_chunks = []
+        for g in range(num_parity):
+            group_size = len(range(g, num_chunks, num_parity))
+            length = chunk_size if group_size % 2 else 0
+            if (num_chunks - 1) % num_parity == g:
+                # replace the full size of the last chunk with its size
+                length ^= chunk_size ^ last_chunk_size
+            parity_chunks.append(ParityFec.LENGTH_STRUCT.pack(length) +
+                                 parities[g].tobytes())
+        return parity_chunks
+
+    @staticmethod
+    def restore_chunk(parity: bytes, chunks: list) -> Union[bytes, None]:
+        """
+        Restores the missing chunk of a group, from its parity chunk
+        and the other chunks of the group.
+        Returns None if the parity chunk is invalid.
+        """
+        n = ParityFec.LENGTH_STRUCT.size
+        if len(parity) < n:
+            return None
+        length = ParityFec.LENGTH_STRUCT.unpack_from(parity)[0]
+        restored = np.frombuffer(parity, np.uint8, offset=n).copy()
+        for chunk in chunks:
+            if len(chunk) > len(restored):
+                return None
+            restored[:len(chunk)] ^= np.frombuffer(chunk, np.uint8)
+            length ^= len(chunk)
+        if length > len(restored):
+            return None
+        return restored[:length].tobytes()
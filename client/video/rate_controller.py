@@ -0,0 +1,197 @@
+"""
+    Hadar Shahar
+    RateController.
+"""
+import time
+from network.custom_messages.receiver_report import ReceiverReport
+
+
+class RateController(object):
+    """
+    Definition of the class RateController.
+
+    Adapts the video of a sender to the reception of its receivers.
+    The target bitrate is changed by the aggregated receiver reports
+    (like the loss based controller of Google Congestion Control):
+    it's decreased when the loss or the jitter is high,
+    and slowly increased when the loss is low.
+    The JPEG quality, the resolution scale and the frame rate are then
+    changed every ADJUST_INTERVAL to send at the target bitrate.
+    The reports are ignored while nothing is sent (the receivers report
+    that they receive nothing, but it's not because of the network).
+    """
+
+    # the target bitrate bounds (bits per second)
+    MIN_BITRATE = 150_000
+    MAX_BITRATE = 10_000_000
+    START_BITRATE = 3_000_000
+
+    # the target bitrate is decreased by half the loss when the loss is
+    # higher than LOSS_HIGH, and increased by INCREASE when it's lower
+    # than LOSS_LOW
+    LOSS_HIGH = 0.1
+    LOSS_LOW = 0.02
+    INCREASE = 1.05
+    # the target bitrate is decreased by JITTER_DECREASE when the jitter
+    # is higher than JITTER_HIGH (in seconds)
+    JITTER_HIGH = 0.03
+    JITTER_DECREASE = 0.85
+    # the maximum target bitrate relative to the sent bitrate,
+    # when the knobs are at their maximum
+    MAX_TARGET_RATIO = 1.5
+
+    # the bounds of the knobs, the quality is the JPEG quality of
+    # the first layer (see VideoEncoder.LAYERS)
+    MIN_QUALITY = 30
+    QUALITY_STEP = 10
+    SCALES = (1, 0.75, 0.5)
+    MIN_FPS = 5
+    FPS_STEP = 5
+
+    # how often the knobs are changed (in seconds)
+    ADJUST_INTERVAL = 1
+    # the knobs are decreased when the sent bitrate is higher than the
+    # target by more than that, and increased when it's lower than
+    # the target by more than that
+    HIGH_MARGIN = 1.1
+    LOW_MARGIN = 0.8
+
+    # the reports are ignored if no frame was sent for that long
+    # (in seconds)
+    IDLE_TIMEOUT = 1
+
+    def __init__(self, max_quality: int, max_fps: float):
+        """ Constructor. """
+        self.max_quality = max_quality
+        self.max_fps = max_fps
+        self.target_bitrate = RateController.START_BITRATE
+        self.quality = max_quality
+        self.scale_index = 0
+        self.fps = max_fps
+
+        self.last_report = None
+        self.sent_bitrate = 0
+        self.sent_bytes = 0  # since the last adjustment
+        # the sent bitrate is measured since the first frame is sent
+        self.adjust_time = None
+        self.last_send_time = None
+
+    @property
+    def scale(self) -> float:
+        """ Returns the resolution scale. """
+        return RateController.SCALES[self.scale_index]
+
+    def on_report(self, report: ReceiverReport):
+        """ Changes the target bitrate by a given aggregated report. """
+        if self.last_send_time is None or time.monotonic() - \
+                self.last_send_time > RateController.IDLE_TIMEOUT:
+            return
+        self.last_report = report
+        if report.loss > RateController.LOSS_HIGH:
+            self.target_bitrate *= 1 - report.loss / 2
+        elif report.jitter > RateController.JITTER_HIGH:
+            self.target_bitrate *= RateController.JITTER_DECREASE
+        elif report.loss < RateController.LOSS_LOW:
+            self.target_bitrate *= RateController.INCREASE
+            if self.sent_bitrate and self.quality == self.max_quality and \
+                    self.scale_index == 0 and self.fps == self.max_fps:
+                # it sends all it can, so the target doesn't grow far
+                # above what's actually sent
+                self.target_bitrate = min(self.target_bitrate,
+                                          self.sent_bitrate *
+                                          RateController.MAX_TARGET_RATIO)
+        self.target_bitrate = min(max(self.target_bitrate,
+                                      RateController.MIN_BITRATE),
+                                  RateController.MAX_BITRATE)
+
+    def frame_sent(self, num_bytes: int):
+        """
+        Counts the bytes of a sent frame (all its packets and layers),
+        and changes the knobs if it's time to.
+        """
+        self.sent_bytes += num_bytes
+        now = time.monotonic()
+        self.last_send_time = now
+        if self.adjust_time is None:
+            self.adjust_time = now
+        elapsed = now - self.adjust_time
+        if elapsed < RateController.ADJUST_INTERVAL:
+            return
+        self.sent_bitrate = self.sent_bytes * 8 / elapsed
+        self.sent_bytes = 0
+        self.adjust_time = now
+
+        if self.sent_bitrate > self.target_bitrate * \
+                RateController.HIGH_MARGIN:
+            self.decrease(self.target_bitrate / self.sent_bitrate)
+        elif self.sent_bitrate < self.target_bitrate * \
+                RateController.LOW_MARGIN:
+            self.increase()
+
+    def decrease(self, ratio: float):
+        """
+        Decreases the quality, then the resolution, then the frame rate,
+        as many steps as needed to multiply the bitrate by a given ratio
+        (so it reaches the target at once after a sharp drop).
+        """
+        start = RateController.get_relative_bitrate(self.quality, self.scale,
+                                                    self.fps)
+        while RateController.get_relative_bitrate(
+                self.quality, self.scale, self.fps) > start * ratio:
+            if self.quality > RateController.MIN_QUALITY:
+                self.quality = max(
+                    self.quality - RateController.QUALITY_STEP,
+                    RateController.MIN_QUALITY)
+            elif self.scale_index < len(RateController.SCALES) - 1:
+                self.scale_index += 1
+            elif self.fps > RateController.MIN_FPS:
+                self.fps = max(self.fps - RateController.FPS_STEP,
+                               RateController.MIN_FPS)
+            else:
+                break
+
+    def increase(self):
+        """
+        Increases the frame rate, then the resolution, then the quality
+        (the opposite order of decrease), unless the bitrate after the
+        increase would be higher than the target (so it doesn't go back
+        and forth between two steps).
+        """
+        fps, scale_index, quality = self.fps, self.scale_index, self.quality
+        if fps < self.max_fps:
+            fps = min(fps + RateController.FPS_STEP, self.max_fps)
+        elif scale_index > 0:
+            scale_index -= 1
+        elif quality < self.max_quality:
+            quality = min(quality + RateController.QUALITY_STEP,
+                          self.max_quality)
+        else:
+            return
+
+        ratio = RateController.get_relative_bitrate(
+            quality, RateController.SCALES[scale_index], fps) / \
+            RateController.get_relative_bitrate(self.quality, self.scale,
+                                                self.fps)
+        if self.sent_bitrate * ratio <= \
+                self.target_bitrate * RateController.HIGH_MARGIN:
+            self.fps, self.scale_index, self.quality = \
+                fps, scale_index, quality
+
+    @staticmethod
+    def get_relative_bitrate(quality: int, scale: float,
+                             fps: float) -> float:
+        """
+        Returns a rough estimate of the relative bitrate of the given
+        knobs: it's proportional to the number of pixels and to the
+        frame rate, and grows faster than linearly with the JPEG quality.
+        """
+        return quality ** 1.5 * scale ** 2 * fps
+
+    def stats(self) -> dict:
+        """ Returns the controller state. """
+        return {'target_bitrate': self.target_bitrate,
+                'sent_bitrate': self.sent_bitrate,
+                'quality': self.quality,
+                'scale': self.scale,
+                'fps': self.fps,
+                'last_report': self.last_report}
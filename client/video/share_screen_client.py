@@ -7,16 +7,29 @@ import numpy as np
 import cv2
 from client.network_constants import Constants
 from client.video.basic_udp_video_client import BasicUdpVideoClient
+from client.video.tile_decoder import TileDecoder
+from client.video.tile_encoder import TileEncoder
 
 
 class ShareScreenClient(BasicUdpVideoClient):
     """ Definition of the class ShareScreenClient. """
 
+    # whether to send only the changed tiles of the screen (see
+    # TileEncoder) instead of the whole screen, all the clients must
+    # use the same mode
+    USE_TILES = True
+
+    # the screen changes slower than the camera video
+    MAX_FPS = 10
+
     def __init__(self, client_id: bytes):
         """ Constructor. """
         super(ShareScreenClient, self).__init__(
             Constants.SERVER_IP, Constants.CLIENT_IN_SCREEN_PORT,
             Constants.CLIENT_OUT_SCREEN_PORT, client_id, is_sharing=False)
+        self.tile_encoder = TileEncoder()
+        # { sender id: the TileDecoder of its screen }
+        self.tile_decoders = {}
 
     def get_frame(self) -> np.ndarray:
         """
@@ -25,3 +38,46 @@ class ShareScreenClient(BasicUdpVideoClient):
         """
         img = ImageGrab.grab()
         return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+
+    def prepare_frame(self, frame: np.ndarray):
+        """
+        Finds the changed tiles of the screen (in the capture order,
+        since they're compared to the previous frame).
+        """
+        if not ShareScreenClient.USE_TILES:
+            return super(ShareScreenClient, self).prepare_frame(frame)
+        return (frame, *self.tile_encoder.get_rects(frame))
+
+    def encode_frame(self, prepared) -> list:
+        """
+        Encodes only the changed tiles of the screen (in a single layer).
+        The resolution scale of the rate controller isn't used,
+        since the tiles are placed by their coordinates.
+        """
+        if not ShareScreenClient.USE_TILES:
+            return super(ShareScreenClient, self).encode_frame(prepared)
+        frame, is_full, rects = prepared
+        return [TileEncoder.encode_rects(frame, is_full, rects,
+                                         self.rate_controller.quality)]
+
+    def decode_frame(self, sender_id: bytes, buffer: bytes):
+        """
+        Draws the changed tiles of a sender's screen.
+        Returns the full screen, or None if nothing changed.
+        """
+        if not ShareScreenClient.USE_TILES:
+            return super(ShareScreenClient, self).decode_frame(sender_id,
+                                                               buffer)
+        if sender_id not in self.tile_decoders:
+            self.tile_decoders[sender_id] = TileDecoder()
+        return self.tile_decoders[sender_id].decode(buffer)
+
+    def is_independent_frame(self, buffer: bytes) -> bool:
+        """
+        Returns whether a given frame is a full refresh of the screen
+        (the other frames only change the previous ones).
+        """
+        if not ShareScreenClient.USE_TILES:
+            return super(ShareScreenClient, self).is_independent_frame(
+                buffer)
+        return TileDecoder.is_full_refresh(buffer)
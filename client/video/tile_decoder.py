@@ -0,0 +1,69 @@
+"""
+    Hadar Shahar
+    TileDecoder.
+"""
+import struct
+import numpy as np
+from client.video.tile_encoder import TileEncoder
+from client.video.video_encoder import VideoEncoder
+
+
+class TileDecoder(object):
+    """
+    Definition of the class TileDecoder.
+    Composites the rectangles encoded by the TileEncoder into a
+    persistent canvas of a single sender's screen.
+    """
+
+    def __init__(self):
+        """ Constructor. """
+        # the sender's screen (None until the first full refresh)
+        self.canvas = None
+
+    def decode(self, buffer: bytes):
+        """
+        Draws the rectangles of a given encoded frame on the canvas.
+        Returns a copy of the canvas, or None if nothing changed
+        (or it can't be drawn before a full refresh is received).
+        """
+        try:
+            is_full, height, width, num_rects = \
+                TileEncoder.FRAME_HEADER_STRUCT.unpack_from(buffer)
+        except struct.error:
+            print('invalid tiles frame.')
+            return None
+
+        if is_full and (self.canvas is None or
+                        self.canvas.shape[:2] != (height, width)):
+            self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        if self.canvas is None or num_rects == 0 or \
+                self.canvas.shape[:2] != (height, width):
+            return None
+
+        offset = TileEncoder.FRAME_HEADER_STRUCT.size
+        for _ in range(num_rects):
+            try:
+                x, y, size = TileEncoder.RECT_HEADER_STRUCT.unpack_from(
+                    buffer, offset)
+                offset += TileEncoder.RECT_HEADER_STRUCT.size
+                rect = VideoEncoder.decode_frame_buffer(
+                    buffer[offset: offset + size])
+                offset += size
+                rect_height, rect_width = rect.shape[:2]
+                self.canvas[y: y + rect_height, x: x + rect_width] = rect
+            except (struct.error, AttributeError, ValueError) as e:
+                # AttributeError if the image couldn't be decoded,
+                # ValueError if it's out of the canvas
+                print('invalid tile:', e)
+                break
+        # the canvas is changed by the next frames,
+        # while the gui might still show this one
+        return self.canvas.copy()
+
+    @staticmethod
+    def is_full_refresh(buffer: bytes) -> bool:
+        """ Returns whether a given encoded frame is a full refresh. """
+        try:
+            return TileEncoder.FRAME_HEADER_STRUCT.unpack_from(buffer)[0]
+        except struct.error:
+            return False
@@ -0,0 +1,111 @@
+"""
+    Hadar Shahar
+    TileEncoder.
+"""
+import struct
+import time
+import numpy as np
+from client.video.video_encoder import VideoEncoder
+
+
+class TileEncoder(object):
+    """
+    Definition of the class TileEncoder.
+
+    Encodes only the parts of the screen that changed since the previous
+    frame: the frame is split into TILE_SIZE x TILE_SIZE tiles, the tiles
+    that changed are found by comparing the frame to the previous one,
+    and each run of adjacent changed tiles in a row of tiles is encoded
+    as a separate JPEG image. The whole frame is sent every
+    FULL_REFRESH_INTERVAL, so receivers that joined later or lost an
+    update get the full screen (see TileDecoder).
+    """
+
+    TILE_SIZE = 64  # in pixels
+
+    # how often to send the whole frame (in seconds)
+    FULL_REFRESH_INTERVAL = 3
+
+    # is full refresh, frame height, frame width, number of rectangles
+    FRAME_HEADER_STRUCT = struct.Struct('>?3H')
+    # x, y, the size of the JPEG image of the rectangle
+    RECT_HEADER_STRUCT = struct.Struct('>2HI')
+
+    def __init__(self):
+        """ Constructor. """
+        self.prev_frame = None
+        self.refresh_time = 0
+
+    def encode(self, frame: np.ndarray, quality: int = None) -> bytes:
+        """
+        Encodes the changed parts of a given frame.
+        If nothing changed, the encoded frame contains no rectangles
+        (so it's only a few bytes).
+        """
+        return TileEncoder.encode_rects(frame, *self.get_rects(frame),
+                                        quality=quality)
+
+    def get_rects(self, frame: np.ndarray) -> (bool, list):
+        """
+        Returns whether a given frame is a full refresh, and the
+        rectangles (x, y, width, height) that should be encoded.
+        It must be called for every frame in order (unlike encode_rects).
+        """
+        height, width = frame.shape[:2]
+        now = time.monotonic()
+        is_full = self.prev_frame is None or \
+            self.prev_frame.shape != frame.shape or \
+            now - self.refresh_time > TileEncoder.FULL_REFRESH_INTERVAL
+
+        if is_full:
+            self.refresh_time = now
+            rects = [(0, 0, width, height)]
+        else:
+            rects = self.get_changed_rects(frame)
+        self.prev_frame = frame
+        return is_full, rects
+
+    @staticmethod
+    def encode_rects(frame: np.ndarray, is_full: bool, rects: list,
+                     quality: int = None) -> bytes:
+        """ Encodes the given rectangles of a frame. """
+        height, width = frame.shape[:2]
+        encoded = [TileEncoder.FRAME_HEADER_STRUCT.pack(
+            is_full, height, width, len(rects))]
+        for x, y, rect_width, rect_height in rects:
+            data = VideoEncoder.encode_frame(
+                frame[y: y + rect_height, x: x + rect_width], quality)
+            encoded.append(
+                TileEncoder.RECT_HEADER_STRUCT.pack(x, y, len(data)))
+            encoded.append(data)
+        return b''.join(encoded)
+
+    def get_changed_rects(self, frame: np.ndarray) -> list:
+        """
+        Returns the rectangles (x, y, width, height) of the runs of
+        changed tiles in each row of tiles.
+        """
+        size = TileEncoder.TILE_SIZE
+        height, width = frame.shape[:2]
+        # the changed bytes of each row, then the changed tiles
+        # (reduceat also handles the smaller tiles at the edges).
+        # the color channels are reduced with the tile columns,
+        # since np.any(axis=2) is much slower
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        changed = (frame != self.prev_frame).reshape(height, -1)
+        changed = np.logical_or.reduceat(
+            changed, range(0, width * channels, size * channels), axis=1)
+        changed = np.logical_or.reduceat(changed, range(0, height, size),
+                                         axis=0)
+
+        rects = []
+        for row in np.flatnonzero(changed.any(axis=1)):
+            # the starts and ends of the runs of changed tiles
+            edges = np.flatnonzero(
+                np.diff(changed[row].astype(np.int8), prepend=0, append=0))
+            y = row * size
+            for start, end in zip(edges[::2], edges[1::2]):
+                x = start * size
+                rects.append((int(x), int(y), int(min(end * size, width) - x),
+                              int(min(y + size, height) - y)))
+        return rects
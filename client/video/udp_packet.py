@@ -10,50 +10,81 @@ class UdpPacket:
     """ Definition of the class UdpPacket. """
 
     # The numbers of numbers in each header
-    NUMS_IN_HEADER = 4
+    NUMS_IN_HEADER = 6
     HEADER_SIZE = NUMS_IN_HEADER * NETWORK_BYTES_PER_NUM  # in bytes
 
     # '>' for big-endian (network byte order is always big-endian)
     # 'I' for unsigned int which takes 4 bytes
     BYTES_FORMAT = f'>{NUMS_IN_HEADER}I'
+    HEADER_STRUCT = struct.Struct(BYTES_FORMAT)
 
     # The max data size in each packet.
     # Must be less than network.constants.UDP_SOCKET_BUFFER_SIZE
+    # (with the few extra bytes of a parity packet, see ParityFec)
     MAX_DATA_SIZE = 2048
 
+    # a packet is created for every received datagram, so it has no
+    # __dict__ (which takes more memory and time to create)
+    __slots__ = ('layer', 'frame_index', 'packet_index', 'num_packets',
+                 'num_parity', 'data_size', 'data')
+
     def __init__(self, frame_index: int, packet_index: int,
-                 num_packets: int, data: bytes):
+                 num_packets: int, data: bytes, layer: int = 0,
+                 num_parity: int = 0):
         """ Constructor. """
+        # The simulcast layer (see VideoEncoder.LAYERS), it's first
+        # in the header so the server can read it at a fixed offset
+        self.layer = layer
         self.frame_index = frame_index    # The current frame index
         self.packet_index = packet_index  # The current packet index
-        self.num_packets = num_packets    # The total number of packets
+        self.num_packets = num_packets    # The number of data packets
+        # The number of parity packets (see ParityFec), their indexes
+        # come after the data packets
+        self.num_parity = num_parity
         self.data_size = len(data)        # The data size in bytes
 
         self.data = data  # The data buffer
 
-        header_format = (self.frame_index, self.packet_index,
-                         self.num_packets, self.data_size)
-        self.header = struct.pack(UdpPacket.BYTES_FORMAT, *header_format)
-
     @staticmethod
-    def decode(packet: bytes):
+    def decode(packet: bytes, offset: int = 0):
         """
-        Decodes a given packet and returns a UdpPacket
-        or None if it's invalid packet.
+        Decodes a given packet (starting at a given offset)
+        and returns a UdpPacket or None if it's invalid packet.
         """
         try:
-            raw_header = packet[:UdpPacket.HEADER_SIZE]
-            frame_index, packet_index, num_packets, data_size = \
-                struct.unpack(UdpPacket.BYTES_FORMAT, raw_header)
-
-            data = packet[UdpPacket.HEADER_SIZE:
-                          UdpPacket.HEADER_SIZE + data_size]
-            p = UdpPacket(frame_index, packet_index, num_packets, data)
-            return p
-        except Exception as e:
+            layer, frame_index, packet_index, num_packets, num_parity, \
+                data_size = UdpPacket.HEADER_STRUCT.unpack_from(packet,
+                                                                offset)
+        except struct.error as e:
             print('Invalid UdpPacket:', e)
             return None
+        start = offset + UdpPacket.HEADER_SIZE
+        return UdpPacket(frame_index, packet_index, num_packets,
+                         packet[start: start + data_size], layer, num_parity)
+
+    @staticmethod
+    def decode_batch(packets: list, offset: int = 0) -> list:
+        """
+        Decodes a batch of packets (each starting at a given offset).
+        Returns a list of UdpPackets, without the invalid packets.
+        """
+        unpack = UdpPacket.HEADER_STRUCT.unpack_from
+        header_end = offset + UdpPacket.HEADER_SIZE
+        decoded = []
+        for packet in packets:
+            if len(packet) < header_end:
+                print('Invalid UdpPacket: too short')
+                continue
+            layer, frame_index, packet_index, num_packets, num_parity, \
+                data_size = unpack(packet, offset)
+            decoded.append(UdpPacket(
+                frame_index, packet_index, num_packets,
+                packet[header_end: header_end + data_size], layer,
+                num_parity))
+        return decoded
 
     def encode(self) -> bytes:
         """ Encodes the packet. """
-        return self.header + self.data
+        return UdpPacket.HEADER_STRUCT.pack(
+            self.layer, self.frame_index, self.packet_index,
+            self.num_packets, self.num_parity, self.data_size) + self.data
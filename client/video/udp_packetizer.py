@@ -0,0 +1,77 @@
+"""
+    Hadar Shahar
+    UdpPacketizer.
+"""
+import math
+from client.video.parity_fec import ParityFec
+from client.video.udp_packet import UdpPacket
+
+
+class UdpPacketizer(object):
+    """
+    Definition of the class UdpPacketizer.
+
+    Splits frames into packets (like UdpPacketsHandler.create_packets)
+    without copying the frame data: the header of each packet (with the
+    id prefix of the client, see BasicUdpClient.pack_data) is written
+    with pack_into into a buffer that's reused for the next frames,
+    and the data of each packet is a memoryview of the frame.
+    Each packet is a (header, data) pair, which is sent with sendmsg
+    (see BasicUdpClient.send_buffers), so the data is copied only
+    into the socket.
+    """
+
+    def __init__(self, prefix: bytes = b''):
+        """
+        Constructor.
+        Receives the prefix of all the packets (the client id prefix).
+        """
+        self.prefix = prefix
+        self.header_size = len(prefix) + UdpPacket.HEADER_SIZE
+        # the headers of the packets of the last frame, one after the other
+        self.headers = bytearray()
+
+    def packetize(self, frame_index: int, layers: list,
+                  fec_group_size: int = 0) -> list:
+        """
+        Returns the packets of the given simulcast layers of a frame:
+        a list of (header, data) buffers.
+        If fec_group_size isn't 0, a parity packet is added for every
+        fec_group_size data packets of each layer (see ParityFec).
+        The headers are overwritten by the next call, so the packets
+        must be sent before it.
+        """
+        chunk_size = UdpPacket.MAX_DATA_SIZE - UdpPacket.HEADER_SIZE
+        # (layer, data packets, all the data of the packets)
+        layers_chunks = []
+        for layer, data in enumerate(layers):
+            view = memoryview(data)
+            num_packets = math.ceil(len(data) / chunk_size)
+            chunks = [view[i * chunk_size: (i + 1) * chunk_size]
+                      for i in range(num_packets)]
+            num_parity = ParityFec.get_num_parity(num_packets,
+                                                  fec_group_size)
+            if num_parity:
+                chunks += ParityFec.create_parity_chunks(data, chunk_size,
+                                                         num_parity)
+            layers_chunks.append((layer, num_packets, chunks))
+
+        total = sum(len(chunks) for _, _, chunks in layers_chunks)
+        if len(self.headers) < total * self.header_size:
+            # the prefixes are written once, when the buffer is allocated
+            self.headers = bytearray(
+                (self.prefix + bytes(UdpPacket.HEADER_SIZE)) * total)
+        headers = memoryview(self.headers)
+
+        packets = []
+        offset = 0
+        for layer, num_packets, chunks in layers_chunks:
+            num_parity = len(chunks) - num_packets
+            for i, chunk in enumerate(chunks):
+                UdpPacket.HEADER_STRUCT.pack_into(
+                    self.headers, offset + len(self.prefix), layer,
+                    frame_index, i, num_packets, num_parity, len(chunk))
+                packets.append(
+                    (headers[offset: offset + self.header_size], chunk))
+                offset += self.header_size
+        return packets
@@ -3,58 +3,243 @@
     UdpPacketsHandler.
 """
 import math
-from typing import Union
+import time
+from typing import Dict
 from client.video.udp_packet import UdpPacket
+from client.video.parity_fec import ParityFec
+from client.video.frame_buffer import FrameBuffer
+from network.custom_messages.receiver_report import ReceiverReport
 
 
 class UdpPacketsHandler:
-    """ Definition of the class UdpPacketsHandler. """
+    """
+    Definition of the class UdpPacketsHandler.
+
+    Reassembles the frames of a single sender. Up to MAX_FRAMES_IN_FLIGHT
+    frames are collected at once, so packets that arrive out of order
+    (even packets of an older frame after packets of a newer one) aren't
+    lost. The frames are returned in order: a frame waits for the
+    previous frames until they're completed or FRAME_DEADLINE passes.
+    The deadlines are checked when packets are processed.
+    """
 
     RECEIVED_PACKETS_THRESHOLD = 0.9  # in percent
 
+    # the maximum number of incomplete frames that are collected at once
+    MAX_FRAMES_IN_FLIGHT = 3
+
+    # how long to wait for a frame (in seconds) since its last packet
+    # was received, before dropping it or skipping it (if none of its
+    # packets was received, since the next frame's first packet).
+    # it's measured since the last packet since the packets of a frame
+    # are spread over the frame interval (see PacketPacer)
+    FRAME_DEADLINE = 0.06
+
+    # a missing packet is requested again (see get_nacks) when a packet
+    # that was sent NACK_REORDER_TOLERANCE packets after it was received,
+    # or when the last packet of the frame or a packet of a newer frame
+    # was received
+    NACK_REORDER_TOLERANCE = 3
+
+    # a sender whose packets haven't been received for that long
+    # (in seconds) has stopped sending (see is_active)
+    STREAM_TIMEOUT = 5
+
     def __init__(self):
         """ Constructor. """
-        self.current_frame_index = None
-        self.packets_data = []
-        self.remaining_packets = None
+        # { frame index: FrameBuffer }
+        self.frames: Dict[int, FrameBuffer] = {}
+        # the index of the next frame to return (None before the first
+        # packet is received)
+        self.next_frame_index = None
+        # the layer of the last returned frame
+        self.current_layer = None
+        # the highest frame index that was received
+        self.max_frame_index = None
+
+        self.restored_packets = 0  # the number of restored packets
+        # data packets of frames that were already returned or dropped
+        self.late_packets = 0
+        self.dropped_frames = 0    # incomplete frames that were dropped
+        self.reordered_packets = 0  # packets of an older frame
+        self.max_reorder_depth = 0  # in frames
 
-    def process_packet(self, p: UdpPacket) -> Union[bytes, None]:
+        # the reception since the last report (see create_report),
+        # the packets are counted when their frame is returned or dropped
+        self.report_time = time.monotonic()
+        # the time the last packet was received (None before the first)
+        self.last_packet_time = None
+        self.received_packets = 0
+        self.expected_packets = 0
+        self.received_bytes = 0
+        # the mean deviation of the time between the frames (in seconds,
+        # like the RTP interarrival jitter, but without the send times)
+        self.jitter = 0
+        self.last_frame_time = None
+        self.last_frame_interval = None
+
+    def process_packet(self, p: UdpPacket) -> list:
         """
         Processes a given packet.
-        If all the packets were collected, returns the full frame.
-        Otherwise, returns None.
+        Returns a list of the full frames that are ready (in order).
+        """
+        now = time.monotonic()
+        self.last_packet_time = now
+        self.received_bytes += len(p.data)
+        if self.next_frame_index is None:
+            self.next_frame_index = p.frame_index
+            self.max_frame_index = p.frame_index
+
+        if p.frame_index < self.max_frame_index:
+            self.reordered_packets += 1
+            self.max_reorder_depth = max(
+                self.max_reorder_depth, self.max_frame_index - p.frame_index)
+        else:
+            self.max_frame_index = p.frame_index
+
+        if p.frame_index < self.next_frame_index:
+            # the server switches to another simulcast layer only at
+            # the beginning of a frame, which might have the same frame
+            # index as the last returned frame (it isn't late).
+            # the parity packets after the frame was completed aren't
+            # needed anyway
+            if p.layer == self.current_layer and \
+                    p.packet_index < p.num_packets:
+                self.late_packets += 1
+            return []
+
+        frame = self.frames.get(p.frame_index)
+        if frame is None or frame.layer != p.layer:
+            if frame is None:
+                self.update_jitter(now)
+            frame = self.frames[p.frame_index] = FrameBuffer(p, now)
+        frame.add_packet(p)
+        frame.last_arrival_time = now
+        return self.get_ready_frames(now)
+
+    def update_jitter(self, now: float):
+        """ Updates the jitter when a new frame starts to arrive. """
+        if self.last_frame_time is not None:
+            interval = now - self.last_frame_time
+            if self.last_frame_interval is not None:
+                # J = J + (|D| - J) / 16, like in RFC 3550
+                deviation = abs(interval - self.last_frame_interval)
+                self.jitter += (deviation - self.jitter) / 16
+            self.last_frame_interval = interval
+        self.last_frame_time = now
+
+    def create_report(self) -> ReceiverReport:
+        """
+        Returns the report of the reception since the last report.
+        If nothing was received since then, everything was lost: a
+        sender sends frames (even empty ones) while it's sending.
         """
-        full_frame = b''
+        now = time.monotonic()
+        elapsed = max(now - self.report_time, 1e-3)
+        loss = 0
+        if self.expected_packets:
+            # the retransmitted packets are counted as received
+            loss = 1 - self.received_packets / self.expected_packets
+        elif not self.received_bytes and self.last_packet_time is not None:
+            loss = 1
+        report = ReceiverReport(loss, self.jitter,
+                                self.received_bytes * 8 / elapsed)
+        self.report_time = now
+        self.received_packets = self.received_bytes = 0
+        self.expected_packets = 0
+        return report
 
-        # if it's the first packet, or just a more recent packet,
-        # drop all the packets collected so far, or fill the missing packets
-        is_first_packet = self.current_frame_index is None
-        if is_first_packet or p.frame_index > self.current_frame_index:
+    def is_active(self, now: float) -> bool:
+        """
+        Returns whether the sender's packets were received in the last
+        STREAM_TIMEOUT (if not, it has stopped sending, and its reports
+        aren't needed).
+        """
+        return self.last_packet_time is not None and \
+            now - self.last_packet_time < UdpPacketsHandler.STREAM_TIMEOUT
 
-            if not is_first_packet and self.remaining_packets != 0:
-                # full_frame = self.handle_missing_packets()
-                full_frame = b''
+    def get_ready_frames(self, now: float) -> list:
+        """
+        Returns the frames that are ready in order, drops the expired
+        incomplete frames and skips the frames that none of their
+        packets was received until the deadline.
+        """
+        ready = []
+        while self.frames:
+            frame_index = min(self.frames)
+            frame = self.frames[frame_index]
+            # the next frame waits since its last packet was received,
+            # and the missing frames before a frame since its first one
+            if frame_index == self.next_frame_index:
+                waited = now - frame.last_arrival_time
+            else:
+                waited = now - frame.arrival_time
 
-            self.current_frame_index = p.frame_index
-            self.packets_data = [b''] * p.num_packets
-            self.remaining_packets = p.num_packets
+            if frame_index == self.next_frame_index and frame.is_complete():
+                self.release_frame(frame_index, frame)
+                self.current_layer = frame.layer
+                full_frame = frame.get_frame()
+                if full_frame:
+                    ready.append(full_frame)
 
-        # if the packet is too old, drop it
-        if p.frame_index < self.current_frame_index:
-            # print('Frame is too old, dropping it.')
-            return None
+            elif waited > UdpPacketsHandler.FRAME_DEADLINE or \
+                    len(self.frames) > UdpPacketsHandler.MAX_FRAMES_IN_FLIGHT:
+                if frame_index == self.next_frame_index:
+                    # drop the incomplete frame
+                    self.release_frame(frame_index, frame)
+                    self.dropped_frames += 1
+                else:
+                    # skip the frames that none of their packets arrived,
+                    # they're expected to have as many packets as this one
+                    skipped = frame_index - self.next_frame_index
+                    self.dropped_frames += skipped
+                    self.expected_packets += skipped * frame.num_packets
+                    self.next_frame_index = frame_index
+            else:
+                break
+        return ready
 
-        # place the packet at the right place
-        if p.packet_index >= len(self.packets_data):
-            print('malformed packet.')
-            return None
-        self.packets_data[p.packet_index] = p.data
-        self.remaining_packets -= 1
+    def release_frame(self, frame_index: int, frame: FrameBuffer):
+        """
+        Removes a frame that's returned or dropped, and counts its packets.
+        """
+        del self.frames[frame_index]
+        self.next_frame_index += 1
+        self.restored_packets += frame.restored_packets
+        self.received_packets += frame.received_packets
+        self.expected_packets += frame.num_packets
 
-        if self.remaining_packets == 0:
-            full_frame = b''.join(self.packets_data)
+    def get_nacks(self) -> list:
+        """
+        Returns the packets to request again: the missing packets of the
+        frames in flight that are probably lost (and not just late),
+        which weren't requested yet.
+        A list of (layer, frame index, [packet indexes]).
+        """
+        deadline = time.monotonic() - UdpPacketsHandler.FRAME_DEADLINE
+        nacks = []
+        for frame_index, frame in self.frames.items():
+            if frame.is_complete() or frame.last_arrival_time < deadline:
+                continue
+            if frame_index < self.max_frame_index or \
+                    frame.max_packet_index == len(frame.packets_data) - 1:
+                until = len(frame.packets_data)
+            else:
+                until = frame.max_packet_index + 1 - \
+                    UdpPacketsHandler.NACK_REORDER_TOLERANCE
+            missing = frame.get_missing_indexes(until)
+            if missing:
+                nacks.append((frame.layer, frame_index, missing))
+        return nacks
 
-        return full_frame if full_frame else None
+    def stats(self) -> dict:
+        """ Returns the reassembly counters. """
+        return {'frames_in_flight': len(self.frames),
+                'restored_packets': self.restored_packets,
+                'late_packets': self.late_packets,
+                'dropped_frames': self.dropped_frames,
+                'reordered_packets': self.reordered_packets,
+                'max_reorder_depth': self.max_reorder_depth}
 
     # def handle_missing_packets(self) -> bytes:
     #     # num_packets = len(self.packets_data)
@@ -77,15 +262,28 @@ class UdpPacketsHandler:
     #             self.packets_data[i] = self.packets_data[i-1]
 
     @staticmethod
-    def create_packets(frame_index: int, data: bytes) -> list:
+    def create_packets(frame_index: int, data: bytes, layer: int = 0,
+                       fec_group_size: int = 0) -> list:
         """
-        Returns a list of UdpPacket ready to be sent.
+        Returns a list of UdpPacket ready to be sent
+        (of a given simulcast layer).
+        If fec_group_size isn't 0, a parity packet is added for every
+        fec_group_size data packets (see ParityFec).
         """
         chunk_size = UdpPacket.MAX_DATA_SIZE - UdpPacket.HEADER_SIZE
         num_packets = math.ceil(len(data) / chunk_size)
+        num_parity = ParityFec.get_num_parity(num_packets, fec_group_size)
         packets = []
 
         for i in range(num_packets):
             chunk = data[i * chunk_size: (i + 1) * chunk_size]
-            packets.append(UdpPacket(frame_index, i, num_packets, chunk))
+            packets.append(UdpPacket(frame_index, i, num_packets, chunk,
+                                     layer, num_parity))
+        if num_parity:
+            parity_chunks = ParityFec.create_parity_chunks(
+                data, chunk_size, num_parity)
+            for g, chunk in enumerate(parity_chunks):
+                packets.append(UdpPacket(frame_index, num_packets + g,
+                                         num_packets, chunk, layer,
+                                         num_parity))
         return packets
@@ -12,19 +12,59 @@ class VideoEncoder(object):
     # the quality of the image from 0 to 100 (the higher is the better)
     JPEG_QUALITY = 80  # default is 95
 
+    # the simulcast layers: (size divider, jpeg quality),
+    # layer 0 is the full frame and each layer is smaller than the previous
+    LAYERS = ((1, JPEG_QUALITY), (2, 70), (4, 60))
+
     @staticmethod
-    def encode_frame(frame: np.ndarray) -> bytes:
+    def encode_frame(frame: np.ndarray, quality: int = None) -> bytes:
         """
         Receives a frame, encodes it to JPEG format
         and converts it to bytes.
         """
+        if quality is None:
+            quality = VideoEncoder.JPEG_QUALITY
         # change the quality of the image
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY),
-                        VideoEncoder.JPEG_QUALITY]
+        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
         flag, encoded_image = cv2.imencode('.jpg', frame, encode_param)
         data = encoded_image.tobytes()
         return data
 
+    @staticmethod
+    def encode_layers(frame: np.ndarray, num_layers: int,
+                      max_quality: int = JPEG_QUALITY,
+                      scale: float = 1) -> list:
+        """
+        Encodes the first num_layers simulcast layers of a frame,
+        scaled by a given scale and with at most a given quality
+        (see RateController).
+        Returns a list of the encoded layers.
+        """
+        height, width = frame.shape[:2]
+        width, height = int(width * scale), int(height * scale)
+        layers = []
+        for divider, quality in VideoEncoder.LAYERS[:num_layers]:
+            if divider != 1 or scale != 1:
+                # INTER_AREA is the best interpolation for shrinking
+                frame = cv2.resize(frame, (width // divider,
+                                           height // divider),
+                                   interpolation=cv2.INTER_AREA)
+            layers.append(VideoEncoder.encode_frame(
+                frame, min(quality, max_quality)))
+        return layers
+
+    @staticmethod
+    def get_layer_for_width(width: int, full_width: int,
+                            num_layers: int) -> int:
+        """
+        Returns the smallest layer (of the first num_layers layers)
+        that's still at least as wide as a given width.
+        """
+        for layer in range(num_layers - 1, 0, -1):
+            if full_width // VideoEncoder.LAYERS[layer][0] >= width:
+                return layer
+        return 0
+
     @staticmethod
     def decode_frame_buffer(buffer: bytes) -> np.ndarray:
         """ Decodes the buffer as a cv2 image. """
@@ -0,0 +1,183 @@
+"""
+    Hadar Shahar
+    VideoPipeline.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict
+from client.video.frame_scheduler import FrameScheduler
+from client.video.latest_queue import LatestQueue
+
+
+class VideoPipeline(object):
+    """
+    Definition of the class VideoPipeline.
+
+    Runs the stages of sending video on separate threads, so their
+    latencies don't add up:
+    capture -> (LatestQueue) -> prepare + encode -> send.
+    The frames are encoded by ENCODE_THREADS threads at once (cv2 releases
+    the GIL while encoding). The prepare stage runs in the capture order,
+    one frame at a time (for encoders that depend on the previous frame,
+    like the TileEncoder), and the frames are sent in the capture order.
+    When the encoders fall behind, the captured frames that are waiting
+    are replaced by newer ones (before they're prepared).
+    """
+
+    ENCODE_THREADS = 3
+
+    # the maximum number of frames that are encoded or waiting to be sent
+    # (so a slow send stage makes the capture stage drop frames)
+    MAX_FRAMES_IN_FLIGHT = ENCODE_THREADS + 1
+
+    # how long the stages wait for a frame before checking whether
+    # the pipeline was stopped (in seconds)
+    WAIT_TIMEOUT = 0.1
+
+    # the weight of a new latency in the moving averages
+    LATENCY_WEIGHT = 0.1
+
+    def __init__(self, get_fps: Callable[[], float],
+                 capture: Callable[[], Any], prepare: Callable[[Any], Any],
+                 encode: Callable[[Any], list],
+                 send: Callable[[list], None]):
+        """
+        Constructor.
+        capture returns a frame or None, prepare returns the prepared
+        frame, encode returns the encoded layers of a prepared frame,
+        and send sends them.
+        """
+        self.get_fps = get_fps
+        self.capture = capture
+        self.prepare = prepare
+        self.encode = encode
+        self.send = send
+
+        self.scheduler = FrameScheduler()
+        self.queue = LatestQueue()
+        self.slots = threading.Semaphore(VideoPipeline.MAX_FRAMES_IN_FLIGHT)
+        # the frames are prepared in order, and get increasing indexes
+        self.prepare_lock = threading.Lock()
+        self.next_index = 0
+        # { index: (capture time, encoded layers or None) }
+        self.results: Dict[int, tuple] = {}
+        self.results_condition = threading.Condition()
+        self.next_send_index = 0
+
+        self.stopped = False
+        self.error = None  # an exception that stopped the send stage
+
+        # { stage: moving average of its latency (in seconds) }
+        self.latencies: Dict[str, float] = {}
+        self.sent_frames = 0
+        self.stats_time = time.monotonic()
+
+    def run(self, is_running: Callable[[], bool]):
+        """
+        Runs the capture stage in this thread and the other stages in
+        new threads, until is_running returns False.
+        Raises the exception that stopped the send stage (if any).
+        """
+        threads = [threading.Thread(target=self.encode_loop)
+                   for _ in range(VideoPipeline.ENCODE_THREADS)]
+        threads.append(threading.Thread(target=self.send_loop))
+        for thread in threads:
+            thread.start()
+        try:
+            self.capture_loop(is_running)
+        finally:
+            self.stopped = True
+            for thread in threads:
+                thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def capture_loop(self, is_running: Callable[[], bool]):
+        """ Captures the frames at the frame rate. """
+        while is_running() and self.error is None:
+            self.scheduler.wait(self.get_fps())
+            start = time.monotonic()
+            frame = self.capture()
+            # if the frame was not read successfully
+            if frame is None:
+                continue
+            now = time.monotonic()
+            self.update_latency('capture', now - start)
+            self.queue.put((start, now, frame))
+
+    def encode_loop(self):
+        """ Prepares the frames in order, and encodes them. """
+        while not self.stopped:
+            if not self.slots.acquire(timeout=VideoPipeline.WAIT_TIMEOUT):
+                continue
+            with self.prepare_lock:
+                item = self.queue.get(VideoPipeline.WAIT_TIMEOUT)
+                if item is None:
+                    self.slots.release()
+                    continue
+                capture_time, captured_time, frame = item
+                start = time.monotonic()
+                self.update_latency('queue', start - captured_time)
+                index = self.next_index
+                self.next_index += 1
+                try:
+                    prepared = self.prepare(frame)
+                except Exception as e:
+                    print('prepare:', e)
+                    prepared = None
+
+            layers = None
+            if prepared is not None:
+                try:
+                    layers = self.encode(prepared)
+                except Exception as e:
+                    print('encode:', e)
+            self.update_latency('encode', time.monotonic() - start)
+            with self.results_condition:
+                self.results[index] = (capture_time, layers)
+                self.results_condition.notify()
+
+    def send_loop(self):
+        """ Sends the encoded frames in order. """
+        while not self.stopped:
+            with self.results_condition:
+                if not self.results_condition.wait_for(
+                        lambda: self.next_send_index in self.results,
+                        VideoPipeline.WAIT_TIMEOUT):
+                    continue
+                capture_time, layers = self.results.pop(self.next_send_index)
+            self.next_send_index += 1
+            if layers is not None:
+                start = time.monotonic()
+                try:
+                    self.send(layers)
+                except Exception as e:
+                    self.error = e
+                    self.stopped = True
+                    return
+                now = time.monotonic()
+                self.update_latency('send', now - start)
+                self.update_latency('total', now - capture_time)
+                self.sent_frames += 1
+            self.slots.release()
+
+    def update_latency(self, stage: str, latency: float):
+        """ Updates the moving average of a stage's latency. """
+        average = self.latencies.get(stage, latency)
+        self.latencies[stage] = average + \
+            (latency - average) * VideoPipeline.LATENCY_WEIGHT
+
+    def stats(self) -> dict:
+        """
+        Returns the average latency of each stage (in milliseconds),
+        the frame rate since the last call, and the dropped frames.
+        """
+        now = time.monotonic()
+        fps = self.sent_frames / max(now - self.stats_time, 1e-3)
+        self.sent_frames = 0
+        self.stats_time = now
+        stats = {f'{stage}_ms': latency * 1000
+                 for stage, latency in self.latencies.items()}
+        stats.update(fps=fps, dropped_frames=self.queue.dropped,
+                     skipped_frames=self.scheduler.skipped_frames)
+        return stats
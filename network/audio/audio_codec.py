@@ -0,0 +1,62 @@
+"""
+    Hadar Shahar
+    AudioCodec.
+"""
+import struct
+from abc import ABC, abstractmethod
+import numpy as np
+
+
+class AudioCodec(ABC):
+    """
+    Definition of the abstract class AudioCodec.
+
+    Encodes the audio chunks of a stream (16 bit mono samples at
+    AudioStream.RATE), and decodes them back. Each encoded chunk starts
+    with the codec id, so every receiver can decode the chunks of every
+    sender, whichever codec it uses (see create_codec).
+    A codec object encodes or decodes a single stream,
+    since it might keep state between the chunks.
+    """
+
+    # the id in the header of the encoded chunks, each codec has its own
+    CODEC_ID = None
+
+    # the codec id
+    HEADER_STRUCT = struct.Struct('>B')
+
+    def encode(self, chunk: bytes) -> bytes:
+        """ Encodes a given chunk, with the header. """
+        samples = np.frombuffer(chunk, dtype=np.int16)
+        return AudioCodec.HEADER_STRUCT.pack(self.CODEC_ID) + \
+            self.encode_samples(samples)
+
+    def decode(self, data: bytes) -> bytes:
+        """ Decodes a given encoded chunk (with the header). """
+        samples = self.decode_samples(
+            data[AudioCodec.HEADER_STRUCT.size:])
+        return np.clip(np.rint(samples), -32768, 32767).astype(
+            np.int16).tobytes()
+
+    @staticmethod
+    def get_codec_id(data: bytes):
+        """
+        Returns the codec id of a given encoded chunk,
+        or None if it's too short.
+        """
+        if len(data) < AudioCodec.HEADER_STRUCT.size:
+            return None
+        return AudioCodec.HEADER_STRUCT.unpack_from(data)[0]
+
+    @abstractmethod
+    def encode_samples(self, samples: np.ndarray) -> bytes:
+        """ Encodes the samples (int16) of a chunk. """
+        pass
+
+    @abstractmethod
+    def decode_samples(self, payload: bytes) -> np.ndarray:
+        """
+        Decodes the samples of a chunk
+        (in the range of int16, at AudioStream.RATE).
+        """
+        pass
@@ -0,0 +1,18 @@
+"""
+    Hadar Shahar
+    The audio codecs by their ids (see AudioCodec).
+"""
+from network.audio.audio_codec import AudioCodec
+from network.audio.mulaw_codec import MuLawCodec
+from network.audio.pcm_codec import PcmCodec
+
+CODECS = {codec.CODEC_ID: codec for codec in (PcmCodec, MuLawCodec)}
+
+
+def create_codec(codec_id: int) -> AudioCodec:
+    """
+    Returns a new codec object of a given codec id,
+    or None if there's no such codec.
+    """
+    codec = CODECS.get(codec_id)
+    return codec() if codec is not None else None
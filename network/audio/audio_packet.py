@@ -0,0 +1,73 @@
+"""
+    Hadar Shahar
+    AudioPacket.
+"""
+import struct
+
+
+class AudioPacket:
+    """
+    Definition of the class AudioPacket.
+    An encoded audio chunk (see AudioCodec) with its sequence number
+    and its capture timestamp, so the receiver can reorder the chunks,
+    find the lost ones and play them on time (see JitterBuffer).
+    """
+
+    # '>' for big-endian, the sequence number and the timestamp
+    # (unsigned ints of 4 bytes)
+    HEADER_STRUCT = struct.Struct('>2I')
+    HEADER_SIZE = HEADER_STRUCT.size
+
+    # the sequence numbers and the timestamps wrap around at 2 ** 32
+    # (the timestamp after about 27 hours at 44100 Hz), so they're
+    # advanced by advance and compared by distance (like RFC 1982)
+    MODULO = 2 ** 32
+    HALF_MODULO = 2 ** 31
+
+    __slots__ = ('sequence', 'timestamp', 'data')
+
+    def __init__(self, sequence: int, timestamp: int, data: bytes):
+        """ Constructor. """
+        # the index of the packet in the sender's stream,
+        # it's incremented for every sent packet
+        self.sequence = sequence
+        # the index of the first sample of the chunk in the sender's
+        # stream (at AudioStream.RATE), it's advanced by the silent
+        # chunks that aren't sent too
+        self.timestamp = timestamp
+        self.data = data  # the encoded chunk
+
+    @staticmethod
+    def advance(number: int, count: int = 1) -> int:
+        """ Returns a sequence number or a timestamp advanced by count. """
+        return (number + count) % AudioPacket.MODULO
+
+    @staticmethod
+    def distance(a: int, b: int) -> int:
+        """
+        Returns a - b of two sequence numbers or timestamps, which is
+        negative if a is older than b (even if the counter has wrapped
+        around between them).
+        """
+        return (a - b + AudioPacket.HALF_MODULO) % AudioPacket.MODULO - \
+            AudioPacket.HALF_MODULO
+
+    @staticmethod
+    def decode(packet: bytes, offset: int = 0):
+        """
+        Decodes a given packet (starting at a given offset)
+        and returns an AudioPacket or None if it's invalid packet.
+        """
+        try:
+            sequence, timestamp = AudioPacket.HEADER_STRUCT.unpack_from(
+                packet, offset)
+        except struct.error as e:
+            print('Invalid AudioPacket:', e)
+            return None
+        return AudioPacket(sequence, timestamp,
+                           packet[offset + AudioPacket.HEADER_SIZE:])
+
+    def encode(self) -> bytes:
+        """ Encodes the packet. """
+        return AudioPacket.HEADER_STRUCT.pack(
+            self.sequence, self.timestamp) + self.data
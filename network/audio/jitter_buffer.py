@@ -0,0 +1,304 @@
+"""
+    Hadar Shahar
+    JitterBuffer.
+"""
+import threading
+import time
+import numpy as np
+from network.audio.audio_codec import AudioCodec
+from network.audio.audio_codecs import create_codec
+from network.audio.audio_packet import AudioPacket
+from network.audio.loss_concealer import LossConcealer
+
+
+class JitterBuffer(object):
+    """
+    Definition of the class JitterBuffer.
+
+    Buffers the audio packets of a single sender, and plays them out
+    in order on a fixed clock: the player reads a fixed number of samples
+    at a time (see read). The packets are reordered by their sequence
+    numbers (which wrap around, see AudioPacket.distance), the
+    duplicates are dropped, and so are the packets that
+    arrive after their turn to play (late). A missing packet is
+    concealed (see LossConcealer) when the packets after it have
+    already arrived. When the buffer runs out, the audio is concealed
+    for a while too, in case the next packets are lost or only late.
+
+    The playout delay adapts to the network: the jitter of the arrival
+    times is estimated (like RTP, RFC 3550), and each talk spurt starts
+    playing after the target delay, which is just enough for that
+    jitter. When the buffer runs out (the sender stopped talking, or
+    its packets are late), the next packets are buffered again. If the
+    buffered audio grows much longer than the target delay, packets
+    are skipped, so the delay doesn't grow.
+    """
+
+    # the sample rate of the streams (AudioStream.RATE)
+    RATE = 44100
+
+    # the number of samples in a packet until one is decoded
+    # (AudioStream.CHUNK)
+    DEFAULT_PACKET_SAMPLES = 1024
+
+    # the limits of the target delay (in seconds)
+    MIN_DELAY = 0.02
+    MAX_DELAY = 0.3
+    # how many times the jitter is added to the target delay
+    JITTER_FACTOR = 3
+    # the weight of each new jitter sample (like RFC 3550)
+    JITTER_GAIN = 1 / 16
+
+    # when the buffer runs out, the audio is concealed for up to that
+    # long (in seconds) before it stops playing (the concealment fades
+    # out by then)
+    MAX_UNDERRUN_CONCEALMENT = LossConcealer.HOLD + LossConcealer.FADE
+
+    # a sequence number that's so much older than the played ones means
+    # that the sender has restarted its stream
+    RESET_DISTANCE = 100
+
+    def __init__(self):
+        """ Constructor. """
+        # the packets are put by the receiving thread,
+        # and read by the playout thread
+        self.lock = threading.Lock()
+        # { sequence number: AudioPacket }
+        self.packets = {}
+        # the sequence number of the next packet to play,
+        # and the timestamp of its first sample
+        self.next_sequence = None
+        self.next_timestamp = 0
+        # the decoded samples that haven't been read yet
+        self.pending = np.zeros(0, dtype=np.int16)
+        self.packet_samples = JitterBuffer.DEFAULT_PACKET_SAMPLES
+        # the codec of the sender (it might change it)
+        self.decoder = None
+        self.concealer = LossConcealer()
+        # the samples that were concealed since the buffer ran out,
+        # they replace the packets that are found to be missing later
+        self.underrun_samples = 0
+
+        self.is_playing = False
+        # the arrival time of the first packet of the talk spurt
+        # that's buffered and isn't playing yet
+        self.first_arrival_time = None
+        self.last_arrival_time = None
+        # the estimated jitter (in seconds), and the timestamp of the
+        # last packet (its arrival time is last_arrival_time)
+        self.jitter = 0.0
+        self.last_timestamp = None
+
+        self.late_packets = 0
+        self.duplicate_packets = 0
+        self.concealed_packets = 0
+        self.underruns = 0
+        self.skipped_packets = 0
+
+    def put(self, packet: AudioPacket, arrival_time: float = None):
+        """
+        Adds a received packet (arrival_time is in time.monotonic()
+        seconds, the current time by default).
+        """
+        if arrival_time is None:
+            arrival_time = time.monotonic()
+        with self.lock:
+            if self.next_sequence is not None:
+                age = AudioPacket.distance(self.next_sequence,
+                                           packet.sequence)
+                if 0 < age < JitterBuffer.RESET_DISTANCE:
+                    self.late_packets += 1
+                    return
+                if age > 0:
+                    self.reset()
+            if packet.sequence in self.packets:
+                self.duplicate_packets += 1
+                return
+
+            if self.last_timestamp is not None:
+                # the change in the transit time (arrival time minus
+                # timestamp) since the last packet
+                transit_change = arrival_time - self.last_arrival_time - \
+                    AudioPacket.distance(packet.timestamp,
+                                         self.last_timestamp) / \
+                    JitterBuffer.RATE
+                self.jitter += (abs(transit_change) - self.jitter) * \
+                    JitterBuffer.JITTER_GAIN
+            self.last_timestamp = packet.timestamp
+            self.last_arrival_time = arrival_time
+
+            self.packets[packet.sequence] = packet
+            if not self.is_playing and self.first_arrival_time is None:
+                self.first_arrival_time = arrival_time
+
+    def reset(self):
+        """
+        Forgets the stream (when the sender restarts it).
+        Must be called while holding the lock.
+        """
+        self.packets.clear()
+        self.next_sequence = None
+        self.pending = np.zeros(0, dtype=np.int16)
+        self.is_playing = False
+        self.first_arrival_time = None
+        self.last_timestamp = None
+        self.underrun_samples = 0
+
+    def read(self, count: int, now: float = None):
+        """
+        Returns the next count samples (int16) to play, padded with
+        zeros if the buffer runs out, or None if nothing is playing
+        (now is in time.monotonic() seconds, the current time by default).
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            if not self.is_playing:
+                if not self.packets or now - self.first_arrival_time < \
+                        self.get_target_delay():
+                    return None
+                self.is_playing = True
+                self.first_arrival_time = None
+                self.concealer.reset()
+                self.underrun_samples = 0
+                self.next_sequence = self.get_first_sequence()
+                self.next_timestamp = \
+                    self.packets[self.next_sequence].timestamp
+            elif self.get_delay() > 2 * self.get_target_delay() + \
+                    self.packet_samples / JitterBuffer.RATE:
+                self.skip_packet()
+
+            chunks = [self.pending]
+            size = len(self.pending)
+            while size < count:
+                samples = self.next_samples()
+                if samples is None:
+                    self.underruns += 1
+                    self.is_playing = False
+                    break
+                chunks.append(samples)
+                size += len(samples)
+            samples = np.concatenate(chunks)
+            if size < count:
+                samples = np.concatenate(
+                    (samples, np.zeros(count - size, dtype=np.int16)))
+            self.pending = samples[count:]
+            return samples[:count]
+
+    def next_samples(self):
+        """
+        Returns the samples of the next packet (or its concealment),
+        or None if the buffer ran out.
+        Must be called while holding the lock.
+        """
+        packet = self.packets.pop(self.next_sequence, None)
+        if packet is not None:
+            # the silent chunks between the packets weren't sent
+            gap = min(AudioPacket.distance(packet.timestamp,
+                                           self.next_timestamp),
+                      int(JitterBuffer.MAX_DELAY * JitterBuffer.RATE))
+            silence = np.zeros(max(gap, 0), dtype=np.int16)
+            self.concealer.add_history(silence)
+            samples = np.concatenate((silence, self.decode(packet)))
+            self.next_timestamp = AudioPacket.advance(packet.timestamp,
+                                                      self.packet_samples)
+            self.underrun_samples = 0
+        elif self.packets:
+            # the packet is lost (or too late), the next ones are here
+            self.concealed_packets += 1
+            if self.underrun_samples >= self.packet_samples:
+                # it was already concealed while the buffer was empty
+                self.underrun_samples -= self.packet_samples
+                samples = np.zeros(0, dtype=np.int16)
+            else:
+                samples = self.conceal(self.packet_samples)
+                self.advance_timestamp()
+        elif self.underrun_samples < JitterBuffer.MAX_UNDERRUN_CONCEALMENT \
+                * JitterBuffer.RATE:
+            # the next packet might be lost or late, so it isn't passed
+            samples = self.conceal(self.packet_samples)
+            self.advance_timestamp()
+            self.underrun_samples += self.packet_samples
+            return samples
+        else:
+            return None
+        self.next_sequence = AudioPacket.advance(self.next_sequence)
+        return samples
+
+    def get_first_sequence(self) -> int:
+        """
+        Returns the oldest buffered sequence number (the buffered ones
+        are close to each other, so they're compared to any of them).
+        Must be called while holding the lock.
+        """
+        some_sequence = next(iter(self.packets))
+        return min(self.packets, key=lambda sequence: AudioPacket.distance(
+            sequence, some_sequence))
+
+    def advance_timestamp(self):
+        """
+        Advances the timestamp of the next packet by a packet.
+        Must be called while holding the lock.
+        """
+        self.next_timestamp = AudioPacket.advance(self.next_timestamp,
+                                                  self.packet_samples)
+
+    def skip_packet(self):
+        """
+        Skips the next packet, to reduce the delay.
+        It's still decoded, so the codec's state stays continuous.
+        Must be called while holding the lock.
+        """
+        packet = self.packets.pop(self.next_sequence, None)
+        if packet is not None:
+            self.decode(packet)
+            self.next_sequence = AudioPacket.advance(self.next_sequence)
+            self.advance_timestamp()
+            self.skipped_packets += 1
+
+    def decode(self, packet: AudioPacket) -> np.ndarray:
+        """
+        Decodes a packet by its codec id, or conceals it if its codec
+        is unknown. Must be called while holding the lock.
+        """
+        codec_id = AudioCodec.get_codec_id(packet.data)
+        if self.decoder is None or self.decoder.CODEC_ID != codec_id:
+            self.decoder = create_codec(codec_id)
+            if self.decoder is None:
+                print('unknown audio codec:', codec_id)
+                return self.conceal(self.packet_samples)
+        samples = np.frombuffer(self.decoder.decode(packet.data),
+                                dtype=np.int16)
+        if len(samples):
+            self.packet_samples = len(samples)
+        return self.concealer.process(samples)
+
+    def conceal(self, count: int) -> np.ndarray:
+        """ Returns the samples that replace a missing packet. """
+        return self.concealer.conceal(count)
+
+    def get_target_delay(self) -> float:
+        """ Returns the target playout delay (in seconds). """
+        delay = self.packet_samples / JitterBuffer.RATE + \
+            JitterBuffer.JITTER_FACTOR * self.jitter
+        return min(max(delay, JitterBuffer.MIN_DELAY), JitterBuffer.MAX_DELAY)
+
+    def get_delay(self) -> float:
+        """
+        Returns the duration of the buffered audio (in seconds).
+        Must be called while holding the lock.
+        """
+        return (len(self.pending) + len(self.packets) * self.packet_samples) \
+            / JitterBuffer.RATE
+
+    def stats(self) -> dict:
+        """ Returns the stats of the buffer. """
+        with self.lock:
+            return {'delay': self.get_delay() if self.is_playing else 0.0,
+                    'target_delay': self.get_target_delay(),
+                    'jitter': self.jitter,
+                    'late_packets': self.late_packets,
+                    'duplicate_packets': self.duplicate_packets,
+                    'concealed_packets': self.concealed_packets,
+                    'underruns': self.underruns,
+                    'skipped_packets': self.skipped_packets}
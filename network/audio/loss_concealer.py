@@ -0,0 +1,121 @@
+"""
+    Hadar Shahar
+    LossConcealer.
+"""
+import numpy as np
+
+
+class LossConcealer(object):
+    """
+    Definition of the class LossConcealer.
+
+    Replaces the lost packets of a stream with a continuation of the
+    audio before them (like the packet loss concealment of G.711,
+    appendix I): the pitch period of the last played samples is found
+    by their autocorrelation, and the last period is repeated. It keeps
+    the full volume for HOLD seconds, and then fades out over FADE
+    seconds, so a long loss becomes silence. When the packets arrive
+    again, the first MERGE samples are cross-faded with the
+    continuation, so there's no click.
+    Each LossConcealer conceals a single stream: all its decoded
+    samples must pass through process.
+    """
+
+    # the sample rate of the stream (AudioStream.RATE)
+    RATE = 44100
+
+    # the number of played samples that are kept
+    HISTORY = 2048
+    # the pitch periods that are searched (in samples, 55 - 400 Hz)
+    MIN_PERIOD = 110
+    MAX_PERIOD = 800
+    # the number of samples that are compared to find the period
+    TEMPLATE = 256
+
+    # the concealment is at full volume for HOLD seconds,
+    # then it fades out during FADE seconds
+    HOLD = 0.01
+    FADE = 0.05
+
+    # the number of samples that are cross-faded after a concealment
+    MERGE = 256
+
+    def __init__(self):
+        """ Constructor. """
+        self.history = np.zeros(LossConcealer.HISTORY)
+        # the period that's repeated since the loss started (None if
+        # there's no loss), and the number of concealed samples
+        self.cycle = None
+        self.concealed_samples = 0
+
+    def reset(self):
+        """ Forgets the history (when a new talk spurt starts). """
+        self.history[:] = 0
+        self.cycle = None
+        self.concealed_samples = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Returns the decoded samples (int16) of a received packet,
+        cross-faded with the concealment if it's the first one after it.
+        """
+        if self.cycle is not None:
+            merge = min(LossConcealer.MERGE, len(samples))
+            weights = np.linspace(0, 1, merge, endpoint=False)
+            samples = samples.astype(np.float64)
+            samples[:merge] = samples[:merge] * weights + \
+                self.continue_cycle(merge) * (1 - weights)
+            self.cycle = None
+            self.concealed_samples = 0
+            samples = np.rint(samples).astype(np.int16)
+        self.add_history(samples)
+        return samples
+
+    def conceal(self, count: int) -> np.ndarray:
+        """ Returns the samples (int16) that replace a lost packet. """
+        if self.cycle is None:
+            self.cycle = self.history[-self.find_period():]
+        samples = self.continue_cycle(count)
+        self.add_history(samples)
+        return np.rint(samples).astype(np.int16)
+
+    def continue_cycle(self, count: int) -> np.ndarray:
+        """
+        Returns the next count samples of the repeated period, faded,
+        and advances the concealment.
+        """
+        period = len(self.cycle)
+        positions = np.arange(self.concealed_samples,
+                              self.concealed_samples + count)
+        gains = 1 - (positions / LossConcealer.RATE - LossConcealer.HOLD) \
+            / LossConcealer.FADE
+        self.concealed_samples += count
+        return self.cycle[positions % period] * np.clip(gains, 0, 1)
+
+    def find_period(self) -> int:
+        """
+        Returns the pitch period of the history: the lag at which the
+        last TEMPLATE samples are the most similar to the ones before.
+        """
+        template = self.history[-LossConcealer.TEMPLATE:]
+        # the samples from MAX_PERIOD to MIN_PERIOD samples
+        # before the template (and the length of the template)
+        start = len(self.history) - LossConcealer.TEMPLATE - \
+            LossConcealer.MAX_PERIOD
+        candidates = self.history[start:-LossConcealer.MIN_PERIOD]
+        correlations = np.correlate(candidates, template, 'valid')
+        # the energy of each window, from the cumulative sum
+        squares = np.concatenate(([0], np.cumsum(candidates ** 2)))
+        energies = squares[LossConcealer.TEMPLATE:] - \
+            squares[:-LossConcealer.TEMPLATE]
+        similarities = correlations / np.sqrt(np.maximum(energies, 0) + 1)
+        return LossConcealer.MAX_PERIOD - int(np.argmax(similarities))
+
+    def add_history(self, samples: np.ndarray):
+        """ Adds the played samples to the history. """
+        if len(samples) >= LossConcealer.HISTORY:
+            self.history = samples[-LossConcealer.HISTORY:].astype(
+                np.float64)
+        else:
+            self.history = np.concatenate(
+                (self.history[len(samples):], samples))
@@ -0,0 +1,40 @@
+"""
+    Hadar Shahar
+    MuLawCodec.
+"""
+import numpy as np
+from network.audio.audio_codec import AudioCodec
+from network.audio.resampler import Resampler
+
+
+class MuLawCodec(AudioCodec):
+    """
+    Definition of the class MuLawCodec.
+    Downsamples the audio by DOWNSAMPLE_FACTOR (to 22050 Hz, which is
+    enough for speech) and compands each sample to 8 bits with the
+    mu-law (like G.711): the quiet samples get more precision than the
+    loud ones. Together, the chunks are 4 times smaller than PCM.
+    """
+
+    CODEC_ID = 1
+
+    MU = 255
+    DOWNSAMPLE_FACTOR = 2
+
+    def __init__(self):
+        """ Constructor. """
+        self.resampler = Resampler(MuLawCodec.DOWNSAMPLE_FACTOR)
+
+    def encode_samples(self, samples: np.ndarray) -> bytes:
+        """ Returns the downsampled companded samples (int8). """
+        x = self.resampler.downsample(samples) / 32768
+        y = np.sign(x) * np.log1p(MuLawCodec.MU * np.abs(x)) / \
+            np.log1p(MuLawCodec.MU)
+        return np.clip(np.rint(y * 127), -127, 127).astype(np.int8).tobytes()
+
+    def decode_samples(self, payload: bytes) -> np.ndarray:
+        """ Expands the samples and upsamples them. """
+        y = np.frombuffer(payload, dtype=np.int8) / 127
+        x = np.sign(y) * np.expm1(np.abs(y) * np.log1p(MuLawCodec.MU)) / \
+            MuLawCodec.MU
+        return self.resampler.upsample(np.clip(x * 32768, -32768, 32767))
@@ -0,0 +1,25 @@
+"""
+    Hadar Shahar
+    PcmCodec.
+"""
+import numpy as np
+from network.audio.audio_codec import AudioCodec
+
+
+class PcmCodec(AudioCodec):
+    """
+    Definition of the class PcmCodec.
+    Sends the raw 16 bit samples, like before there were codecs.
+    """
+
+    CODEC_ID = 0
+
+    def encode_samples(self, samples: np.ndarray) -> bytes:
+        """ Returns the raw samples. """
+        return samples.tobytes()
+
+    def decode_samples(self, payload: bytes) -> np.ndarray:
+        """ Returns the raw samples. """
+        # an odd length can only be a malformed chunk
+        return np.frombuffer(payload[:len(payload) // 2 * 2],
+                             dtype=np.int16)
@@ -0,0 +1,54 @@
+"""
+    Hadar Shahar
+    Resampler.
+"""
+import numpy as np
+
+
+class Resampler(object):
+    """
+    Definition of the class Resampler.
+    Changes the sample rate of a stream by an integer factor, chunk by
+    chunk: downsample low-pass filters the samples (so the frequencies
+    above the new Nyquist frequency don't alias) and keeps every
+    factor-th sample, and upsample interpolates linearly between the
+    samples. The last samples of each chunk are kept, so there are no
+    clicks between the chunks.
+    Each Resampler should either downsample or upsample a single stream.
+    """
+
+    # the number of taps of the low-pass filter
+    TAPS = 31
+
+    def __init__(self, factor: int):
+        """ Constructor. """
+        self.factor = factor
+        # a windowed sinc low-pass filter, which passes up to 90% of
+        # the new Nyquist frequency (in cycles per sample)
+        cutoff = 0.45 / factor
+        n = np.arange(Resampler.TAPS) - (Resampler.TAPS - 1) / 2
+        taps = np.sinc(2 * cutoff * n) * np.hamming(Resampler.TAPS)
+        self.taps = taps / taps.sum()
+        # the last input samples of the previous chunk (for the filter)
+        self.history = np.zeros(Resampler.TAPS - 1)
+        # the last sample of the previous chunk (for the interpolation)
+        self.last_sample = 0.0
+
+    def downsample(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Returns the low-pass filtered samples at the lower rate.
+        The number of samples must be a multiple of the factor.
+        """
+        samples = np.concatenate((self.history, samples))
+        self.history = samples[-(Resampler.TAPS - 1):]
+        return np.convolve(samples, self.taps, 'valid')[::self.factor]
+
+    def upsample(self, samples: np.ndarray) -> np.ndarray:
+        """ Returns the interpolated samples at the higher rate. """
+        if len(samples) == 0:
+            return samples
+        samples = np.concatenate(([self.last_sample], samples))
+        self.last_sample = samples[-1]
+        positions = np.arange(1, (len(samples) - 1) * self.factor + 1) / \
+            self.factor
+        return np.interp(positions, np.arange(len(samples)), samples)
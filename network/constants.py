@@ -24,3 +24,20 @@ UDP_SOCKET_BUFFER_SIZE = 4096
 # when a udp client connects to the meeting, it sends this message
 # to the udp server to inform it that it has connected
 UDP_NEW_CLIENT_MSG = b'HELLO'
+
+# a video client sends this message followed by a layer number (one byte)
+# to the video server, to receive only that simulcast layer
+# (the message is sent from the input socket, like UDP_NEW_CLIENT_MSG)
+UDP_LAYER_REQUEST_MSG = b'LAYER'
+
+# a video client sends this message to the video server (from the input
+# socket) followed by the sender id, the layer (one byte), the frame index
+# (4 bytes) and the indexes of the packets it has missed (2 bytes each),
+# to receive them again
+UDP_NACK_MSG = b'NACK'
+
+# a video client sends this message to the video server (from the input
+# socket) followed by the sender id and a ReceiverReport, about each sender
+# it receives. the server sends it to each sender followed by the
+# aggregated report of its receivers
+UDP_REPORT_MSG = b'REPORT'
@@ -0,0 +1,52 @@
+"""
+    Hadar Shahar
+    ReceiverReport.
+"""
+import struct
+from typing import Union
+
+
+class ReceiverReport(object):
+    """
+    Definition of the class ReceiverReport.
+    The reception quality of a video stream, which a receiver reports
+    (over udp) about each sender it receives.
+    """
+
+    # loss (0 to 1), jitter (seconds), received bitrate (bits per second)
+    STRUCT = struct.Struct('>3f')
+
+    def __init__(self, loss: float, jitter: float, bitrate: float):
+        """ Constructor. """
+        self.loss = loss
+        self.jitter = jitter
+        self.bitrate = bitrate
+
+    def __repr__(self) -> str:
+        """ Returns the report representation. """
+        return f'ReceiverReport({self.__dict__})'
+
+    def encode(self) -> bytes:
+        """ Encodes the report. """
+        return ReceiverReport.STRUCT.pack(self.loss, self.jitter,
+                                          self.bitrate)
+
+    @staticmethod
+    def decode(data: bytes) -> Union['ReceiverReport', None]:
+        """
+        Decodes a given report and returns a ReceiverReport
+        or None if it's invalid.
+        """
+        if len(data) != ReceiverReport.STRUCT.size:
+            return None
+        return ReceiverReport(*ReceiverReport.STRUCT.unpack(data))
+
+    @staticmethod
+    def aggregate(reports: list) -> 'ReceiverReport':
+        """
+        Returns the report of the worst reception of the given reports
+        (the highest loss and jitter, and the lowest bitrate).
+        """
+        return ReceiverReport(max(report.loss for report in reports),
+                              max(report.jitter for report in reports),
+                              min(report.bitrate for report in reports))
@@ -0,0 +1,135 @@
+"""
+    Hadar Shahar
+    PacketReader.
+"""
+import socket
+import struct
+from typing import Union
+from network.constants import NETWORK_BYTES_FORMAT, NETWORK_BYTES_PER_NUM
+
+
+class PacketReader(object):
+    """
+    Definition of the class PacketReader.
+
+    Reads packets (each one is prefixed with its length) from a socket
+    into one growable buffer, in big chunks using socket.recv_into.
+    The packets are returned as memoryviews of the buffer (without copying
+    them), so a packet is valid only until the next read from the socket.
+    """
+
+    DEFAULT_BUFFER_SIZE = 65536
+
+    # the buffer is compacted (or grown) before reading
+    # if there is less free space than this at its end
+    MIN_FREE_SPACE = 4096
+
+    # when the buffer is empty, it's shrunk back to its initial size
+    # if it has grown more than this factor
+    SHRINK_FACTOR = 4
+
+    def __init__(self, sock: socket.socket,
+                 buffer_size=DEFAULT_BUFFER_SIZE):
+        """ Constructor. """
+        self.sock = sock
+        self.initial_size = max(buffer_size, PacketReader.MIN_FREE_SPACE)
+        self.buffer = bytearray(self.initial_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # the start of the data that wasn't handled yet
+        self.end = 0    # the end of the received data
+        # the size of the packet that's waiting to be fully received
+        # (including its length prefix), 0 if it's unknown
+        self.pending_size = 0
+
+    def recv_packet(self) -> memoryview:
+        """
+        Returns the next packet, blocks until it's fully received.
+        Raises ConnectionError if the socket was closed.
+        """
+        packet = self.next_packet()
+        while packet is None:
+            self.fill()
+            packet = self.next_packet()
+        return packet
+
+    def next_packet(self) -> Union[memoryview, None]:
+        """
+        Returns the next packet if it was fully received
+        (without reading from the socket), otherwise None.
+        """
+        n = NETWORK_BYTES_PER_NUM
+        available = self.end - self.start
+        if available < n:
+            return None
+        # struct.unpack_from always returns a tuple
+        data_size = struct.unpack_from(NETWORK_BYTES_FORMAT,
+                                       self.buffer, self.start)[0]
+        if available < n + data_size:
+            self.pending_size = n + data_size
+            return None
+
+        packet = self.view[self.start + n: self.start + n + data_size]
+        self.start += n + data_size
+        self.pending_size = 0
+        return packet
+
+    def fill(self) -> bool:
+        """
+        Receives the available data from the socket into the buffer
+        (blocks if the socket is blocking and there is no data).
+        Raises ConnectionError if the socket was closed.
+        :returns: False if the socket is non-blocking and
+                  there was no data to receive, True otherwise.
+        """
+        self.make_room()
+        try:
+            num_bytes = self.sock.recv_into(self.view[self.end:])
+        except BlockingIOError:
+            return False
+        # 0 bytes means that the socket was closed
+        if num_bytes == 0:
+            raise ConnectionError('The connection was closed.')
+        self.end += num_bytes
+        return True
+
+    def make_room(self):
+        """
+        Makes room at the end of the buffer for the next read:
+        moves the data that wasn't handled to the beginning of the buffer,
+        and grows it if the pending packet doesn't fit.
+        """
+        available = self.end - self.start
+        if available == 0:
+            self.start = self.end = 0
+            if len(self.buffer) > PacketReader.SHRINK_FACTOR * \
+                    self.initial_size:
+                # the buffer was grown for a big packet, it's released
+                # so it won't take memory while it's not needed
+                self.replace_buffer(self.initial_size)
+
+        required_size = max(self.pending_size,
+                            available + PacketReader.MIN_FREE_SPACE)
+        if len(self.buffer) < required_size:
+            self.replace_buffer(max(2 * len(self.buffer), required_size))
+        elif len(self.buffer) - self.end < PacketReader.MIN_FREE_SPACE or \
+                len(self.buffer) - self.start < self.pending_size:
+            # the packets that were returned are in the beginning of the
+            # buffer, and they are not valid after reading anyway
+            self.view[:available] = self.view[self.start: self.end]
+            self.start = 0
+            self.end = available
+
+    def replace_buffer(self, size: int):
+        """
+        Replaces the buffer with a new one of a given size,
+        and copies the data that wasn't handled to its beginning.
+        The old buffer isn't changed, so packets returned from it stay valid
+        (a bytearray can't be resized while memoryviews of it exist).
+        """
+        available = self.end - self.start
+        buffer = bytearray(size)
+        buffer[:available] = self.view[self.start: self.end]
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.start = 0
+        self.end = available
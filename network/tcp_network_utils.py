@@ -4,16 +4,35 @@
 """
 import socket
 import struct
+from typing import Sequence
 from network.constants import NETWORK_BYTES_FORMAT, NETWORK_BYTES_PER_NUM
 
+# socket.sendmsg (scatter-gather sending) isn't available on Windows
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+
+def create_header(data_size: int) -> bytes:
+    """
+    Creates the header of a packet of data,
+    which is its length (padded according to NETWORK_BYTES_FORMAT).
+    """
+    return struct.pack(NETWORK_BYTES_FORMAT, data_size)
+
 
 def create_packet(data: bytes) -> bytes:
     """
     Creates a packet of data prefixed with its length
     (padded according to NETWORK_BYTES_FORMAT).
     """
-    padded_length = struct.pack(NETWORK_BYTES_FORMAT, len(data))
-    return padded_length + data
+    return create_header(len(data)) + data
+
+
+def create_packet_buffers(data: bytes) -> (bytes, bytes):
+    """
+    Creates a packet of data as a tuple of its header and its data,
+    so it can be sent without copying the data (using send_buffers).
+    """
+    return create_header(len(data)), data
 
 
 def recv_packet(sock: socket.socket) -> bytearray:
@@ -32,17 +51,66 @@ def send_packet(sock: socket.socket, data: bytes):
     """
     Sends a packet of data to a given socket.
     """
-    sock.sendall(create_packet(data))
+    sendall_buffers(sock, create_packet_buffers(data))
+
+
+def send_buffers(sock: socket.socket, buffers: Sequence[bytes]) -> int:
+    """
+    Sends the buffers as one contiguous stream of data
+    (without joining them if socket.sendmsg is available).
+    :returns: the number of bytes that were sent.
+    """
+    if HAS_SENDMSG:
+        return sock.sendmsg(buffers)
+    return sock.send(b''.join(buffers))
+
+
+def sendall_buffers(sock: socket.socket, buffers: Sequence[bytes]):
+    """
+    Sends all the buffers as one contiguous stream of data
+    (like socket.sendall).
+    """
+    if not HAS_SENDMSG:
+        sock.sendall(b''.join(buffers))
+        return
+
+    sent = sock.sendmsg(buffers)
+    # usually everything is sent at once, so the views are created only
+    # if the buffers were partially sent
+    if sent < sum(len(buffer) for buffer in buffers):
+        buffers = skip_bytes([memoryview(buffer) for buffer in buffers], sent)
+        while buffers:
+            buffers = skip_bytes(buffers, sock.sendmsg(buffers))
+
+
+def skip_bytes(buffers: list, num_bytes: int) -> list:
+    """
+    Removes a given number of bytes from the beginning of the buffers.
+    :param buffers: a list of memoryviews.
+    :returns: the remaining buffers.
+    """
+    i = 0
+    while i < len(buffers) and num_bytes >= len(buffers[i]):
+        num_bytes -= len(buffers[i])
+        i += 1
+    buffers = buffers[i:]
+    if num_bytes:
+        buffers[0] = buffers[0][num_bytes:]
+    return buffers
 
 
 def recvall(sock: socket.socket, n: int) -> bytearray:
     """
     Receives n bytes from a given socket
     (the method socket.recv(n) receives maximum n bytes).
+    Raises ConnectionError if the socket was closed.
     """
     buffer = bytearray()
     while len(buffer) < n:
         data = sock.recv(n - len(buffer))
+        # an empty bytes object means that the socket was closed
+        if not data:
+            raise ConnectionError('The connection was closed.')
         buffer.extend(data)
     return buffer
 
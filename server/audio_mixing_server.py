@@ -0,0 +1,205 @@
+"""
+    Hadar Shahar
+    AudioMixingServer.
+"""
+import threading
+import time
+from typing import Callable, Dict, Tuple
+import numpy as np
+from network.audio.audio_codecs import create_codec
+from network.audio.audio_packet import AudioPacket
+from network.audio.jitter_buffer import JitterBuffer
+from network.audio.mulaw_codec import MuLawCodec
+from network.constants import NETWORK_BYTES_PER_NUM
+from server.broadcast_udp_server import BroadcastUdpServer
+from server.metrics_registry import REGISTRY
+
+
+class AudioMixingServer(BroadcastUdpServer):
+    """
+    Definition of the class AudioMixingServer.
+
+    Mixes the audio of each meeting instead of relaying every speaker's
+    chunks to every other participant (an MCU). The received packets are
+    put in the JitterBuffer of their sender, and every TICK all the
+    active speakers of each meeting are summed (in int32, so it doesn't
+    overflow before clipping). Each participant gets a single stream of
+    everyone but itself: the sum minus its own samples. So each client
+    receives one stream instead of one per speaker, and overlapping
+    speakers are played together instead of one after the other.
+    The mixed packets are sent with the recipient's own id
+    (like FeedbackUdpServer's reports), and with the sequence number and
+    the timestamp of the recipient's stream.
+    """
+
+    # the sample rate of the clients (AudioStream.RATE)
+    RATE = 44100
+
+    # the duration of each mixed chunk (in seconds)
+    TICK = 0.02
+    TICK_SAMPLES = int(RATE * TICK)
+
+    # the codec of the mixed chunks (see audio_codecs)
+    CODEC_ID = MuLawCodec.CODEC_ID
+
+    def __init__(self, ip: str, client_in_port: int, client_out_port: int,
+                 server_name: str,
+                 client_id_validator: Callable[[bytes], bool]):
+        """ Constructor. """
+        super(AudioMixingServer, self).__init__(
+            ip, client_in_port, client_out_port, server_name,
+            client_id_validator)
+        # { meeting_id: ((full client id, address), ...) }, a snapshot
+        # that's replaced when a client joins or leaves (like recipients)
+        self.meetings: Dict[bytes, Tuple[Tuple[bytes, tuple], ...]] = {}
+        # { full client id: JitterBuffer }, the buffers are added by the
+        # receiving thread, and read by the mixing thread
+        self.speakers: Dict[bytes, JitterBuffer] = {}
+        # { full client id: [the codec that encodes its mixed chunks,
+        # the sequence number of its next packet] }
+        # (used by the mixing thread)
+        self.streams: Dict[bytes, list] = {}
+        # both are added while holding clients_addresses_lock, only for
+        # connected clients (see BroadcastUdpServer.remove_client_state)
+        # the ticks since the server started (the timestamps of the
+        # mixed packets are counted in ticks, so they skip the silence)
+        self.tick_index = 0
+
+    def create_metrics(self):
+        """ Creates the mixing metrics too. """
+        super(AudioMixingServer, self).create_metrics()
+        labels = {'channel': self.server_name}
+        self.mixed_counter = REGISTRY.counter(
+            'zoom_audio_mixed_packets_total',
+            'Mixed chunks that were sent to the participants.', **labels)
+        self.mix_seconds_counter = REGISTRY.counter(
+            'zoom_audio_mix_seconds_total',
+            'The time it took to mix and encode the chunks.', **labels)
+        self.late_ticks_counter = REGISTRY.counter(
+            'zoom_audio_late_ticks_total',
+            'Ticks that were mixed too late and were skipped.', **labels)
+        self.mix_errors_counter = REGISTRY.counter(
+            'zoom_audio_mix_errors_total',
+            'Meetings that failed to be mixed in a tick.', **labels)
+
+    def run(self):
+        """ Runs the mixing thread, then receives the chunks. """
+        threading.Thread(target=self.mix_loop, daemon=True).start()
+        super(AudioMixingServer, self).run()
+
+    def update_recipients(self, meeting_id: bytes,
+                          removed_client_id: bytes = None):
+        """ Replaces the meetings snapshot too. """
+        super(AudioMixingServer, self).update_recipients(
+            meeting_id, removed_client_id)
+        meetings = dict(self.meetings)
+        addresses = self.clients_addresses.get(meeting_id)
+        if addresses:
+            meetings[meeting_id] = tuple(
+                (meeting_id + client_id, address)
+                for client_id, address in addresses.items())
+        else:
+            meetings.pop(meeting_id, None)
+        self.meetings = meetings
+
+    def broadcast(self, sender_id: bytes,
+                  recipients: Tuple[Tuple[str, int], ...],
+                  packet: bytes) -> int:
+        """
+        Puts a given packet in the jitter buffer of its sender,
+        it's sent to the others when it's mixed.
+        :returns: the number of recipients it was sent to (0).
+        """
+        audio_packet = AudioPacket.decode(
+            bytes(packet), NETWORK_BYTES_PER_NUM + len(sender_id))
+        if audio_packet is None:
+            self.malformed_counter.inc()
+            return 0
+        speaker = self.speakers.get(sender_id)
+        if speaker is None:
+            with self.clients_addresses_lock:
+                if not self.is_connected(sender_id):
+                    return 0
+                speaker = self.speakers.setdefault(sender_id, JitterBuffer())
+        speaker.put(audio_packet)
+        return 0
+
+    def mix_loop(self):
+        """
+        Runs in a separate thread, mixes the meetings every TICK.
+        If the mixing falls behind by more than a tick,
+        the missed ticks are skipped.
+        """
+        next_time = time.monotonic()
+        while True:
+            next_time += AudioMixingServer.TICK
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -AudioMixingServer.TICK:
+                self.late_ticks_counter.inc()
+                next_time = time.monotonic()
+
+            start = time.perf_counter()
+            now = time.monotonic()
+            for members in self.meetings.values():
+                # a meeting that fails is skipped in this tick,
+                # so it doesn't stop the mixing of the others
+                try:
+                    self.mix_meeting(members, now)
+                except Exception as e:
+                    self.mix_errors_counter.inc()
+                    print(f'{self.server_name} mix_meeting: {e}')
+            self.tick_index += 1
+            self.mix_seconds_counter.inc(time.perf_counter() - start)
+
+    def mix_meeting(self, members: Tuple[Tuple[bytes, tuple], ...],
+                    now: float):
+        """ Mixes a tick of a meeting and sends it to its members. """
+        # the rows of the active speakers, the other rows stay zeros
+        own = np.zeros((len(members), AudioMixingServer.TICK_SAMPLES),
+                       dtype=np.int32)
+        active = False
+        for i, (full_id, address) in enumerate(members):
+            speaker = self.speakers.get(full_id)
+            samples = speaker.read(AudioMixingServer.TICK_SAMPLES, now) \
+                if speaker is not None else None
+            if samples is not None:
+                own[i] = samples
+                active = True
+        if not active:
+            return
+
+        # everyone but each member
+        mixes = np.clip(own.sum(axis=0) - own, -32768, 32767).astype(
+            np.int16)
+        for (full_id, address), mix in zip(members, mixes):
+            if not mix.any():
+                continue  # it's the only speaker
+            stream = self.streams.get(full_id)
+            if stream is None:
+                # the meetings snapshot might include a removed member
+                with self.clients_addresses_lock:
+                    if not self.is_connected(full_id):
+                        continue
+                    stream = [create_codec(AudioMixingServer.CODEC_ID), 0]
+                    self.streams[full_id] = stream
+            encoder, sequence = stream
+            audio_packet = AudioPacket(
+                sequence, AudioPacket.advance(
+                    0, self.tick_index * AudioMixingServer.TICK_SAMPLES),
+                encoder.encode(mix.tobytes()))
+            stream[1] = AudioPacket.advance(sequence)
+            packet = BroadcastUdpServer.ID_LEN_STRUCT.pack(len(full_id)) + \
+                full_id + audio_packet.encode()
+            self.out_socket.sendto(packet, address)
+            self.mixed_counter.inc()
+
+    def remove_client_state(self, full_client_id: bytes):
+        """
+        Removes a client's buffer and codec.
+        Must be called while holding clients_addresses_lock.
+        """
+        super(AudioMixingServer, self).remove_client_state(full_client_id)
+        self.speakers.pop(full_client_id, None)
+        self.streams.pop(full_client_id, None)
@@ -4,14 +4,16 @@
 """
 import os
 import threading
+import time
 import requests
-from flask import Flask, request, make_response, Response
+from flask import Flask, request, make_response, Response, g
 from http import HTTPStatus
 import string
 from dotenv import load_dotenv
 from typing import Union
 from network.custom_messages.client_info import ClientInfo
 from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+from server.metrics_registry import REGISTRY, MetricsRegistry
 
 
 class AuthServer(threading.Thread):
@@ -23,6 +25,8 @@ class AuthServer(threading.Thread):
 
     MAX_CLIENTS_PER_MEETING = 4
 
+    REQUEST_SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
     # colors for missing credentials error
     COLORS_FAIL = '\033[91m'
     COLORS_ENDC = '\033[0m'
@@ -55,6 +59,14 @@ class AuthServer(threading.Thread):
         self.meetings_dict: [bytes, [bytes]] = {}
         self.meetings_dict_lock = threading.Lock()
 
+        REGISTRY.describe('zoom_auth_authenticated_clients',
+                          MetricsRegistry.GAUGE, 'Authenticated clients.')
+        REGISTRY.describe('zoom_auth_meetings', MetricsRegistry.GAUGE,
+                          'Open meetings.')
+        REGISTRY.describe('zoom_auth_meeting_clients', MetricsRegistry.GAUGE,
+                          'Clients that joined a meeting.')
+        REGISTRY.add_collector(self.collect_metrics)
+
     def create_endpoints(self):
         """ Creates endpoints for the server. """
         self.app.add_url_rule('/auth/google', 'google_auth',
@@ -69,6 +81,9 @@ class AuthServer(threading.Thread):
         self.app.add_url_rule('/logout', 'logout',
                               self.logout, methods=['POST'])
 
+        self.app.before_request(self.start_request_timer)
+        self.app.after_request(self.count_request)
+
     def run(self):
         """ Runs the server. """
         # flask reloader expects to run in the main thread,
@@ -268,6 +283,48 @@ class AuthServer(threading.Thread):
             self.print_clients()
         return {}
 
+    @staticmethod
+    def start_request_timer():
+        """ Saves the start time of the request (before it's handled). """
+        g.request_start_time = time.perf_counter()
+
+    @staticmethod
+    def count_request(response: Response) -> Response:
+        """
+        Counts a request by its endpoint and status code,
+        and observes its duration (after it's handled).
+        """
+        endpoint = request.endpoint or 'unknown'
+        REGISTRY.counter('zoom_auth_requests_total',
+                         'Requests by endpoint and status code.',
+                         endpoint=endpoint,
+                         status=str(response.status_code)).inc()
+        start_time = g.get('request_start_time')
+        if start_time is not None:
+            REGISTRY.histogram(
+                'zoom_auth_request_seconds', 'The duration of the requests.',
+                AuthServer.REQUEST_SECONDS_BUCKETS, endpoint=endpoint
+            ).observe(time.perf_counter() - start_time)
+        return response
+
+    def collect_metrics(self) -> list:
+        """
+        Returns the number of authenticated clients, meetings and
+        clients in the meetings (the metrics registry calls it).
+        The meeting ids aren't exported: anyone who knows one can join
+        the meeting.
+        """
+        with self.authenticated_clients_lock:
+            num_clients = len(self.authenticated_clients)
+        with self.meetings_dict_lock:
+            num_meetings = len(self.meetings_dict)
+            num_meeting_clients = sum(len(clients_ids) for clients_ids
+                                      in self.meetings_dict.values())
+
+        return [('zoom_auth_authenticated_clients', {}, num_clients),
+                ('zoom_auth_meetings', {}, num_meetings),
+                ('zoom_auth_meeting_clients', {}, num_meeting_clients)]
+
     def generate_meeting_id(self) -> bytes:
         """ Generates a unique meeting id using random bytes. """
         meeting_id = os.urandom(MEETING_ID_LEN)
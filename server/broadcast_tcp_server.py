@@ -2,28 +2,59 @@
     Hadar Shahar
     BroadcastTcpServer.
 """
+import selectors
 import socket
 import sys
 import threading
 from typing import Dict, Callable
 from network.constants import NUMBER_OF_WAITING_CONNECTIONS, EXIT_SIGN
+from network.packet_reader import PacketReader
+from server.metrics_registry import REGISTRY, MetricsRegistry
 from server.participant import Participant
-from network.tcp_network_utils import create_packet, recv_packet
+from server.send_queue import SendQueue
+from network.tcp_network_utils import create_header, create_packet, \
+    send_buffers, sendall_buffers
 from server.ids_config import MEETING_ID_LEN
 
 
 class BroadcastTcpServer(threading.Thread):
     """ Definition of the class BroadcastTcpServer. """
 
+    # the initial size of the buffer that each participant's packets
+    # are received into (it grows for bigger packets)
+    RECV_BUFFER_SIZE = 8192
+    # the max number of queued bytes (and buffers)
+    # that the event loop sends at once
+    SEND_BUFFER_SIZE = 65536
+    SEND_MAX_BUFFERS = 512
+
+    # the limits of each participant's send queue,
+    # and what to do when a slow participant exceeds them
+    SEND_QUEUE_MAX_PACKETS = SendQueue.DEFAULT_MAX_PACKETS
+    SEND_QUEUE_MAX_BYTES = SendQueue.DEFAULT_MAX_BYTES
+    SEND_QUEUE_OVERFLOW_POLICY = SendQueue.DROP_OLDEST
+
+    # the counters of each participant that are exported as metrics,
+    # the queue depths are exported as gauges
+    PAR_COUNTERS = ('received_packets', 'received_bytes',
+                    'sent_packets', 'sent_bytes',
+                    'dropped_packets', 'dropped_bytes')
+    PAR_GAUGES = ('queued_packets', 'queued_bytes')
+
     def __init__(self, ip: str, client_in_port: int, client_out_port: int,
                  server_name: str,
-                 client_id_validator: Callable[[bytes], bool]):
+                 client_id_validator: Callable[[bytes], bool],
+                 use_event_loop=True):
         """
         Initializes input and output sockets for the BroadcastServer.
+        If use_event_loop is True, all the participants are handled
+        in a single thread using non-blocking sockets,
+        otherwise each participant is handled in a separate thread.
         """
         super(BroadcastTcpServer, self).__init__()
         self.server_name = server_name
         self.client_id_validator = client_id_validator
+        self.use_event_loop = use_event_loop
         try:
             # socket that accepts each client input socket
             self.accept_clients_in = socket.socket(socket.AF_INET,
@@ -50,49 +81,167 @@ class BroadcastTcpServer(threading.Thread):
             self.participants: Dict[bytes, Dict[bytes, Participant]] = {}
             self.participants_lock = threading.Lock()
 
+            # used only by the event loop
+            self.selector = selectors.DefaultSelector()
+            # participants that should be disconnected while the loop
+            # is in the middle of handling another participant,
+            # they are disconnected at the end of the loop iteration
+            self.failed_pars: [Participant] = []
+
         except socket.error as msg:
             print(f'{self.server_name} connection failure: {msg}')
             sys.exit(1)
 
+        self.create_metrics()
+
+    def create_metrics(self):
+        """
+        Creates the metrics of the server in the metrics registry.
+        The participants' counters are plain attributes that are
+        read by collect_metrics, so counting is cheap on the hot path.
+        """
+        self.connections_counter = REGISTRY.counter(
+            'zoom_tcp_connections_total', 'Participants that connected.',
+            channel=self.server_name)
+        self.invalid_ids_counter = REGISTRY.counter(
+            'zoom_tcp_invalid_ids_total',
+            'Participants that sent an invalid id.', channel=self.server_name)
+        self.slow_pars_counter = REGISTRY.counter(
+            'zoom_tcp_slow_disconnects_total',
+            'Participants that were disconnected because their send queue '
+            'overflowed.', channel=self.server_name)
+        self.errors_counter = REGISTRY.counter(
+            'zoom_tcp_errors_total', 'Errors in the event loop callbacks.',
+            channel=self.server_name)
+
+        # the counters of the participants who have disconnected,
+        # so the channel totals don't go down when they leave
+        self.disconnected_pars_counters = \
+            dict.fromkeys(BroadcastTcpServer.PAR_COUNTERS, 0)
+
+        REGISTRY.describe('zoom_tcp_meetings', MetricsRegistry.GAUGE,
+                          'Meetings with connected participants.')
+        REGISTRY.describe('zoom_tcp_participants', MetricsRegistry.GAUGE,
+                          'Connected participants.')
+        for name in BroadcastTcpServer.PAR_COUNTERS:
+            # 'received_packets' -> 'Received packets'
+            description = name.replace('_', ' ').capitalize()
+            REGISTRY.describe(f'zoom_tcp_{name}_total',
+                              MetricsRegistry.COUNTER,
+                              f'{description} (all the participants).')
+        for name in BroadcastTcpServer.PAR_GAUGES:
+            description = name.replace('_', ' ').capitalize()
+            REGISTRY.describe(f'zoom_tcp_{name}', MetricsRegistry.GAUGE,
+                              f'{description} in all the send queues.')
+            REGISTRY.describe(f'zoom_tcp_max_{name}', MetricsRegistry.GAUGE,
+                              f'{description} in the longest send queue.')
+        REGISTRY.add_collector(self.collect_metrics)
+
     def run(self):
         """
-        Starts 2 threads,
+        Runs the event loop in this thread.
+        If the event loop isn't used, starts 2 threads,
         one the accepts the clients' input socket
         and another one the accepts the clients' output socket.
         """
-        threading.Thread(target=self.accept_clients_sockets,
-                         args=(self.accept_clients_in, 'in_socket')).start()
-        threading.Thread(target=self.accept_clients_sockets,
-                         args=(self.accept_clients_out, 'out_socket')).start()
+        if self.use_event_loop:
+            self.event_loop()
+        else:
+            threading.Thread(target=self.accept_clients_sockets,
+                             args=(self.accept_clients_in, 'in_socket')
+                             ).start()
+            threading.Thread(target=self.accept_clients_sockets,
+                             args=(self.accept_clients_out, 'out_socket')
+                             ).start()
+
+    def event_loop(self):
+        """
+        Accepts, reads from and writes to all the participants' sockets
+        in this thread, using a selector.
+        Each registered socket holds a tuple of (callback, arg),
+        the callback is called with the socket and the arg when it's ready.
+        """
+        for sock, client_sock_name in ((self.accept_clients_in, 'in_socket'),
+                                       (self.accept_clients_out,
+                                        'out_socket')):
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ,
+                                   (self.accept_client_socket,
+                                    client_sock_name))
+
+        while True:
+            for key, mask in self.selector.select():
+                callback, arg = key.data
+                # an exception must not stop the loop,
+                # because it handles all the participants
+                try:
+                    callback(key.fileobj, arg)
+                except Exception as e:
+                    self.errors_counter.inc()
+                    print(f'{self.server_name} event_loop: {e}')
+
+            while self.failed_pars:
+                try:
+                    self.disconnect_par(self.failed_pars.pop())
+                except Exception as e:
+                    print(f'{self.server_name} event_loop: {e}')
 
     def accept_clients_sockets(self, sock: socket.socket,
                                client_sock_name: str):
         """
-        Accepts clients that connect to a given socket,
-        and creates a Participant object for each client.
-        When a participant has done connecting,
-        it calls the add_participant method.
+        Accepts clients that connect to a given socket (in a loop),
+        used when the event loop isn't used.
 
         :param sock: accept clients that connect to this socket
         :param client_sock_name: 'in_socket' / 'out_socket'
         """
         while True:
             client_socket, address = sock.accept()
-            hostaddr, port = address
-            with self.connecting_pars_lock:
-                if hostaddr in self.connecting_pars:
-                    par = self.connecting_pars[hostaddr]
-                    setattr(par, client_sock_name, client_socket)
-                    self.add_participant(par)
-                else:
-                    par = Participant(address)
-                    setattr(par, client_sock_name, client_socket)
-                    self.connecting_pars[hostaddr] = par
+            self.pair_client_socket(client_socket, address, client_sock_name)
+
+    def accept_client_socket(self, sock: socket.socket,
+                             client_sock_name: str):
+        """
+        The event loop calls this method when a client
+        is connecting to a given socket.
+
+        :param sock: accept the client that connects to this socket
+        :param client_sock_name: 'in_socket' / 'out_socket'
+        """
+        try:
+            client_socket, address = sock.accept()
+        except BlockingIOError:
+            return
+        client_socket.setblocking(False)
+        self.pair_client_socket(client_socket, address, client_sock_name)
+
+    def pair_client_socket(self, client_socket: socket.socket,
+                           address: (str, int), client_sock_name: str):
+        """
+        Creates a Participant object for each client,
+        and pairs its input and output sockets.
+        When a participant has done connecting,
+        it calls the add_participant method.
+        """
+        hostaddr, port = address
+        with self.connecting_pars_lock:
+            if hostaddr in self.connecting_pars:
+                par = self.connecting_pars[hostaddr]
+                setattr(par, client_sock_name, client_socket)
+                self.add_participant(par)
+            else:
+                send_queue = SendQueue(self.SEND_QUEUE_MAX_PACKETS,
+                                       self.SEND_QUEUE_MAX_BYTES,
+                                       self.SEND_QUEUE_OVERFLOW_POLICY)
+                par = Participant(address, send_queue=send_queue)
+                setattr(par, client_sock_name, client_socket)
+                self.connecting_pars[hostaddr] = par
 
     def add_participant(self, par: Participant):
         """
         Adds a given participant to the meeting,
-        and opens a new thread for handling it.
+        and registers it in the event loop
+        (or opens new threads for reading from it and writing to it).
         """
         # if the participant has connected to the server
         # via input and output sockets
@@ -100,23 +249,31 @@ class BroadcastTcpServer(threading.Thread):
             # remove the participant from the connecting_pars dictionary
             hostaddr, port = par.address
             del self.connecting_pars[hostaddr]
+            par.reader = PacketReader(par.out_socket,
+                                      BroadcastTcpServer.RECV_BUFFER_SIZE)
+            self.connections_counter.inc()
 
-            # handle the participant in a separate thread
-            threading.Thread(target=self.handle_participant,
-                             args=(par,)).start()
+            if self.use_event_loop:
+                self.selector.register(par.out_socket, selectors.EVENT_READ,
+                                       (self.read_par_data, par))
+            else:
+                # handle the participant in a separate thread
+                threading.Thread(target=self.handle_participant,
+                                 args=(par,)).start()
+                threading.Thread(target=self.write_loop,
+                                 args=(par,)).start()
 
-    def update_par_id(self, par: Participant) -> bool:
+    def update_par_id(self, par: Participant, received_id: bytes) -> bool:
         """
-        This method receives the id from the client, validates it
+        This method validates the id received from the client
         and updates the par object if it's valid.
         :returns: True if the client id is valid, False otherwise.
         """
-        received_id = bytes(recv_packet(par.out_socket))
-
         success = self.client_id_validator(received_id)
         if success:
             par.meeting_id = received_id[:MEETING_ID_LEN]
             par.client_id = received_id[MEETING_ID_LEN:]
+            par.id_header = create_packet(received_id)
 
             # "with" block always executes, even after return!
             with self.participants_lock:
@@ -132,36 +289,115 @@ class BroadcastTcpServer(threading.Thread):
         if success:
             self.print_participants()
         else:
+            self.invalid_ids_counter.inc()
             print(f'Invalid id: {received_id}, ignoring the participant.')
         return success
 
     def handle_participant(self, par: Participant):
         """
-        Handles a given participant.
+        Handles a given participant (in a separate thread).
         """
         try:
-            if not self.update_par_id(par):
-                return
-
-            while True:
-                data = recv_packet(par.out_socket)
-                # if the client wants to disconnect, it sends an EXIT_SIGN
-                if data == EXIT_SIGN:
-                    break
-                else:
-                    self.handle_new_data(par, data)
+            # the packet is copied because it might be queued for sending
+            # after the reader's buffer is reused
+            while self.handle_packet(par, bytes(par.reader.recv_packet())):
+                pass
         except socket.error as e:
-            print(f'{self.server_name} handle_participant {par}: {e}')
+            if par.is_connected:
+                print(f'{self.server_name} handle_participant {par}: {e}')
         finally:
-            self.par_disconnected(par)
+            self.disconnect_par(par)
+
+    def read_par_data(self, sock: socket.socket, par: Participant):
+        """
+        The event loop calls this method when the output socket of
+        a given participant is readable.
+        It handles every full packet that was received.
+        """
+        if not par.is_connected:
+            return
+        try:
+            if not par.reader.fill():
+                return
+        except ConnectionError:
+            # the client has closed the socket
+            self.disconnect_par(par)
+            return
+        except socket.error as e:
+            print(f'{self.server_name} read_par_data {par}: {e}')
+            self.disconnect_par(par)
+            return
+
+        packet = par.reader.next_packet()
+        while packet is not None:
+            try:
+                # the packet is copied because it might be queued for sending
+                # after the reader's buffer is reused
+                keep_connection = self.handle_packet(par, bytes(packet))
+            except Exception as e:
+                print(f'{self.server_name} read_par_data {par}: {e}')
+                keep_connection = False
+            if not keep_connection:
+                self.disconnect_par(par)
+                return
+            packet = par.reader.next_packet()
+
+    def handle_packet(self, par: Participant, data: bytes) -> bool:
+        """
+        Handles a packet that was received from a given participant.
+        The first packet contains the participant's id.
+        :returns: False if the participant should be disconnected,
+                  True otherwise.
+        """
+        par.received_packets += 1
+        par.received_bytes += len(data)
+        if not par.client_id:
+            return self.update_par_id(par, bytes(data))
+        # if the client wants to disconnect, it sends an EXIT_SIGN
+        if data == EXIT_SIGN:
+            return False
+        self.handle_new_data(par, data)
+        return True
 
     def handle_new_data(self, par: Participant, data: bytes):
         """
         Handles new data that was received from a given participant.
+        The data is sent to the others prefixed with an id packet,
+        without joining (copying) the packets.
+        """
+        self.broadcast(par, par.id_header, create_header(len(data)), data)
+
+    def disconnect_par(self, par: Participant):
+        """
+        Removes a given participant from the event loop (if it's used),
+        closes its send queue and calls the par_disconnected method
+        (only once).
         """
-        id_packet = create_packet(par.meeting_id + par.client_id)
-        data_packet = create_packet(data)
-        self.broadcast(par, (id_packet + data_packet))
+        if not par.is_connected:
+            return
+        par.is_connected = False
+        if self.use_event_loop:
+            self.selector.unregister(par.out_socket)
+            if par.is_writing:
+                self.selector.unregister(par.in_socket)
+                par.is_writing = False
+        par.send_queue.close()
+        self.par_disconnected(par)
+
+    def abort_par(self, par: Participant):
+        """
+        Disconnects a given participant, it's called while handling
+        another participant so the participant isn't disconnected
+        immediately.
+        """
+        if self.use_event_loop:
+            self.failed_pars.append(par)
+        else:
+            # the thread that reads from the participant will disconnect it
+            try:
+                par.out_socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
 
     def par_disconnected(self, par: Participant):
         """
@@ -174,6 +410,12 @@ class BroadcastTcpServer(threading.Thread):
             pars_in_meeting = self.participants.get(par.meeting_id)
             if pars_in_meeting and par.client_id in pars_in_meeting:
                 del pars_in_meeting[par.client_id]
+                # removed and counted under the same lock,
+                # so collect_metrics counts it exactly once
+                par_counters = BroadcastTcpServer.get_par_metrics(par)
+                for name in BroadcastTcpServer.PAR_COUNTERS:
+                    self.disconnected_pars_counters[name] += \
+                        par_counters[name]
 
                 # if the meeting is now empty, delete the meeting id
                 if not self.participants[par.meeting_id]:
@@ -181,9 +423,69 @@ class BroadcastTcpServer(threading.Thread):
 
             self.print_participants()
 
-    def broadcast(self, sender_par: Participant, packet: bytes):
+    def send_to_par(self, par: Participant, *buffers: bytes):
+        """
+        Adds a given packet (given as one or more buffers)
+        to the participant's send queue,
+        the packet is sent by the event loop (or by the participant's
+        writing thread), so it doesn't block the caller.
+        """
+        if not par.send_queue.put(buffers):
+            self.slow_pars_counter.inc()
+            print(f'{self.server_name} {par} is too slow, disconnecting it.')
+            self.abort_par(par)
+            return
+        if self.use_event_loop and par.is_connected and not par.is_writing:
+            self.selector.register(par.in_socket, selectors.EVENT_WRITE,
+                                   (self.write_par_data, par))
+            par.is_writing = True
+
+    def write_par_data(self, sock: socket.socket, par: Participant):
+        """
+        The event loop calls this method when the input socket of
+        a given participant is writable, and sends it the queued packets.
+        """
+        if not par.is_connected:
+            return
+        queue = par.send_queue
+        buffers = queue.peek(BroadcastTcpServer.SEND_BUFFER_SIZE,
+                             BroadcastTcpServer.SEND_MAX_BUFFERS)
+        while buffers:
+            try:
+                sent = send_buffers(sock, buffers)
+            except BlockingIOError:
+                return
+            except socket.error as e:
+                print(f'{self.server_name} write_par_data {par}: {e}')
+                self.disconnect_par(par)
+                return
+            queue.consume(sent)
+            buffers = queue.peek(BroadcastTcpServer.SEND_BUFFER_SIZE,
+                                 BroadcastTcpServer.SEND_MAX_BUFFERS)
+
+        self.selector.unregister(sock)
+        par.is_writing = False
+
+    def write_loop(self, par: Participant):
+        """
+        Sends the queued packets to a given participant
+        (in a separate thread), used when the event loop isn't used.
+        """
+        buffers = par.send_queue.get()
+        while buffers is not None:
+            try:
+                sendall_buffers(par.in_socket, buffers)
+            except socket.error as e:
+                if par.is_connected:
+                    print(f'{self.server_name} write_loop {par}: {e}')
+                    self.abort_par(par)
+                return
+            buffers = par.send_queue.get()
+
+    def broadcast(self, sender_par: Participant, *buffers: bytes):
         """
-        Broadcasts a given packet (or chained packets) of data
+        Broadcasts a given packet (or chained packets) of data,
+        given as one or more buffers,
         to all the participants in the meeting of the sending participant,
         except the one who sends the data.
         """
@@ -191,8 +493,63 @@ class BroadcastTcpServer(threading.Thread):
             pars = self.participants.get(sender_par.meeting_id, {})
             for par_id, par in pars.items():
                 if par_id != sender_par.client_id:
-                    with par.lock:
-                        par.in_socket.sendall(packet)
+                    self.send_to_par(par, *buffers)
+
+    def get_send_queues_stats(self) -> dict:
+        """
+        Returns the send queue stats of each participant:
+        { meeting_id (hex): {client_id (hex): SendQueue.stats(), ...} }
+        """
+        with self.participants_lock:
+            return {meeting_id.hex(): {client_id.hex(): par.send_queue.stats()
+                                       for client_id, par in pars.items()}
+                    for meeting_id, pars in self.participants.items()}
+
+    @staticmethod
+    def get_par_metrics(par: Participant) -> dict:
+        """
+        Returns the counters and the send queue depths of a participant.
+        """
+        metrics = par.send_queue.stats()
+        metrics['received_packets'] = par.received_packets
+        metrics['received_bytes'] = par.received_bytes
+        return metrics
+
+    def collect_metrics(self) -> list:
+        """
+        Returns the metrics samples of the channel: the number of
+        meetings and participants, the totals of the participants'
+        counters, and the total and the longest send queue depths
+        (the metrics registry calls it).
+        There are no samples of each meeting or participant, because
+        their ids let anyone join the meeting or send as the participant.
+        """
+        labels = {'channel': self.server_name}
+        with self.participants_lock:
+            totals = dict(self.disconnected_pars_counters)
+            num_meetings = len(self.participants)
+            pars = [par for pars in self.participants.values()
+                    for par in pars.values()]
+
+        gauges = dict.fromkeys(BroadcastTcpServer.PAR_GAUGES, 0)
+        max_gauges = dict.fromkeys(BroadcastTcpServer.PAR_GAUGES, 0)
+        for par in pars:
+            par_metrics = BroadcastTcpServer.get_par_metrics(par)
+            for name in BroadcastTcpServer.PAR_COUNTERS:
+                totals[name] += par_metrics[name]
+            for name in BroadcastTcpServer.PAR_GAUGES:
+                gauges[name] += par_metrics[name]
+                max_gauges[name] = max(max_gauges[name], par_metrics[name])
+
+        samples = [('zoom_tcp_meetings', labels, num_meetings),
+                   ('zoom_tcp_participants', labels, len(pars))]
+        for name, value in totals.items():
+            samples.append((f'zoom_tcp_{name}_total', labels, value))
+        for name in BroadcastTcpServer.PAR_GAUGES:
+            samples.append((f'zoom_tcp_{name}', labels, gauges[name]))
+            samples.append((f'zoom_tcp_max_{name}', labels,
+                            max_gauges[name]))
+        return samples
 
     def print_participants(self):
         """ Prints the server participants. """
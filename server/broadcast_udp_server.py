@@ -6,40 +6,104 @@ import socket
 import sys
 import threading
 import struct
-from typing import Dict, Callable
+from typing import Dict, Callable, Tuple
 from network.constants import NETWORK_BYTES_FORMAT, NETWORK_BYTES_PER_NUM, \
     UDP_SOCKET_BUFFER_SIZE, UDP_NEW_CLIENT_MSG
 from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+from server.metrics_registry import REGISTRY, MetricsRegistry
 
 
 class BroadcastUdpServer(threading.Thread):
     """ Definition of the class BroadcastUdpServer. """
 
+    # precompiled, to parse the id length without creating a Struct
+    ID_LEN_STRUCT = struct.Struct(NETWORK_BYTES_FORMAT)
+
+    # the counters of each client (a list in this order),
+    # they are exported as metrics
+    CLIENT_COUNTERS = ('received_packets', 'received_bytes',
+                       'relayed_packets', 'relayed_bytes')
+
     def __init__(self, ip: str, client_in_port: int, client_out_port: int,
                  server_name: str,
-                 client_id_validator: Callable[[bytes], bool]):
-        """ Initializes input and output sockets. """
+                 client_id_validator: Callable[[bytes], bool],
+                 reuse_port=False):
+        """
+        Initializes input and output sockets.
+        If reuse_port is True, servers in other processes can bind the
+        same ports (using SO_REUSEPORT), and the received packets are
+        distributed between them.
+        """
         super(BroadcastUdpServer, self).__init__()
         self.server_name = server_name
         self.client_id_validator = client_id_validator
         try:
             self.out_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.out_socket.bind((ip, client_in_port))
-
             self.in_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if reuse_port:
+                for sock in (self.out_socket, self.in_socket):
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+            self.out_socket.bind((ip, client_in_port))
             self.in_socket.bind((ip, client_out_port))
 
             print(f'{self.server_name} server listening on ports '
                   f'{client_in_port}, {client_out_port}')
 
             # { meeting_id: {client_id: client_in_address} }
+            # changed only while holding clients_addresses_lock
             self.clients_addresses: Dict[bytes, Dict[bytes, (str, int)]] = {}
             self.clients_addresses_lock = threading.Lock()
 
+            # { full_client_id: (addresses of the other clients in the
+            # meeting, see get_recipient) }, a snapshot that's never
+            # changed: it's rebuilt and replaced when a client joins or
+            # leaves (replacing an attribute is atomic), so it's read
+            # without the lock
+            self.recipients: Dict[bytes, Tuple[Tuple[str, int], ...]] = {}
+
+            # { full_client_id: [counters (see CLIENT_COUNTERS)] }
+            # items are added and removed while holding
+            # clients_addresses_lock, the counters are updated without it
+            self.clients_counters: Dict[bytes, list] = {}
+
         except socket.error as msg:
             print(f'{self.server_name} connection failure: {msg}')
             sys.exit(1)
 
+        self.create_metrics()
+
+    def create_metrics(self):
+        """
+        Creates the metrics of the server in the metrics registry.
+        The clients' counters are plain lists that are read by
+        collect_metrics, so counting is cheap on the hot path.
+        """
+        labels = {'channel': self.server_name}
+        self.malformed_counter = REGISTRY.counter(
+            'zoom_udp_malformed_packets_total',
+            'Packets with an invalid id or from unknown clients.', **labels)
+        self.invalid_ids_counter = REGISTRY.counter(
+            'zoom_udp_invalid_ids_total',
+            'New clients whose id was rejected.', **labels)
+
+        # the counters of the clients who have left,
+        # so the channel totals don't go down when they leave
+        self.removed_clients_counters = \
+            [0] * len(BroadcastUdpServer.CLIENT_COUNTERS)
+
+        REGISTRY.describe('zoom_udp_meetings', MetricsRegistry.GAUGE,
+                          'Meetings with connected clients.')
+        REGISTRY.describe('zoom_udp_clients', MetricsRegistry.GAUGE,
+                          'Connected clients.')
+        for name in BroadcastUdpServer.CLIENT_COUNTERS:
+            # 'received_packets' -> 'Received packets'
+            description = name.replace('_', ' ').capitalize()
+            REGISTRY.describe(f'zoom_udp_{name}_total',
+                              MetricsRegistry.COUNTER,
+                              f'{description} (all the clients).')
+        REGISTRY.add_collector(self.collect_metrics)
+
     def run(self):
         """ Runs in a separate thread, receives and broadcasts data. """
         self.receive_and_broadcast()
@@ -49,26 +113,65 @@ class BroadcastUdpServer(threading.Thread):
         """
         Tries to add a new client to the meeting with the id meeting_id.
         """
-        success = self.client_id_validator(meeting_id + client_id)
-
-        if success:
-            with self.clients_addresses_lock:
-                if meeting_id in self.clients_addresses:
-                    # there must not be a participant with the same id!
-                    if client_id in self.clients_addresses[meeting_id]:
-                        success = False
-                    else:
-                        self.clients_addresses[meeting_id][client_id] = \
-                            client_address
-                else:
-                    self.clients_addresses[meeting_id] = \
-                        {client_id: client_address}
+        success = self.client_id_validator(meeting_id + client_id) and \
+            self.add_client(meeting_id, client_id, client_address)
 
         if success:
             self.print_clients()
         else:
+            self.invalid_ids_counter.inc()
             print(f'Invalid id: {client_id}, ignoring the participant')
 
+    def add_client(self, meeting_id: bytes, client_id: bytes,
+                   client_address: (str, int)) -> bool:
+        """
+        Adds a client (whose id was validated) to the meeting
+        with the id meeting_id.
+        :returns: False if there is already a client with the same id,
+                  True otherwise.
+        """
+        with self.clients_addresses_lock:
+            if meeting_id in self.clients_addresses:
+                # there must not be a participant with the same id!
+                if client_id in self.clients_addresses[meeting_id]:
+                    return False
+                self.clients_addresses[meeting_id][client_id] = \
+                    client_address
+            else:
+                self.clients_addresses[meeting_id] = \
+                    {client_id: client_address}
+            self.clients_counters[meeting_id + client_id] = \
+                [0] * len(BroadcastUdpServer.CLIENT_COUNTERS)
+            self.update_recipients(meeting_id)
+        return True
+
+    def update_recipients(self, meeting_id: bytes,
+                          removed_client_id: bytes = None):
+        """
+        Replaces the recipients snapshot with a new one,
+        in which the entries of a given meeting are rebuilt.
+        Must be called while holding clients_addresses_lock.
+        """
+        recipients = dict(self.recipients)
+        if removed_client_id is not None:
+            recipients.pop(meeting_id + removed_client_id, None)
+
+        addresses = self.clients_addresses.get(meeting_id, {})
+        for client_id in addresses:
+            recipients[meeting_id + client_id] = tuple(
+                self.get_recipient(meeting_id + other_id, address)
+                for other_id, address in addresses.items()
+                if other_id != client_id)
+        self.recipients = recipients
+
+    def get_recipient(self, full_client_id: bytes,
+                      client_address: (str, int)):
+        """
+        Returns the item that represents a recipient in the recipients
+        snapshot (its address, subclasses can add more details).
+        """
+        return client_address
+
     def receive_and_broadcast(self):
         """
         Receives data and broadcasts it to all the other clients,
@@ -80,54 +183,69 @@ class BroadcastUdpServer(threading.Thread):
             while True:
                 data, client_address = self.in_socket.recvfrom(
                     UDP_SOCKET_BUFFER_SIZE)
-
-                n = NETWORK_BYTES_PER_NUM
-                # struct.unpack always returns a tuple
-                id_len = struct.unpack(NETWORK_BYTES_FORMAT, data[:n])[0]
-                received_id = data[n: n + id_len]
-
-                if len(received_id) != MEETING_ID_LEN + CLIENT_ID_LEN:
-                    print(f'Invalid id (len={len(received_id)}).')
-                    continue
-                meeting_id = received_id[:MEETING_ID_LEN]
-                client_id = received_id[MEETING_ID_LEN:]
-                content = data[n + id_len:]
-
-                with self.clients_addresses_lock:
-                    is_known_client = \
-                        meeting_id in self.clients_addresses and \
-                        client_id in self.clients_addresses[meeting_id]
-
-                if is_known_client:
-                    self.broadcast(meeting_id, client_id, data)
-                elif content.startswith(UDP_NEW_CLIENT_MSG):
-                    # if it's a new client
-                    self.add_new_client(meeting_id, client_id,
-                                        client_address)
-                else:
-                    print('malformed packet.')
+                self.handle_datagram(data, client_address)
 
         except socket.error as e:
             print(f'{self.server_name} receive_and_broadcast: {e}')
 
-    def broadcast(self, meeting_id: bytes, sender_client_id: bytes,
-                  packet: bytes):
+    def handle_datagram(self, data: bytes, client_address: (str, int)):
+        """ Handles a datagram that was received from a given client. """
+        n = NETWORK_BYTES_PER_NUM
+        # struct.unpack_from always returns a tuple
+        id_len = BroadcastUdpServer.ID_LEN_STRUCT.unpack_from(data)[0]
+        received_id = data[n: n + id_len]
+
+        # a single lookup in the current snapshot, without locking
+        recipients = self.recipients.get(received_id)
+        if recipients is not None:
+            sent = self.broadcast(received_id, recipients, data)
+            self.count_packet(received_id, len(data), sent)
+        elif len(received_id) != MEETING_ID_LEN + CLIENT_ID_LEN:
+            self.malformed_counter.inc()
+            print(f'Invalid id (len={len(received_id)}).')
+        elif data.startswith(UDP_NEW_CLIENT_MSG, n + id_len):
+            # if it's a new client
+            self.add_new_client(received_id[:MEETING_ID_LEN],
+                                received_id[MEETING_ID_LEN:],
+                                client_address)
+        else:
+            self.malformed_counter.inc()
+            print('malformed packet.')
+
+    def count_packet(self, full_client_id: bytes, size: int,
+                     num_recipients: int):
+        """ Updates the counters of a packet that's relayed. """
+        counters = self.clients_counters.get(full_client_id)
+        # the client might have been removed after the snapshot was read
+        if counters is not None:
+            counters[0] += 1
+            counters[1] += size
+            counters[2] += num_recipients
+            counters[3] += size * num_recipients
+
+    def broadcast(self, sender_id: bytes,
+                  recipients: Tuple[Tuple[str, int], ...],
+                  packet: bytes) -> int:
         """
         Broadcasts a given packet (or chained packets) of data
-        to all the participants in the meeting,
-        except the one who sends the data.
+        to the recipients (all the participants in the meeting,
+        except the one who sends the data).
+        :returns: the number of recipients it was sent to.
         """
-        with self.clients_addresses_lock:
-            addresses = self.clients_addresses[meeting_id]
-            for client_id, client_in_address in addresses.items():
-                if client_id != sender_client_id:
-                    self.out_socket.sendto(packet, client_in_address)
+        for client_in_address in recipients:
+            self.out_socket.sendto(packet, client_in_address)
+        return len(recipients)
 
     def client_disconnected(self, full_client_id: bytes):
         """
         The main server calls this function when a client disconnects.
         It removes it from clients_addresses.
         """
+        self.remove_client(full_client_id)
+        self.print_clients()
+
+    def remove_client(self, full_client_id: bytes):
+        """ Removes a client from clients_addresses (if it's there). """
         meeting_id = full_client_id[:MEETING_ID_LEN]
         client_id = full_client_id[MEETING_ID_LEN:]
         with self.clients_addresses_lock:
@@ -138,11 +256,63 @@ class BroadcastUdpServer(threading.Thread):
                 # if the meeting is now empty, delete the meeting id
                 if not self.clients_addresses[meeting_id]:
                     del self.clients_addresses[meeting_id]
+                self.update_recipients(meeting_id, client_id)
 
-            self.print_clients()
+                # removed and counted under the same lock,
+                # so collect_metrics counts it exactly once
+                counters = self.clients_counters.pop(full_client_id)
+                for i, value in enumerate(counters):
+                    self.removed_clients_counters[i] += value
+                self.remove_client_state(full_client_id)
+
+    def remove_client_state(self, full_client_id: bytes):
+        """
+        Removes the state that's kept about a client who was removed
+        (subclasses keep more state about the clients).
+        Must be called while holding clients_addresses_lock: the state
+        is added while holding it too, only for connected clients (see
+        is_connected), so a late packet from a removed client (or to it)
+        can't add its state again.
+        """
+        pass
+
+    def is_connected(self, *full_client_ids: bytes) -> bool:
+        """
+        Returns whether all the given clients are connected.
+        Must be called while holding clients_addresses_lock.
+        """
+        return all(full_client_id[MEETING_ID_LEN:] in
+                   self.clients_addresses.get(
+                       full_client_id[:MEETING_ID_LEN], ())
+                   for full_client_id in full_client_ids)
+
+    def collect_metrics(self) -> list:
+        """
+        Returns the metrics samples of the channel: the number of
+        meetings and clients, and the totals of the clients' counters
+        (the metrics registry calls it).
+        There are no samples of each meeting or client, because their
+        ids let anyone join the meeting or send as the client.
+        """
+        labels = {'channel': self.server_name}
+        with self.clients_addresses_lock:
+            totals = list(self.removed_clients_counters)
+            for counters in self.clients_counters.values():
+                for i, value in enumerate(counters):
+                    totals[i] += value
+            num_meetings = len(self.clients_addresses)
+            num_clients = len(self.clients_counters)
+
+        samples = [('zoom_udp_meetings', labels, num_meetings),
+                   ('zoom_udp_clients', labels, num_clients)]
+        for name, value in zip(BroadcastUdpServer.CLIENT_COUNTERS, totals):
+            samples.append((f'zoom_udp_{name}_total', labels, value))
+        return samples
 
     def print_clients(self):
         """ Prints the server clients. """
-        print(f'{self.server_name} clients:',
-              {meeting_id.hex(): list(addresses.values())
-               for meeting_id, addresses in self.clients_addresses.items()})
+        with self.clients_addresses_lock:
+            print(f'{self.server_name} clients:',
+                  {meeting_id.hex(): list(addresses.values())
+                   for meeting_id, addresses in
+                   self.clients_addresses.items()})
@@ -4,9 +4,10 @@
 """
 import pickle
 from typing import Callable
-from network.tcp_network_utils import create_packet
+from network.tcp_network_utils import create_packet_buffers
 from network.custom_messages.chat_msg import ChatMsg
 from server.broadcast_tcp_server import BroadcastTcpServer
+from server.metrics_registry import REGISTRY
 from server.participant import Participant
 from server.ids_config import MEETING_ID_LEN
 
@@ -19,6 +20,14 @@ class ChatServer(BroadcastTcpServer):
         """ Constructor. """
         super(ChatServer, self).__init__(ip, client_in_port, client_out_port,
                                          'chat', client_id_validator)
+        help_text = 'Received chat messages by recipient.'
+        self.broadcast_msgs_counter = REGISTRY.counter(
+            'zoom_chat_messages_total', help_text, recipient='everyone')
+        self.private_msgs_counter = REGISTRY.counter(
+            'zoom_chat_messages_total', help_text, recipient='participant')
+        self.undelivered_msgs_counter = REGISTRY.counter(
+            'zoom_chat_undelivered_messages_total',
+            'Private messages whose recipient isn\'t in the meeting.')
 
     def handle_new_data(self, par: Participant, data: bytes):
         """
@@ -26,11 +35,14 @@ class ChatServer(BroadcastTcpServer):
         """
         msg = pickle.loads(data)
         # msg.add_timestamp()
-        packet = create_packet(pickle.dumps(msg))
+        # the message isn't changed, so the received data is forwarded
+        packet = create_packet_buffers(data)
 
         if msg.recipient_id == ChatMsg.BROADCAST_ID:
-            self.broadcast(par, packet)
+            self.broadcast_msgs_counter.inc()
+            self.broadcast(par, *packet)
         else:
+            self.private_msgs_counter.inc()
             with self.participants_lock:
                 pars = self.participants[par.meeting_id]
 
@@ -38,4 +50,6 @@ class ChatServer(BroadcastTcpServer):
                 recipient_client_id = msg.recipient_id[MEETING_ID_LEN:]
 
                 if recipient_client_id in pars:
-                    pars[recipient_client_id].in_socket.sendall(packet)
+                    self.send_to_par(pars[recipient_client_id], *packet)
+                else:
+                    self.undelivered_msgs_counter.inc()
@@ -0,0 +1,123 @@
+"""
+    Hadar Shahar
+    FeedbackUdpServer.
+"""
+import time
+from typing import Callable, Dict, Tuple
+from network.constants import NETWORK_BYTES_PER_NUM, UDP_REPORT_MSG
+from network.custom_messages.receiver_report import ReceiverReport
+from server.broadcast_udp_server import BroadcastUdpServer
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+from server.metrics_registry import REGISTRY
+from server.retransmitting_udp_server import RetransmittingUdpServer
+
+
+class FeedbackUdpServer(RetransmittingUdpServer):
+    """
+    Definition of the class FeedbackUdpServer.
+
+    Collects the receiver reports about each sender (UDP_REPORT_MSG),
+    and sends each sender the aggregated report of its receivers
+    (the worst reception, see ReceiverReport.aggregate) at most every
+    FEEDBACK_INTERVAL, so it can adapt its bitrate.
+    The reports are saved while holding clients_addresses_lock, only
+    for connected clients (see BroadcastUdpServer.remove_client_state).
+    """
+
+    # how often to send each sender its aggregated report (in seconds)
+    FEEDBACK_INTERVAL = 1
+
+    # a report older than that (in seconds) isn't aggregated
+    REPORT_TIMEOUT = 3
+
+    def __init__(self, ip: str, client_in_port: int, client_out_port: int,
+                 server_name: str,
+                 client_id_validator: Callable[[bytes], bool],
+                 reuse_port=False):
+        """ Constructor (see BroadcastUdpServer). """
+        super(FeedbackUdpServer, self).__init__(
+            ip, client_in_port, client_out_port, server_name,
+            client_id_validator, reuse_port)
+        # { sender full id: {receiver full id: (report, receive time)} }
+        self.reports: Dict[bytes, Dict[bytes,
+                                       Tuple[ReceiverReport, float]]] = {}
+        # { sender full id: the time its last feedback was sent }
+        self.feedback_times: Dict[bytes, float] = {}
+
+    def create_metrics(self):
+        """ Creates the reports metrics too. """
+        super(FeedbackUdpServer, self).create_metrics()
+        labels = {'channel': self.server_name}
+        self.reports_counter = REGISTRY.counter(
+            'zoom_udp_receiver_reports_total',
+            'Receiver reports that were received.', **labels)
+        self.feedbacks_counter = REGISTRY.counter(
+            'zoom_udp_sender_feedbacks_total',
+            'Aggregated reports that were sent to the senders.', **labels)
+
+    def broadcast(self, sender_id: bytes,
+                  recipients: Tuple[Tuple[bytes, Tuple[str, int]], ...],
+                  packet: bytes) -> int:
+        """
+        Broadcasts a given packet, or saves it if it's a receiver report.
+        :returns: the number of recipients it was sent to.
+        """
+        offset = NETWORK_BYTES_PER_NUM + len(sender_id)
+        if packet[offset: offset + len(UDP_REPORT_MSG)] == UDP_REPORT_MSG:
+            self.handle_report(sender_id,
+                               packet[offset + len(UDP_REPORT_MSG):])
+            return 0
+        return super(FeedbackUdpServer, self).broadcast(
+            sender_id, recipients, packet)
+
+    def handle_report(self, receiver_id: bytes, content: bytes):
+        """
+        Saves a receiver report, and sends the sender its aggregated
+        report if it's time to.
+        """
+        id_len = MEETING_ID_LEN + CLIENT_ID_LEN
+        sender_id = content[:id_len]
+        report = ReceiverReport.decode(content[id_len:])
+        # a sender from another meeting isn't allowed
+        if report is None or \
+                sender_id[:MEETING_ID_LEN] != receiver_id[:MEETING_ID_LEN]:
+            self.malformed_counter.inc()
+            print('malformed report.')
+            return
+        now = time.monotonic()
+        with self.clients_addresses_lock:
+            sender_address = self.clients_addresses.get(
+                sender_id[:MEETING_ID_LEN], {}).get(
+                sender_id[MEETING_ID_LEN:])
+            if sender_address is None or not self.is_connected(receiver_id):
+                return
+            self.reports_counter.inc()
+
+            sender_reports = self.reports.setdefault(sender_id, {})
+            sender_reports[receiver_id] = (report, now)
+            if now - self.feedback_times.get(sender_id, 0) < \
+                    FeedbackUdpServer.FEEDBACK_INTERVAL:
+                return
+            self.feedback_times[sender_id] = now
+
+            fresh_reports = [
+                report for report, receive_time in sender_reports.values()
+                if now - receive_time < FeedbackUdpServer.REPORT_TIMEOUT]
+        # the report is sent with the sender's own id
+        # (like the data packets, which are sent with their sender id)
+        feedback = BroadcastUdpServer.ID_LEN_STRUCT.pack(len(sender_id)) + \
+            sender_id + UDP_REPORT_MSG + \
+            ReceiverReport.aggregate(fresh_reports).encode()
+        self.out_socket.sendto(feedback, sender_address)
+        self.feedbacks_counter.inc()
+
+    def remove_client_state(self, full_client_id: bytes):
+        """
+        Removes a client's reports (about it and by it).
+        Must be called while holding clients_addresses_lock.
+        """
+        super(FeedbackUdpServer, self).remove_client_state(full_client_id)
+        self.reports.pop(full_client_id, None)
+        self.feedback_times.pop(full_client_id, None)
+        for sender_reports in self.reports.values():
+            sender_reports.pop(full_client_id, None)
@@ -4,15 +4,21 @@
 """
 import pickle
 from typing import Callable
-from network.tcp_network_utils import create_packet, send_packet, recv_packet
+from network.tcp_network_utils import create_packet_buffers
 from network.custom_messages.general_info import Info
 from server.broadcast_tcp_server import BroadcastTcpServer
+from server.metrics_registry import REGISTRY, MetricsRegistry
 from server.participant import Participant
+from server.send_queue import SendQueue
 
 
 class InfoServer(BroadcastTcpServer):
     """ Definition of the class InfoServer. """
 
+    # a dropped info message would leave the client with a wrong state
+    # of the meeting, so a participant that can't keep up is disconnected
+    SEND_QUEUE_OVERFLOW_POLICY = SendQueue.DISCONNECT
+
     def __init__(self, ip: str, client_in_port: int, client_out_port: int,
                  client_disconnected_callback: Callable[[bytes], None],
                  client_id_validator: Callable[[bytes], bool]):
@@ -29,18 +35,17 @@ class InfoServer(BroadcastTcpServer):
         # { meeting_id: [status msg, ...] }
         self.last_status_msgs: [bytes, list] = {}
 
-    def update_par_id(self, par: Participant) -> bool:
-        """
-        Validates the participant's id and if it's valid:
-        updates the par object, receives the client info
-        and calls the function sync_info.
-        :returns: True if the client id is valid, False otherwise.
-        """
-        if not super(InfoServer, self).update_par_id(par):
-            return False
-        par.client_info = pickle.loads(recv_packet(par.out_socket))
-        self.sync_info(par)
-        return True
+        # { msg name: Counter }, the client info is counted as 0
+        self.msgs_counters = {
+            msg_name: REGISTRY.counter(
+                'zoom_info_messages_total', 'Received info messages by type.',
+                msg=attr_name.lower())
+            for attr_name, msg_name in
+            [('CLIENT_INFO', 0)] + list(vars(Info).items())
+            if isinstance(msg_name, int)}
+        REGISTRY.describe('zoom_info_status_msgs', MetricsRegistry.GAUGE,
+                          'Sharing status messages kept for new clients.')
+        REGISTRY.add_collector(self.collect_status_metrics)
 
     def sync_info(self, new_par: Participant):
         """
@@ -51,13 +56,15 @@ class InfoServer(BroadcastTcpServer):
             pars = self.participants[new_par.meeting_id]
 
             # send the other clients info to the new client
+            # a participant whose client info wasn't received yet
+            # will be informed of the new client when it's received
             msg = (Info.CLIENTS_INFO,
                    [par.client_info for client_id, par in pars.items()
-                    if client_id != new_par.client_id])
+                    if client_id != new_par.client_id and par.client_info])
 
         # send the last messages (related to sharing) to the new client
         for m in [msg] + self.last_status_msgs.get(new_par.meeting_id, []):
-            send_packet(new_par.in_socket, pickle.dumps(m))
+            self.send_to_par(new_par, *create_packet_buffers(pickle.dumps(m)))
 
         # inform all the other clients that a new client has connected
         msg = (Info.NEW_CLIENT, new_par.client_info)
@@ -68,14 +75,24 @@ class InfoServer(BroadcastTcpServer):
         Broadcasts a given info msg to all the participants,
         except the one who sends it.
         """
-        packet = create_packet(pickle.dumps(msg))
-        self.broadcast(sender_par, packet)
+        self.broadcast(sender_par, *create_packet_buffers(pickle.dumps(msg)))
 
     def handle_new_data(self, par: Participant, data: bytes):
         """
         Handles new data received from a given participant.
+        The first data packet contains the client info,
+        when it's received the info is synchronized (using sync_info).
         """
+        if par.client_info is None:
+            self.msgs_counters[0].inc()
+            par.client_info = pickle.loads(data)
+            self.sync_info(par)
+            return
+
         msg_name, msg_data = pickle.loads(data)
+        counter = self.msgs_counters.get(msg_name)
+        if counter is not None:
+            counter.inc()
         if msg_name == Info.TOGGLE_AUDIO:
             par.client_info.is_audio_on = not par.client_info.is_audio_on
         elif msg_name == Info.TOGGLE_VIDEO:
@@ -85,8 +102,7 @@ class InfoServer(BroadcastTcpServer):
             # handle_opposite_msg won't do anything
             self.handle_opposite_msg(par, msg_name, msg_data)
 
-        packet = create_packet(data)
-        self.broadcast(par, packet)
+        self.broadcast(par, *create_packet_buffers(data))
 
     def handle_opposite_msg(self, sender_par: Participant, msg_name, msg_data):
         """
@@ -143,3 +159,12 @@ class InfoServer(BroadcastTcpServer):
 
         # inform the main server that that client has disconnected
         self.client_disconnected_callback(full_par_id)
+
+    def collect_status_metrics(self) -> list:
+        """
+        Returns the number of status messages of all the meetings
+        (the metrics registry calls it).
+        """
+        return [('zoom_info_status_msgs', {'channel': self.server_name},
+                 sum(len(msgs) for msgs in
+                     list(self.last_status_msgs.values())))]
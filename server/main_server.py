@@ -2,21 +2,54 @@
     Hadar Shahar
     The main server code.
 """
+import socket
+from typing import Callable
 from server.network_constants import *
+from server.audio_mixing_server import AudioMixingServer
 from server.broadcast_udp_server import BroadcastUdpServer
+from server.feedback_udp_server import FeedbackUdpServer
+from server.multi_process_udp_server import MultiProcessUdpServer
+from server.udp_relay_worker import UdpRelayWorker, FeedbackUdpRelayWorker
 from server.auth_server import AuthServer
 from server.info_server import InfoServer
 from server.chat_server import ChatServer
+from server.metrics_server import MetricsServer
 
 IP = '0.0.0.0'
 
+# the metrics are served only on the loopback interface,
+# they aren't for the clients (see MetricsServer)
+METRICS_IP = '127.0.0.1'
+METRICS_PORT = 7234
+
+# the number of processes that relay each udp channel (video/screen/audio),
+# 0 relays each channel in a thread of the main process.
+# the processes bind the same ports using SO_REUSEPORT,
+# which isn't available on Windows.
+# the video and screen channels shard the meetings between the workers,
+# because a receiver's layer requests, nacks and reports must reach
+# the worker that relays its senders' packets (see UdpRelayWorker).
+UDP_WORKER_PROCESSES = 0
+
+# if True, the audio of each meeting is mixed by the server
+# (see AudioMixingServer), so each client receives a single stream
+# instead of the chunks of every speaker.
+# the mixing server always runs in a thread.
+AUDIO_MIXING = False
+
 
 class MainServer(object):
     """ Definition of the class MainServer. """
 
-    def __init__(self, ip: str):
-        """ Initializes the servers. """
-        self.auth_server = AuthServer(AUTH_SERVER_PORT)
+    def __init__(self, ip: str, auth_server: AuthServer = None):
+        """
+        Initializes the servers.
+        auth_server can replace the default AuthServer
+        (the load benchmark replaces its google api calls).
+        """
+        if auth_server is None:
+            auth_server = AuthServer(AUTH_SERVER_PORT)
+        self.auth_server = auth_server
         client_id_validator = self.auth_server.validate_client_id
 
         self.info_server = InfoServer(
@@ -25,20 +58,48 @@ class MainServer(object):
         self.chat_server = ChatServer(
             ip, CLIENT_IN_CHAT_PORT, CLIENT_OUT_CHAT_PORT, client_id_validator)
 
-        self.video_server = BroadcastUdpServer(
+        self.video_server = MainServer.create_udp_server(
             ip, CLIENT_IN_VIDEO_PORT, CLIENT_OUT_VIDEO_PORT,
-            'video', client_id_validator)
-        self.share_screen_server = BroadcastUdpServer(
+            'video', client_id_validator, FeedbackUdpServer)
+        self.share_screen_server = MainServer.create_udp_server(
             ip, CLIENT_IN_SCREEN_PORT, CLIENT_OUT_SCREEN_PORT,
-            'share_screen', client_id_validator)
-        self.audio_server = BroadcastUdpServer(
-            ip, CLIENT_IN_AUDIO_PORT, CLIENT_OUT_AUDIO_PORT,
-            'audio', client_id_validator)
+            'share_screen', client_id_validator, FeedbackUdpServer)
+        if AUDIO_MIXING:
+            self.audio_server = AudioMixingServer(
+                ip, CLIENT_IN_AUDIO_PORT, CLIENT_OUT_AUDIO_PORT,
+                'audio', client_id_validator)
+        else:
+            self.audio_server = MainServer.create_udp_server(
+                ip, CLIENT_IN_AUDIO_PORT, CLIENT_OUT_AUDIO_PORT,
+                'audio', client_id_validator)
 
         self.udp_servers = (self.video_server, self.share_screen_server,
                             self.audio_server)
+        self.metrics_server = MetricsServer(METRICS_IP, METRICS_PORT)
         self.servers = (self.auth_server, self.info_server, self.chat_server,
-                        *self.udp_servers)
+                        *self.udp_servers, self.metrics_server)
+
+    @staticmethod
+    def create_udp_server(ip: str, client_in_port: int, client_out_port: int,
+                          server_name: str,
+                          client_id_validator: Callable[[bytes], bool],
+                          server_class: type = BroadcastUdpServer):
+        """
+        Creates a server (BroadcastUdpServer or FeedbackUdpServer)
+        for a udp channel, which runs in UDP_WORKER_PROCESSES processes
+        if it's possible.
+        """
+        if UDP_WORKER_PROCESSES and hasattr(socket, 'SO_REUSEPORT'):
+            if server_class is FeedbackUdpServer:
+                return MultiProcessUdpServer(
+                    ip, client_in_port, client_out_port, server_name,
+                    client_id_validator, UDP_WORKER_PROCESSES,
+                    FeedbackUdpRelayWorker, shard_meetings=True)
+            return MultiProcessUdpServer(
+                ip, client_in_port, client_out_port, server_name,
+                client_id_validator, UDP_WORKER_PROCESSES, UdpRelayWorker)
+        return server_class(ip, client_in_port, client_out_port,
+                            server_name, client_id_validator)
 
     def start(self):
         """ Starts the servers, each one in a separate thread. """
@@ -0,0 +1,211 @@
+"""
+    Hadar Shahar
+    MetricsRegistry.
+"""
+import bisect
+import threading
+from typing import Callable, Iterable, Tuple, Dict
+
+
+class Counter(object):
+    """
+    Definition of the class Counter.
+    A value that only goes up. It's incremented without a lock
+    (concurrent increments from several threads might be lost,
+    which is fine for metrics and keeps the increment cheap).
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        """ Constructor. """
+        self.value = 0
+
+    def inc(self, amount=1):
+        """ Increments the counter by a given amount. """
+        self.value += amount
+
+
+class Histogram(object):
+    """
+    Definition of the class Histogram.
+    Counts the observed values in buckets (by their upper bounds),
+    and keeps their sum and count.
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        """ Constructor. """
+        self.buckets = tuple(sorted(buckets))
+        # the last count is of the values above the last bucket (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        """ Adds a given value to the histogram. """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry(object):
+    """
+    Definition of the class MetricsRegistry.
+
+    Holds the metrics of the servers and renders them in the prometheus
+    text format. There are two kinds of metrics:
+    - counters and histograms that are updated on the hot path,
+      each one has fixed labels (see counter, histogram).
+    - values that already exist somewhere (like the participants'
+      counters and queue depths), which are read only when the metrics
+      are rendered by a collector function (see add_collector).
+    """
+
+    COUNTER = 'counter'
+    GAUGE = 'gauge'
+    HISTOGRAM = 'histogram'
+
+    def __init__(self):
+        """ Constructor. """
+        # { name: (metric type, help text) }
+        self.families: Dict[str, Tuple[str, str]] = {}
+        # { (name, labels): Counter / Histogram }
+        self.metrics: Dict[Tuple[str, tuple], object] = {}
+        # each collector returns (name, labels, value) samples
+        self.collectors: [Callable[[], Iterable[Tuple[str, dict, float]]]] \
+            = []
+        self.lock = threading.Lock()
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        """
+        Describes a metric, a metric returned by a collector
+        must be described before it's rendered.
+        """
+        with self.lock:
+            self.families[name] = (metric_type, help_text)
+
+    def get_families(self) -> Dict[str, Tuple[str, str]]:
+        """ Returns a copy of the descriptions of the metrics. """
+        with self.lock:
+            return dict(self.families)
+
+    def counter(self, name: str, help_text: str, **labels: str) -> Counter:
+        """
+        Returns the counter with a given name and labels
+        (creates it if it doesn't exist).
+        """
+        return self.get_metric(name, MetricsRegistry.COUNTER, help_text,
+                               labels, Counter)
+
+    def histogram(self, name: str, help_text: str,
+                  buckets: Tuple[float, ...], **labels: str) -> Histogram:
+        """
+        Returns the histogram with a given name and labels
+        (creates it if it doesn't exist).
+        """
+        return self.get_metric(name, MetricsRegistry.HISTOGRAM, help_text,
+                               labels, lambda: Histogram(buckets))
+
+    def get_metric(self, name: str, metric_type: str, help_text: str,
+                   labels: dict, create: Callable[[], object]):
+        """ Returns a metric, and creates it if it doesn't exist. """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.families.setdefault(name, (metric_type, help_text))
+            if key not in self.metrics:
+                self.metrics[key] = create()
+            return self.metrics[key]
+
+    def add_collector(self, collector:
+                      Callable[[], Iterable[Tuple[str, dict, float]]]):
+        """
+        Adds a function that's called when the metrics are rendered,
+        it returns (name, labels, value) samples of described metrics.
+        """
+        with self.lock:
+            self.collectors.append(collector)
+
+    def collect(self) -> list:
+        """
+        Returns the (name, labels, value) samples of the counters and of
+        the collectors, like a collector (so the metrics of another
+        process can be passed to this one's registry, see
+        MultiProcessUdpServer). The histograms aren't included.
+        """
+        with self.lock:
+            metrics = list(self.metrics.items())
+            collectors = list(self.collectors)
+
+        samples = [(name, dict(labels), metric.value)
+                   for (name, labels), metric in metrics
+                   if isinstance(metric, Counter)]
+        for collector in collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                print('MetricsRegistry.collect:', e)
+        return samples
+
+    def render(self) -> str:
+        """ Returns all the metrics in the prometheus text format. """
+        # { name: [line, ...] }
+        samples: Dict[str, list] = {}
+        with self.lock:
+            metrics = list(self.metrics.items())
+
+        for (name, labels), metric in metrics:
+            if isinstance(metric, Histogram):
+                lines = samples.setdefault(name, [])
+                cumulative = 0
+                bounds = [str(bound) for bound in metric.buckets] + ['+Inf']
+                for bound, count in zip(bounds, metric.counts):
+                    cumulative += count
+                    lines.append(MetricsRegistry.format_sample(
+                        f'{name}_bucket', labels + (('le', bound),),
+                        cumulative))
+                lines.append(MetricsRegistry.format_sample(
+                    f'{name}_sum', labels, metric.sum))
+                lines.append(MetricsRegistry.format_sample(
+                    f'{name}_count', labels, metric.count))
+
+        for name, labels, value in self.collect():
+            samples.setdefault(name, []).append(
+                MetricsRegistry.format_sample(
+                    name, tuple(labels.items()), value))
+
+        # after the collectors, which might describe metrics
+        with self.lock:
+            families = dict(self.families)
+        lines = []
+        for name, metric_lines in samples.items():
+            metric_type, help_text = families.get(
+                name, (MetricsRegistry.GAUGE, ''))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(metric_lines)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def format_sample(name: str, labels: Tuple[Tuple[str, str], ...],
+                      value: float) -> str:
+        """ Formats a sample line: name{label="value",...} value """
+        if not labels:
+            return f'{name} {value}'
+        formatted_labels = ','.join(
+            f'{key}="{MetricsRegistry.escape(str(label_value))}"'
+            for key, label_value in labels)
+        return f'{name}{{{formatted_labels}}} {value}'
+
+    @staticmethod
+    def escape(label_value: str) -> str:
+        """ Escapes a label value for the text format. """
+        return label_value.replace('\\', r'\\').replace('"', r'\"') \
+            .replace('\n', r'\n')
+
+
+# the registry of all the servers in this process
+# (the metrics of udp worker processes are collected from them,
+# see MultiProcessUdpServer)
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,60 @@
+"""
+    Hadar Shahar
+    MetricsServer.
+"""
+import sys
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from server.metrics_registry import REGISTRY
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Definition of the class MetricsRequestHandler.
+    Returns the metrics of all the servers in this process on GET /metrics.
+    """
+
+    # the content type of the metrics (the prometheus text format)
+    METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def do_GET(self):
+        """ Handles a GET request. """
+        if self.path != '/metrics':
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type',
+                         MetricsRequestHandler.METRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        """ Doesn't log the requests (they are scraped periodically). """
+        pass
+
+
+class MetricsServer(threading.Thread):
+    """
+    Definition of the class MetricsServer.
+    Serves the metrics on a separate http listener, which should be bound
+    to the loopback interface, so only the monitoring on the server's
+    machine (or a proxy there) can read them.
+    """
+
+    def __init__(self, ip: str, port: int):
+        """ Constructor. """
+        super(MetricsServer, self).__init__()
+        try:
+            self.http_server = ThreadingHTTPServer((ip, port),
+                                                   MetricsRequestHandler)
+            print(f'metrics server listening on {ip}:{port}')
+        except OSError as msg:
+            print(f'metrics server connection failure: {msg}')
+            sys.exit(1)
+
+    def run(self):
+        """ Runs the server. """
+        self.http_server.serve_forever()
@@ -0,0 +1,162 @@
+"""
+    Hadar Shahar
+    MultiProcessUdpServer.
+"""
+import queue
+import threading
+import multiprocessing
+import time
+from typing import Callable
+from server.metrics_registry import REGISTRY, MetricsRegistry
+from server.udp_relay_worker import UdpRelayWorker, run_worker
+
+
+class MultiProcessUdpServer(threading.Thread):
+    """
+    Definition of the class MultiProcessUdpServer.
+
+    Relays the packets of a udp channel in several worker processes
+    (UdpRelayWorker), so the relaying isn't limited to one core.
+    All the workers bind the same ports using SO_REUSEPORT,
+    and the kernel distributes the packets between them by the sender
+    address (so the packets of each client stay in order).
+
+    This thread validates the new clients (in the main process,
+    where the client id validator is) and sends the membership updates
+    to all the workers. The workers' metrics are collected from them
+    when the metrics are rendered (see collect_metrics).
+    """
+
+    # how long to wait for the workers' metrics (in seconds)
+    METRICS_TIMEOUT = 1
+
+    def __init__(self, ip: str, client_in_port: int, client_out_port: int,
+                 server_name: str,
+                 client_id_validator: Callable[[bytes], bool],
+                 num_workers: int, worker_class: type = UdpRelayWorker,
+                 shard_meetings=False):
+        """
+        Creates the worker processes (of a given UdpRelayWorker class).
+        If shard_meetings is True, each meeting is relayed by a single
+        worker (see UdpRelayWorker).
+        """
+        super(MultiProcessUdpServer, self).__init__()
+        self.server_name = server_name
+        self.client_id_validator = client_id_validator
+        self.shard_meetings = shard_meetings
+
+        # spawn and not fork, because the main process already runs threads
+        context = multiprocessing.get_context('spawn')
+        self.new_clients_queue = context.Queue()
+        self.updates_queues = [context.Queue() for _ in range(num_workers)]
+        self.peers_queue = context.Queue()
+        self.metrics_queue = context.Queue()
+        self.workers = [
+            context.Process(target=run_worker, daemon=True, args=(
+                worker_class, ip, client_in_port, client_out_port,
+                f'{server_name}-{i}', i, shard_meetings,
+                (self.new_clients_queue, updates_queue, self.peers_queue,
+                 self.metrics_queue)))
+            for i, updates_queue in enumerate(self.updates_queues)]
+
+        # a scrape waits for the replies to its own request
+        self.metrics_lock = threading.Lock()
+        self.metrics_request_id = 0
+        REGISTRY.add_collector(self.collect_metrics)
+
+    def run(self):
+        """
+        Starts the workers and validates the new clients they receive.
+        """
+        for worker in self.workers:
+            worker.start()
+        if self.shard_meetings:
+            self.send_peers()
+
+        while True:
+            meeting_id, client_id, client_address = \
+                self.new_clients_queue.get()
+            if self.client_id_validator(meeting_id + client_id):
+                self.send_update(UdpRelayWorker.ADD_CLIENT,
+                                 (meeting_id, client_id, client_address))
+                print(f'{self.server_name} new client: '
+                      f'{(meeting_id + client_id).hex()} {client_address}')
+            else:
+                print(f'Invalid id: {client_id}, ignoring the participant')
+
+    def send_peers(self):
+        """
+        Waits for the addresses of the workers' peer sockets,
+        and sends all of them to every worker.
+        """
+        peers = [None] * len(self.workers)
+        for _ in self.workers:
+            worker_index, address = self.peers_queue.get()
+            peers[worker_index] = address
+        self.send_update(UdpRelayWorker.SET_PEERS, tuple(peers))
+
+    def client_disconnected(self, full_client_id: bytes):
+        """
+        The main server calls this function when a client disconnects.
+        It removes it from all the workers.
+        """
+        self.send_update(UdpRelayWorker.REMOVE_CLIENT, full_client_id)
+        print(f'{self.server_name} client left: {full_client_id.hex()}')
+
+    def close(self):
+        """ Terminates the worker processes. """
+        for worker in self.workers:
+            worker.terminate()
+
+    def send_update(self, update_type: int, args):
+        """ Sends an update to all the workers. """
+        for updates_queue in self.updates_queues:
+            updates_queue.put((update_type, args))
+
+    def collect_metrics(self) -> list:
+        """
+        Returns the metrics samples of the workers, as the samples of
+        this channel (the metrics registry calls it): the counters are
+        summed, and of the gauges (like the clients, which every worker
+        knows) the largest is taken.
+        A worker that doesn't reply in METRICS_TIMEOUT is left out.
+        """
+        with self.metrics_lock:
+            self.metrics_request_id += 1
+            request_id = self.metrics_request_id
+            self.send_update(UdpRelayWorker.REPORT_METRICS, request_id)
+
+            # { (name, labels): value }
+            totals = {}
+            deadline = time.monotonic() + \
+                MultiProcessUdpServer.METRICS_TIMEOUT
+            replies = 0
+            while replies < len(self.workers):
+                try:
+                    reply_id, families, samples = self.metrics_queue.get(
+                        timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    print(f'{self.server_name} collect_metrics: '
+                          f'{len(self.workers) - replies} workers '
+                          f'didn\'t reply')
+                    break
+                # a late reply to an earlier request
+                if reply_id != request_id:
+                    continue
+                replies += 1
+
+                for name, labels, value in samples:
+                    metric_type, help_text = families.get(
+                        name, (MetricsRegistry.GAUGE, ''))
+                    REGISTRY.describe(name, metric_type, help_text)
+                    labels = dict(labels, channel=self.server_name)
+                    key = (name, tuple(labels.items()))
+                    if key not in totals:
+                        totals[key] = value
+                    elif metric_type == MetricsRegistry.GAUGE:
+                        totals[key] = max(totals[key], value)
+                    else:
+                        totals[key] += value
+
+        return [(name, dict(labels), value)
+                for (name, labels), value in totals.items()]
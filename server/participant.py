@@ -2,25 +2,42 @@
     Hadar Shahar
     Participant.
 """
-import threading
+from server.send_queue import SendQueue
 
 
 class Participant(object):
     """ Definition of the class Participant. """
 
     def __init__(self, address: (str, int), in_socket=None, out_socket=None,
-                 meeting_id=b'', client_id=b''):
+                 meeting_id=b'', client_id=b'', send_queue: SendQueue = None):
         """ Constructor. """
         self.address = address
         self.in_socket = in_socket
         self.out_socket = out_socket
         self.meeting_id = meeting_id
         self.client_id = client_id
-        self.lock = threading.Lock()
+        # the packet of the full id that prefixes the data sent to the others
+        self.id_header = b''
+        self.is_connected = True
+
+        # the packets waiting to be sent to the input socket
+        self.send_queue = send_queue if send_queue is not None else SendQueue()
+
+        # the packets (and bytes) received from the output socket,
+        # they are exported by the server's metrics
+        self.received_packets = 0
+        self.received_bytes = 0
 
         # client_info is only used by the info server
         self.client_info = None
 
+        # reads the packets from the output socket
+        self.reader = None
+
+        # True if the input socket is registered for write events
+        # (only used by the server's event loop)
+        self.is_writing = False
+
     def done_connecting(self) -> bool:
         """
         Checks if the participant has connected to the server
@@ -0,0 +1,185 @@
+"""
+    Hadar Shahar
+    RetransmittingUdpServer.
+"""
+import collections
+import struct
+import time
+from typing import Callable, Dict, Tuple
+from network.constants import NETWORK_BYTES_PER_NUM, UDP_NACK_MSG
+from server.ids_config import MEETING_ID_LEN, CLIENT_ID_LEN
+from server.metrics_registry import REGISTRY
+from server.simulcast_udp_server import SimulcastUdpServer
+
+
+class RetransmittingUdpServer(SimulcastUdpServer):
+    """
+    Definition of the class RetransmittingUdpServer.
+
+    Keeps the last CACHE_SIZE video packets of each sender, and sends
+    them again to a receiver that has missed them (when it sends a
+    UDP_NACK_MSG). The packets are sent again only to the receiver that
+    has asked for them, and at most RETRANSMIT_RATE packets per second
+    to each receiver, so retransmissions can't flood a lossy link.
+    The caches and the budgets are added and removed while holding
+    clients_addresses_lock, only for connected clients (see
+    BroadcastUdpServer.remove_client_state).
+    """
+
+    # the number of packets that are kept for each sender
+    CACHE_SIZE = 512
+
+    # the maximum packets per second that are retransmitted to a receiver,
+    # and how many of them can be sent at once
+    RETRANSMIT_RATE = 300
+    RETRANSMIT_BURST = 60
+
+    # after UDP_NACK_MSG and the sender id: layer, frame index
+    NACK_HEADER_STRUCT = struct.Struct('>BI')
+    NACK_INDEX_STRUCT = struct.Struct('>H')
+
+    def __init__(self, ip: str, client_in_port: int, client_out_port: int,
+                 server_name: str,
+                 client_id_validator: Callable[[bytes], bool],
+                 reuse_port=False):
+        """ Constructor (see BroadcastUdpServer). """
+        super(RetransmittingUdpServer, self).__init__(
+            ip, client_in_port, client_out_port, server_name,
+            client_id_validator, reuse_port)
+        # { sender full id: ({packet key: packet}, deque of packet keys) }
+        # a packet key is the beginning of its header (see
+        # SimulcastUdpServer.LAYER_HEADER_STRUCT)
+        self.packets_caches: Dict[bytes, Tuple[dict,
+                                               collections.deque]] = {}
+        # { receiver full id: [available retransmissions, last update] }
+        self.retransmit_budgets: Dict[bytes, list] = {}
+
+    def create_metrics(self):
+        """ Creates the retransmissions metrics too. """
+        super(RetransmittingUdpServer, self).create_metrics()
+        labels = {'channel': self.server_name}
+        self.retransmitted_counter = REGISTRY.counter(
+            'zoom_udp_retransmitted_packets_total',
+            'Packets that were sent again after a NACK.', **labels)
+        self.cache_misses_counter = REGISTRY.counter(
+            'zoom_udp_nack_cache_misses_total',
+            'NACKed packets that were no longer cached.', **labels)
+        self.rate_limited_counter = REGISTRY.counter(
+            'zoom_udp_nack_rate_limited_total',
+            'NACKed packets that weren\'t sent because of the rate limit.',
+            **labels)
+
+    def broadcast(self, sender_id: bytes,
+                  recipients: Tuple[Tuple[bytes, Tuple[str, int]], ...],
+                  packet: bytes) -> int:
+        """
+        Caches a given packet and broadcasts it,
+        or retransmits the packets that a NACK asks for.
+        :returns: the number of recipients it was sent to.
+        """
+        offset = NETWORK_BYTES_PER_NUM + len(sender_id)
+        if packet[offset: offset + len(UDP_NACK_MSG)] == UDP_NACK_MSG:
+            self.handle_nack(sender_id,
+                             packet[offset + len(UDP_NACK_MSG):])
+            return 0
+
+        key_size = SimulcastUdpServer.LAYER_HEADER_STRUCT.size
+        if len(packet) >= offset + key_size:
+            cache = self.packets_caches.get(sender_id)
+            if cache is None:
+                cache = self.add_packets_cache(sender_id)
+            if cache is not None:
+                packets, keys = cache
+                if len(keys) == keys.maxlen:
+                    # the deque drops its oldest key when a key is appended
+                    packets.pop(keys[0], None)
+                key = bytes(packet[offset: offset + key_size])
+                keys.append(key)
+                packets[key] = packet
+
+        return super(RetransmittingUdpServer, self).broadcast(
+            sender_id, recipients, packet)
+
+    def add_packets_cache(self, sender_id: bytes):
+        """
+        Adds an empty packets cache for a sender,
+        unless it was removed (after its packet was received).
+        :returns: the cache, or None if the sender isn't connected.
+        """
+        with self.clients_addresses_lock:
+            if not self.is_connected(sender_id):
+                return None
+            return self.packets_caches.setdefault(sender_id, (
+                {}, collections.deque(
+                    maxlen=RetransmittingUdpServer.CACHE_SIZE)))
+
+    def handle_nack(self, receiver_id: bytes, content: bytes):
+        """
+        Sends the packets that a receiver asks for again
+        (if they're still cached and the rate limit allows it).
+        """
+        id_len = MEETING_ID_LEN + CLIENT_ID_LEN
+        n = id_len + RetransmittingUdpServer.NACK_HEADER_STRUCT.size
+        index_size = RetransmittingUdpServer.NACK_INDEX_STRUCT.size
+        if len(content) < n or (len(content) - n) % index_size:
+            self.malformed_counter.inc()
+            print('malformed nack.')
+            return
+        sender_id = content[:id_len]
+        layer, frame_index = RetransmittingUdpServer.NACK_HEADER_STRUCT \
+            .unpack_from(content, id_len)
+
+        # a sender from another meeting isn't allowed
+        if sender_id[:MEETING_ID_LEN] != receiver_id[:MEETING_ID_LEN]:
+            return
+        num_packets = (len(content) - n) // index_size
+        with self.clients_addresses_lock:
+            receiver_address = self.clients_addresses.get(
+                receiver_id[:MEETING_ID_LEN], {}).get(
+                receiver_id[MEETING_ID_LEN:])
+            cache = self.packets_caches.get(sender_id)
+            if receiver_address is None or cache is None:
+                return
+            allowed = self.take_retransmissions(receiver_id, num_packets)
+        self.rate_limited_counter.inc(num_packets - allowed)
+        for i in range(allowed):
+            packet_index = RetransmittingUdpServer.NACK_INDEX_STRUCT \
+                .unpack_from(content, n + i * index_size)[0]
+            packet = cache[0].get(SimulcastUdpServer.LAYER_HEADER_STRUCT.pack(
+                layer, frame_index, packet_index))
+            if packet is None:
+                self.cache_misses_counter.inc()
+            else:
+                self.out_socket.sendto(packet, receiver_address)
+                self.retransmitted_counter.inc()
+
+    def take_retransmissions(self, receiver_id: bytes, count: int) -> int:
+        """
+        Takes up to count retransmissions from the receiver's budget
+        (a token bucket, which fills at RETRANSMIT_RATE per second).
+        Must be called while holding clients_addresses_lock,
+        for a connected receiver.
+        :returns: the number of retransmissions that are allowed.
+        """
+        now = time.monotonic()
+        budget = self.retransmit_budgets.get(receiver_id)
+        if budget is None:
+            budget = self.retransmit_budgets[receiver_id] = \
+                [RetransmittingUdpServer.RETRANSMIT_BURST, now]
+        budget[0] = min(RetransmittingUdpServer.RETRANSMIT_BURST,
+                        budget[0] + (now - budget[1]) *
+                        RetransmittingUdpServer.RETRANSMIT_RATE)
+        budget[1] = now
+        allowed = min(count, int(budget[0]))
+        budget[0] -= allowed
+        return allowed
+
+    def remove_client_state(self, full_client_id: bytes):
+        """
+        Removes a client's cached packets and retransmissions budget.
+        Must be called while holding clients_addresses_lock.
+        """
+        super(RetransmittingUdpServer, self).remove_client_state(
+            full_client_id)
+        self.packets_caches.pop(full_client_id, None)
+        self.retransmit_budgets.pop(full_client_id, None)
@@ -0,0 +1,178 @@
+"""
+    Hadar Shahar
+    SendQueue.
+"""
+import threading
+from collections import deque
+from typing import Union, Sequence
+
+
+class SendQueue(object):
+    """
+    Definition of the class SendQueue.
+
+    A bounded queue of packets waiting to be sent to a participant,
+    so a slow participant can't block the others (and can't take
+    unlimited memory). When the queue is full, the packets are
+    handled according to the overflow policy.
+    Each packet is a sequence of buffers that are sent one after the other,
+    so the packets don't have to be joined (copied) before they're queued.
+    """
+
+    # overflow policies
+    DROP_OLDEST = 1  # drop the oldest queued packets to make room
+    DROP_NEWEST = 2  # drop the new packet
+    DISCONNECT = 3   # disconnect the participant
+
+    DEFAULT_MAX_PACKETS = 1000
+    DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, max_packets=DEFAULT_MAX_PACKETS,
+                 max_bytes=DEFAULT_MAX_BYTES, overflow_policy=DROP_OLDEST):
+        """ Constructor. """
+        self.max_packets = max_packets
+        self.max_bytes = max_bytes
+        self.overflow_policy = overflow_policy
+
+        # (buffers, packet size) of each packet
+        self.packets = deque()
+        self.num_bytes = 0  # the number of queued bytes (not sent yet)
+        # the number of bytes of the first packet that were already sent,
+        # this packet must not be dropped (it would corrupt the stream)
+        self.sent_offset = 0
+
+        self.sent_packets = 0
+        self.sent_bytes = 0
+        self.dropped_packets = 0
+        self.dropped_bytes = 0
+
+        self.is_open = True
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+
+    def put(self, buffers: Sequence[bytes]) -> bool:
+        """
+        Adds a packet (a sequence of buffers) to the queue.
+        :returns: False if the queue has overflowed and
+                  the participant should be disconnected, True otherwise.
+        """
+        packet_size = sum(len(buffer) for buffer in buffers)
+        with self.lock:
+            if not self.is_open:
+                return True
+            if len(self.packets) >= self.max_packets or \
+                    self.num_bytes + packet_size > self.max_bytes:
+                if self.overflow_policy == SendQueue.DISCONNECT:
+                    return False
+                if self.overflow_policy == SendQueue.DROP_NEWEST or \
+                        not self.make_room(packet_size):
+                    self.count_dropped(packet_size)
+                    return True
+
+            self.packets.append((buffers, packet_size))
+            self.num_bytes += packet_size
+            self.not_empty.notify()
+        return True
+
+    def make_room(self, packet_size: int) -> bool:
+        """
+        Drops the oldest packets until there is room for a new packet
+        (the lock must be acquired).
+        :returns: True if there is room for the packet, False otherwise.
+        """
+        # the first packet was partially sent, so it must be kept
+        first_droppable = 1 if self.sent_offset else 0
+        while len(self.packets) > first_droppable and \
+                (len(self.packets) >= self.max_packets or
+                 self.num_bytes + packet_size > self.max_bytes):
+            dropped_buffers, dropped_size = self.packets[first_droppable]
+            del self.packets[first_droppable]
+            self.num_bytes -= dropped_size
+            self.count_dropped(dropped_size)
+
+        return len(self.packets) < self.max_packets and \
+            self.num_bytes + packet_size <= self.max_bytes
+
+    def count_dropped(self, packet_size: int):
+        """ Updates the drop counters. """
+        self.dropped_packets += 1
+        self.dropped_bytes += packet_size
+
+    def peek(self, max_bytes: int, max_buffers: int) -> list:
+        """
+        Returns the buffers of the first packets that weren't sent yet,
+        up to max_bytes and max_buffers
+        (at least one packet if the queue isn't empty).
+        :returns: a list of memoryviews, empty if the queue is empty.
+        """
+        views = []
+        total_size = 0
+        with self.lock:
+            skip = self.sent_offset
+            for buffers, packet_size in self.packets:
+                if views and (total_size + packet_size > max_bytes or
+                              len(views) + len(buffers) > max_buffers):
+                    break
+                for buffer in buffers:
+                    # skip the part of the first packet that was sent
+                    if skip >= len(buffer):
+                        skip -= len(buffer)
+                        continue
+                    views.append(memoryview(buffer)[skip:])
+                    skip = 0
+                total_size += packet_size
+        return views
+
+    def consume(self, num_bytes: int):
+        """
+        Marks a given number of bytes of the first packets as sent,
+        and removes the packets that were fully sent.
+        """
+        with self.lock:
+            self.num_bytes -= num_bytes
+            num_bytes += self.sent_offset
+            while self.packets and num_bytes >= self.packets[0][1]:
+                buffers, packet_size = self.packets.popleft()
+                num_bytes -= packet_size
+                self.sent_packets += 1
+                self.sent_bytes += packet_size
+            self.sent_offset = num_bytes
+
+    def get(self) -> Union[Sequence[bytes], None]:
+        """
+        Removes and returns the buffers of the first packet,
+        blocks until there is a packet in the queue.
+        :returns: None if the queue was closed.
+        """
+        with self.not_empty:
+            while self.is_open and not self.packets:
+                self.not_empty.wait()
+            if not self.is_open:
+                return None
+            buffers, packet_size = self.packets.popleft()
+            self.num_bytes -= packet_size
+            # the caller sends the packet after it's removed
+            self.sent_packets += 1
+            self.sent_bytes += packet_size
+            return buffers
+
+    def close(self):
+        """ Closes the queue and releases the waiting getter. """
+        with self.lock:
+            self.is_open = False
+            self.packets.clear()
+            self.num_bytes = 0
+            self.not_empty.notify_all()
+
+    def stats(self) -> dict:
+        """ Returns the queue depth and the sent and dropped counters. """
+        return {'queued_packets': len(self.packets),
+                'queued_bytes': self.num_bytes,
+                'sent_packets': self.sent_packets,
+                'sent_bytes': self.sent_bytes,
+                'dropped_packets': self.dropped_packets,
+                'dropped_bytes': self.dropped_bytes}
+
+    def __len__(self) -> int:
+        """ Returns the number of queued packets. """
+        return len(self.packets)
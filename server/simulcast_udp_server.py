@@ -0,0 +1,126 @@
+"""
+    Hadar Shahar
+    SimulcastUdpServer.
+"""
+import struct
+from typing import Dict, Callable, Tuple
+from network.constants import NETWORK_BYTES_PER_NUM, UDP_LAYER_REQUEST_MSG
+from server.broadcast_udp_server import BroadcastUdpServer
+
+
+class SimulcastUdpServer(BroadcastUdpServer):
+    """
+    Definition of the class SimulcastUdpServer.
+
+    Relays video that's sent in several simulcast layers
+    (the same frame in different sizes / qualities, see
+    VideoEncoder.LAYERS). Each receiver gets only the layer it has
+    requested (using UDP_LAYER_REQUEST_MSG), or the best layer the sender
+    sends if it doesn't send the requested one. A receiver is switched
+    to another layer only at the beginning of a frame of that layer,
+    so it never gets half a frame of each layer.
+    The layers state is read without a lock, and it's changed while
+    holding clients_addresses_lock, only for connected clients (see
+    BroadcastUdpServer.remove_client_state).
+    """
+
+    # the beginning of the UdpPacket header (client/video/udp_packet.py):
+    # layer, frame index, packet index
+    LAYER_HEADER_STRUCT = struct.Struct('>3I')
+
+    # the layer that's sent to a receiver that hasn't requested a layer
+    DEFAULT_LAYER = 0
+
+    def __init__(self, ip: str, client_in_port: int, client_out_port: int,
+                 server_name: str,
+                 client_id_validator: Callable[[bytes], bool],
+                 reuse_port=False):
+        """ Constructor (see BroadcastUdpServer). """
+        super(SimulcastUdpServer, self).__init__(
+            ip, client_in_port, client_out_port, server_name,
+            client_id_validator, reuse_port)
+        # { receiver full id: requested layer }
+        self.requested_layers: Dict[bytes, int] = {}
+        # { sender full id: the highest layer it has sent }
+        self.senders_max_layers: Dict[bytes, int] = {}
+        # { sender full id + receiver full id: the forwarded layer }
+        self.forwarded_layers: Dict[bytes, int] = {}
+
+    def get_recipient(self, full_client_id: bytes,
+                      client_address: (str, int)) -> Tuple[bytes, tuple]:
+        """
+        Returns the recipient's id and address
+        (the layer is chosen for each recipient).
+        """
+        return full_client_id, client_address
+
+    def broadcast(self, sender_id: bytes,
+                  recipients: Tuple[Tuple[bytes, Tuple[str, int]], ...],
+                  packet: bytes) -> int:
+        """
+        Sends a given packet to the recipients that receive its layer.
+        If it's a layer request, saves the requested layer.
+        :returns: the number of recipients it was sent to.
+        """
+        offset = NETWORK_BYTES_PER_NUM + len(sender_id)
+        if packet[offset: offset + len(UDP_LAYER_REQUEST_MSG)] == \
+                UDP_LAYER_REQUEST_MSG:
+            self.handle_layer_request(sender_id,
+                                      packet[offset +
+                                             len(UDP_LAYER_REQUEST_MSG):])
+            return 0
+        if len(packet) < offset + SimulcastUdpServer.LAYER_HEADER_STRUCT.size:
+            self.malformed_counter.inc()
+            print('malformed packet.')
+            return 0
+
+        layer, frame_index, packet_index = \
+            SimulcastUdpServer.LAYER_HEADER_STRUCT.unpack_from(packet, offset)
+        max_layer = self.senders_max_layers.get(sender_id, 0)
+        if layer > max_layer:
+            max_layer = layer
+            with self.clients_addresses_lock:
+                if self.is_connected(sender_id):
+                    self.senders_max_layers[sender_id] = layer
+
+        sent = 0
+        for receiver_id, client_in_address in recipients:
+            key = sender_id + receiver_id
+            current_layer = self.forwarded_layers.get(key)
+            target_layer = min(max_layer, self.requested_layers.get(
+                receiver_id, SimulcastUdpServer.DEFAULT_LAYER))
+            # switch only at the beginning of a frame of the target layer
+            if current_layer != target_layer and layer == target_layer and \
+                    packet_index == 0:
+                current_layer = target_layer
+                with self.clients_addresses_lock:
+                    if self.is_connected(sender_id, receiver_id):
+                        self.forwarded_layers[key] = target_layer
+
+            if layer == current_layer:
+                self.out_socket.sendto(packet, client_in_address)
+                sent += 1
+        return sent
+
+    def handle_layer_request(self, receiver_id: bytes, content: bytes):
+        """ Saves the layer that a receiver has requested. """
+        if len(content) != 1:
+            self.malformed_counter.inc()
+            print('malformed layer request.')
+            return
+        with self.clients_addresses_lock:
+            if self.is_connected(receiver_id):
+                self.requested_layers[receiver_id] = content[0]
+
+    def remove_client_state(self, full_client_id: bytes):
+        """
+        Removes a client's layers state.
+        Must be called while holding clients_addresses_lock.
+        """
+        super(SimulcastUdpServer, self).remove_client_state(full_client_id)
+        self.requested_layers.pop(full_client_id, None)
+        self.senders_max_layers.pop(full_client_id, None)
+        for key in [key for key in self.forwarded_layers
+                    if key.startswith(full_client_id) or
+                    key.endswith(full_client_id)]:
+            del self.forwarded_layers[key]
@@ -0,0 +1,181 @@
+"""
+    Hadar Shahar
+    UdpRelayWorker.
+"""
+import os
+import queue
+import socket
+import threading
+import multiprocessing
+from network.constants import NETWORK_BYTES_PER_NUM, UDP_SOCKET_BUFFER_SIZE
+from server.broadcast_udp_server import BroadcastUdpServer
+from server.feedback_udp_server import FeedbackUdpServer
+from server.ids_config import MEETING_ID_LEN
+from server.metrics_registry import REGISTRY
+
+
+class UdpRelayWorker(BroadcastUdpServer):
+    """
+    Definition of the class UdpRelayWorker.
+
+    A BroadcastUdpServer that runs in a worker process of a
+    MultiProcessUdpServer. All the workers bind the same ports,
+    so each worker receives some of the packets and it must know
+    all the clients. The new clients are validated in the main process,
+    which sends the membership updates to every worker.
+
+    If shard_meetings is True, each meeting is relayed by a single
+    worker (see get_owner), and the packets of the meetings of other
+    workers are forwarded to them on the loopback interface. So the
+    state that a server keeps about a meeting (like the layer requests,
+    the cached packets and the reports of FeedbackUdpServer) is in
+    one worker, even though the kernel distributes the packets between
+    the workers by the sender address.
+    """
+
+    # membership updates: (update type, args)
+    ADD_CLIENT = 1     # args = (meeting_id, client_id, client_address)
+    REMOVE_CLIENT = 2  # args = full_client_id
+    # args = the addresses of the workers' peer sockets (by their index)
+    SET_PEERS = 3
+    # args = the request id, the worker puts
+    # (request id, metrics descriptions, metrics samples)
+    # in the metrics queue
+    REPORT_METRICS = 4
+
+    # how often (in seconds) to check that the main process is alive
+    # if there aren't any updates
+    PARENT_CHECK_INTERVAL = 1
+
+    # the address of the socket that receives the forwarded packets
+    PEER_IP = '127.0.0.1'
+
+    def __init__(self, ip: str, client_in_port: int, client_out_port: int,
+                 server_name: str, worker_index: int, shard_meetings: bool,
+                 queues: tuple):
+        """
+        Constructor.
+        queues are the (new clients, updates, peers, metrics) queues
+        (see MultiProcessUdpServer).
+        """
+        super(UdpRelayWorker, self).__init__(
+            ip, client_in_port, client_out_port, server_name,
+            client_id_validator=None, reuse_port=True)
+        self.worker_index = worker_index
+        self.new_clients_queue, self.updates_queue, peers_queue, \
+            self.metrics_queue = queues
+
+        # the addresses of the workers' peer sockets (by their index),
+        # None until the main process sends them (the packets aren't
+        # forwarded until then)
+        self.peers = None
+        self.peer_socket = None
+        if shard_meetings:
+            self.peer_socket = socket.socket(socket.AF_INET,
+                                             socket.SOCK_DGRAM)
+            self.peer_socket.bind((UdpRelayWorker.PEER_IP, 0))
+            peers_queue.put((worker_index, self.peer_socket.getsockname()))
+
+    def run(self):
+        """
+        Applies the membership updates (and receives the forwarded
+        packets) in separate threads, and receives and broadcasts data
+        in this thread.
+        """
+        threading.Thread(target=self.apply_updates_loop, daemon=True).start()
+        if self.peer_socket is not None:
+            threading.Thread(target=self.receive_forwarded_loop,
+                             daemon=True).start()
+        super(UdpRelayWorker, self).run()
+
+    def handle_datagram(self, data: bytes, client_address: (str, int)):
+        """
+        Forwards a datagram of a known client to the worker that relays
+        its meeting, or handles it if it's this one.
+        """
+        peers = self.peers
+        if peers is not None:
+            n = NETWORK_BYTES_PER_NUM
+            id_len = BroadcastUdpServer.ID_LEN_STRUCT.unpack_from(data)[0]
+            owner = UdpRelayWorker.get_owner(
+                data[n: n + MEETING_ID_LEN], len(peers))
+            # the new clients are added by this worker
+            # (the forwarded packets don't have the client's address)
+            if owner != self.worker_index and \
+                    data[n: n + id_len] in self.recipients:
+                self.peer_socket.sendto(data, peers[owner])
+                return
+        super(UdpRelayWorker, self).handle_datagram(data, client_address)
+
+    def receive_forwarded_loop(self):
+        """
+        Receives the packets that other workers forward to this one
+        and handles them. The packets of each sender are received by
+        the same worker, so they're forwarded in order.
+        """
+        try:
+            while True:
+                data = self.peer_socket.recv(UDP_SOCKET_BUFFER_SIZE)
+                super(UdpRelayWorker, self).handle_datagram(data, None)
+        except socket.error as e:
+            print(f'{self.server_name} receive_forwarded_loop: {e}')
+
+    @staticmethod
+    def get_owner(meeting_id: bytes, num_workers: int) -> int:
+        """
+        Returns the index of the worker that relays a given meeting
+        (the same in every process, unlike hash()).
+        """
+        return int.from_bytes(meeting_id, 'big') % num_workers
+
+    def add_new_client(self, meeting_id: bytes, client_id: bytes,
+                       client_address: (str, int)):
+        """
+        Sends the new client to the main process, which validates it
+        and adds it to all the workers.
+        """
+        self.new_clients_queue.put((meeting_id, client_id, client_address))
+
+    def apply_updates_loop(self):
+        """
+        Applies the updates sent by the main process.
+        Exits the process if the main process isn't alive
+        (so the worker won't keep the ports bound).
+        """
+        while True:
+            try:
+                update_type, args = self.updates_queue.get(
+                    timeout=UdpRelayWorker.PARENT_CHECK_INTERVAL)
+            except queue.Empty:
+                if not multiprocessing.parent_process().is_alive():
+                    print(f'{self.server_name} the main process has exited.')
+                    os._exit(0)
+                continue
+
+            if update_type == UdpRelayWorker.ADD_CLIENT:
+                self.add_client(*args)
+            elif update_type == UdpRelayWorker.REMOVE_CLIENT:
+                self.remove_client(args)
+            elif update_type == UdpRelayWorker.SET_PEERS:
+                self.peers = args
+            elif update_type == UdpRelayWorker.REPORT_METRICS:
+                self.metrics_queue.put(
+                    (args, REGISTRY.get_families(), REGISTRY.collect()))
+
+
+class FeedbackUdpRelayWorker(UdpRelayWorker, FeedbackUdpServer):
+    """
+    Definition of the class FeedbackUdpRelayWorker.
+    A UdpRelayWorker of the video channels (see FeedbackUdpServer),
+    which must shard the meetings.
+    """
+    pass
+
+
+def run_worker(worker_class: type, *args):
+    """
+    Runs a UdpRelayWorker of a given class
+    (the target of a worker process).
+    """
+    worker = worker_class(*args)
+    worker.run()